@@ -0,0 +1,153 @@
+#! /usr/bin/python
+
+# All QUISK software is Copyright (C) 2006-2011 by James C. Ahlstrom.
+# This free software is licensed for use under the GNU General Public
+# License (GPL), see http://www.opensource.org.
+# Note that there is NO WARRANTY AT ALL.  USE AT YOUR OWN RISK!!
+
+"""Measure the speed of the Quisk receive DSP without hardware or a sound card.
+
+Usage:  python dsp_benchmark.py [options]
+
+Synthetic I/Q samples, or the samples from a stereo I/Q WAV file, are run through
+quisk_process_samples() for each sample rate and mode.  The results show the samples
+per second, the time in each DSP stage in nanoseconds per input sample, and the
+real time headroom.  A headroom of 90% means the DSP uses 10% of one CPU.
+"""
+
+from __future__ import print_function
+
+import sys, os
+os.chdir(os.path.normpath(os.path.dirname(os.path.abspath(__file__))))
+if sys.path[0] != "'.'":		# Make sure the current working directory is on path
+  sys.path.insert(0, '.')
+
+import struct, array
+from optparse import OptionParser
+import _quisk as QS
+from filters import DesignFilterCoef
+
+# These are the sample rates in the quisk_process_decimate() switch statement.
+SampleRates = (48000, 53333, 96000, 111111, 133333, 185185, 192000, 240000, 288000,
+  370370, 384000, 480000, 740741, 768000, 960000, 1152000, 1333333, 2304000)
+
+# The rxMode number, name, filter bandwidth and filter center.  See quisk.py OnBtnFilter().
+Modes = (
+  (0, 'CWL', 500, 600),
+  (1, 'CWU', 500, 600),
+  (2, 'LSB', 2700, 300 + 2700 // 2),
+  (3, 'USB', 2700, 300 + 2700 // 2),
+  (4, 'AM', 6000, 0),
+  (5, 'FM', 10000, 0),
+  (6, 'EXT', 2700, 300 + 2700 // 2),
+  (7, 'DGT-U', 2700, 300 + 2700 // 2),
+  (8, 'DGT-L', 2700, 300 + 2700 // 2),
+  (9, 'DGT-IQ', 6000, 0),
+  )
+
+Stages = ('tune', 'decimate', 'demodulate', 'interpolate', 'agc')
+
+def ReadWave(path):
+  """Return the sample rate and the samples of a stereo I/Q WAV file as float32 I/Q pairs with full scale 1.0."""
+  fp = open(path, 'rb')
+  try:
+    riff, size, wave = struct.unpack('<4sI4s', fp.read(12))
+    if riff != b'RIFF' or wave != b'WAVE':
+      raise ValueError("%s is not a WAV file" % path)
+    fmt = None
+    while 1:
+      head = fp.read(8)
+      if len(head) < 8:
+        raise ValueError("%s has no data" % path)
+      name, size = struct.unpack('<4sI', head)
+      if name == b'fmt ':
+        fmt = struct.unpack('<HHIIHH', fp.read(16))
+        fp.read(size - 16 + (size & 1))
+      elif name == b'data':
+        data = fp.read(size)
+        break
+      else:
+        fp.read(size + (size & 1))
+  finally:
+    fp.close()
+  if fmt is None:
+    raise ValueError("%s has no format" % path)
+  tag, channels, rate, unused, unused, bits = fmt
+  if channels != 2:
+    raise ValueError("%s must have two channels for I and Q" % path)
+  if tag == 3 and bits == 32:
+    samples = array.array('f')
+    scale = 1.0
+  elif tag == 1 and bits == 16:
+    samples = array.array('h')
+    scale = 1.0 / 2 ** 15
+  elif tag == 1 and bits == 32:
+    samples = array.array('i')
+    scale = 1.0 / 2 ** 31
+  else:
+    raise ValueError("%s must have 16 or 32 bit integer, or 32 bit float samples" % path)
+  samples.fromstring(data[0:len(data) // samples.itemsize * samples.itemsize])
+  if sys.byteorder != 'little':
+    samples.byteswap()
+  if scale != 1.0:
+    samples = array.array('f', [x * scale for x in samples])
+  return rate, samples.tostring()
+
+def Benchmark(rate, mode, seconds, block, iq_data):
+  number, name, bw, center = mode
+  QS.set_benchmark(rate, number)
+  try:
+    frate = QS.get_filter_rate()
+    filtI, filtQ = DesignFilterCoef(frate, None, bw, center)
+    QS.set_filters(filtI, filtQ, bw)
+    if iq_data is None:
+      return QS.benchmark(seconds, block)
+    return QS.benchmark(seconds, block, iq_data)
+  finally:
+    QS.set_benchmark(0, 0)
+
+def main():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option('-r', '--rate', dest='rates', type='int', action='append',
+    help="Sample rate to test; may be repeated.  The default is all sample rates.")
+  parser.add_option('-m', '--mode', dest='modes', action='append',
+    help="Mode name or number to test; may be repeated.  The default is all modes.")
+  parser.add_option('-t', '--time', dest='seconds', type='float', default=2.0,
+    help="Seconds of samples to process for each test.")
+  parser.add_option('-b', '--block', dest='block', type='int', default=0,
+    help="Samples per block.  The default is 5 milliseconds of samples.")
+  parser.add_option('-f', '--file', dest='path',
+    help="Use samples from this stereo I/Q WAV file instead of synthetic samples.")
+  (options, args) = parser.parse_args()
+  iq_data = None
+  rates = SampleRates
+  if options.path:
+    rate, iq_data = ReadWave(options.path)
+    rates = (rate,)
+  if options.rates:
+    rates = options.rates
+  modes = Modes
+  if options.modes:
+    modes = []
+    for m in options.modes:
+      for mode in Modes:
+        if m.upper() in (str(mode[0]), mode[1]):
+          modes.append(mode)
+          break
+      else:
+        parser.error("Unknown mode %s" % m)
+  print("%8s %-7s %10s" % ("Rate", "Mode", "Samples/s"), end='')
+  for stage in Stages:
+    print(" %11s" % stage, end='')
+  print(" %9s %9s" % ("Real time", "Headroom"))
+  for rate in rates:
+    for mode in modes:
+      res = Benchmark(rate, mode, options.seconds, options.block, iq_data)
+      print("%8d %-7s %10.0f" % (rate, mode[1], res['samples_per_sec']), end='')
+      for stage in Stages:
+        print(" %11.2f" % res[stage], end='')
+      print(" %8.1fx %8.1f%%" % (res['realtime'], 100.0 * (1.0 - 1.0 / res['realtime'])))
+  print("Stage times are in nanoseconds per input sample.")
+
+if __name__ == '__main__':
+  main()
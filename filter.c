@@ -6,15 +6,84 @@
 #include "filter.h"
 #include "filters.h"
 
+// The inner loops are dot products over contiguous arrays with no test for wraparound.
+// Four partial sums let the compiler use SIMD without -ffast-math.
+static double dot_product(const double * a, const double * b, int n)
+{
+	int k;
+	double s0 = 0, s1 = 0, s2 = 0, s3 = 0;
+
+	for (k = 0; k + 3 < n; k += 4) {
+		s0 += a[k] * b[k];
+		s1 += a[k + 1] * b[k + 1];
+		s2 += a[k + 2] * b[k + 2];
+		s3 += a[k + 3] * b[k + 3];
+	}
+	for ( ; k < n; k++)
+		s0 += a[k] * b[k];
+	return (s0 + s1) + (s2 + s3);
+}
+
+static complex double dot_product2(const double * coef, const double * a, const double * b, int n)
+{	// Return the dot product of coef with a, plus I times the dot product of coef with b
+	int k;
+	double a0 = 0, a1 = 0, b0 = 0, b1 = 0;
+
+	for (k = 0; k + 1 < n; k += 2) {
+		a0 += coef[k] * a[k];
+		b0 += coef[k] * b[k];
+		a1 += coef[k + 1] * a[k + 1];
+		b1 += coef[k + 1] * b[k + 1];
+	}
+	if (k < n) {
+		a0 += coef[k] * a[k];
+		b0 += coef[k] * b[k];
+	}
+	return (a0 + a1) + I * (b0 + b1);
+}
+
+static void cPush(struct quisk_cFilter * filter, complex double sample)
+{	// Add a sample to the delay lines
+	if (--filter->index < 0)
+		filter->index = filter->nTaps - 1;
+	filter->sampI[filter->index] = filter->sampI[filter->index + filter->nTaps] = creal(sample);
+	filter->sampQ[filter->index] = filter->sampQ[filter->index + filter->nTaps] = cimag(sample);
+}
+
+static void dPush(struct quisk_dFilter * filter, double sample)
+{	// Add a sample to the delay line
+	if (--filter->index < 0)
+		filter->index = filter->nTaps - 1;
+	filter->dSamples[filter->index] = filter->dSamples[filter->index + filter->nTaps] = sample;
+}
+
+static double * MakePolyCoefs(double * dCoefs, int nTaps, int interp)
+{	// Arrange the coefficients by phase: phase j is dCoefs[j], dCoefs[j + interp], ...
+	int j, k, n;
+	double * poly;
+
+	n = nTaps / interp;
+	poly = (double *)malloc(interp * n * sizeof(double));
+	for (j = 0; j < interp; j++)
+		for (k = 0; k < n; k++)
+			poly[j * n + k] = dCoefs[j + k * interp];
+	return poly;
+}
+
 void quisk_filt_cInit(struct quisk_cFilter * filter, double * coefs, int taps)
 {	// Prepare a new filter using coefs and taps.  Samples are complex.
 	filter->dCoefs = coefs;
 	filter->cpxCoefs = NULL;
-	filter->cSamples = (complex double *)malloc(taps * sizeof(complex double));
-	memset(filter->cSamples, 0, taps * sizeof(complex double));
-	filter->ptcSamp = filter->cSamples;
+	filter->cpxI = filter->cpxQ = NULL;
+	filter->sampI = (double *)malloc(2 * taps * sizeof(double));
+	filter->sampQ = (double *)malloc(2 * taps * sizeof(double));
+	memset(filter->sampI, 0, 2 * taps * sizeof(double));
+	memset(filter->sampQ, 0, 2 * taps * sizeof(double));
+	filter->index = 0;
 	filter->nTaps = taps;
 	filter->counter = 0;
+	filter->polyCoefs = NULL;
+	filter->polyInterp = 0;
 	filter->cBuf = NULL;
 	filter->nBuf = 0;
 }
@@ -23,11 +92,14 @@ void quisk_filt_dInit(struct quisk_dFilter * filter, double * coefs, int taps)
 {	// Prepare a new filter using coefs and taps.  Samples are double.
 	filter->dCoefs = coefs;
 	filter->cpxCoefs = NULL;
-	filter->dSamples = (double *)malloc(taps * sizeof(double));
-	memset(filter->dSamples, 0, taps * sizeof(double));
-	filter->ptdSamp = filter->dSamples;
+	filter->cpxI = filter->cpxQ = NULL;
+	filter->dSamples = (double *)malloc(2 * taps * sizeof(double));
+	memset(filter->dSamples, 0, 2 * taps * sizeof(double));
+	filter->index = 0;
 	filter->nTaps = taps;
 	filter->counter = 0;
+	filter->polyCoefs = NULL;
+	filter->polyInterp = 0;
 	filter->dBuf = NULL;
 	filter->nBuf = 0;
 }
@@ -40,8 +112,11 @@ void quisk_filt_tune(struct quisk_dFilter * filter, double freq, int ssb_upper)
 	complex double coef, tune;
 	double D;
 
-	if ( ! filter->cpxCoefs)
+	if ( ! filter->cpxCoefs) {
 		filter->cpxCoefs = (complex double *)malloc(filter->nTaps * sizeof(complex double));
+		filter->cpxI = (double *)malloc(filter->nTaps * sizeof(double));
+		filter->cpxQ = (double *)malloc(filter->nTaps * sizeof(double));
+	}
 	tune = I * 2.0 * M_PI * freq;
 	D = (filter->nTaps - 1.0) / 2.0;
 	for (i = 0; i < filter->nTaps; i++) {
@@ -50,63 +125,42 @@ void quisk_filt_tune(struct quisk_dFilter * filter, double freq, int ssb_upper)
 			filter->cpxCoefs[i] = coef;
 		else
 			filter->cpxCoefs[i] = cimag(coef) + I * creal(coef);
+		filter->cpxI[i] = creal(filter->cpxCoefs[i]);
+		filter->cpxQ[i] = cimag(filter->cpxCoefs[i]);
 	}
 }
 
 complex double quisk_dC_out(double sample, struct quisk_dFilter * filter)
 {
-	complex double csample;
-	complex double * ptCoef;
-	double  * ptSample;
-	int k;
+	double * ptSample;
 
 	// FIR bandpass filter; separate double sample into I and Q.
-	// Put samples into buffer left to right.  Use samples right to left.
-	ptSample = filter->ptdSamp;
-	*ptSample = sample;
-	ptCoef = filter->cpxCoefs;
-	csample = 0;
-	for (k = 0; k < filter->nTaps; k++, ptCoef++) {
-		csample += *ptSample  *  *ptCoef;
-		if (--ptSample < filter->dSamples)
-			ptSample = filter->dSamples + filter->nTaps - 1;
-	}
-	if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
-		filter->ptdSamp = filter->dSamples;
-	return csample;
+	dPush(filter, sample);
+	ptSample = filter->dSamples + filter->index;
+	return dot_product(filter->cpxI, ptSample, filter->nTaps) +
+		I * dot_product(filter->cpxQ, ptSample, filter->nTaps);
 }
 
 #if 0
 complex double quisk_cC_out(complex double sample, struct quisk_cFilter * filter)
 {
-	complex double csample;
-	complex double * ptCoef;
-	complex double  * ptSample;
-	int k;
+	double * ptI, * ptQ;
+	int n;
 
 	// FIR bandpass filter; filter complex samples by complex coeffs.
-	// Put samples into buffer left to right.  Use samples right to left.
-	ptSample = filter->ptcSamp;
-	*ptSample = sample;
-	ptCoef = filter->cpxCoefs;
-	csample = 0;
-	for (k = 0; k < filter->nTaps; k++, ptCoef++) {
-		csample += *ptSample  *  *ptCoef;
-		if (--ptSample < filter->cSamples)
-			ptSample = filter->cSamples + filter->nTaps - 1;
-	}
-	if (++filter->ptcSamp >= filter->cSamples + filter->nTaps)
-		filter->ptcSamp = filter->cSamples;
-	return csample;
+	cPush(filter, sample);
+	ptI = filter->sampI + filter->index;
+	ptQ = filter->sampQ + filter->index;
+	n = filter->nTaps;
+	return dot_product(filter->cpxI, ptI, n) - dot_product(filter->cpxQ, ptQ, n) +
+		I * (dot_product(filter->cpxI, ptQ, n) + dot_product(filter->cpxQ, ptI, n));
 }
 #endif
 
 int quisk_cInterpolate(complex double * cSamples, int count, struct quisk_cFilter * filter, int interp)
 {	// This uses the double coefficients of filter (not the complex).  Samples are complex.
-	int i, j, k, nOut;
-	double * ptCoef;
-	complex double * ptSample;
-	complex double csample;
+	int i, j, n, nOut;
+	double * ptCoef, * ptI, * ptQ;
 
 	if (count > filter->nBuf) {	// increase size of sample buffer
 		filter->nBuf = count * 2;
@@ -114,34 +168,31 @@ int quisk_cInterpolate(complex double * cSamples, int count, struct quisk_cFilte
 			free(filter->cBuf);
 		filter->cBuf = (complex double *)malloc(filter->nBuf * sizeof(complex double));
 	}
+	if (filter->polyInterp != interp) {
+		if (filter->polyCoefs)
+			free(filter->polyCoefs);
+		filter->polyCoefs = MakePolyCoefs(filter->dCoefs, filter->nTaps, interp);
+		filter->polyInterp = interp;
+	}
 	memcpy(filter->cBuf, cSamples, count * sizeof(complex double));
+	n = filter->nTaps / interp;
 	nOut = 0;
 	for (i = 0; i < count; i++) {
-		// Put samples into buffer left to right.  Use samples right to left.
-		*filter->ptcSamp = filter->cBuf[i];
+		cPush(filter, filter->cBuf[i]);
+		ptI = filter->sampI + filter->index;
+		ptQ = filter->sampQ + filter->index;
 		for (j = 0; j < interp; j++) {
-			ptSample = filter->ptcSamp;
-			ptCoef = filter->dCoefs + j;
-			csample = 0;
-			for (k = 0; k < filter->nTaps / interp; k++, ptCoef += interp) {
-				csample += *ptSample  *  *ptCoef;
-				if (--ptSample < filter->cSamples)
-					ptSample = filter->cSamples + filter->nTaps - 1;
-			}
-			cSamples[nOut++] = csample * interp;
+			ptCoef = filter->polyCoefs + j * n;
+			cSamples[nOut++] = dot_product2(ptCoef, ptI, ptQ, n) * interp;
 		}
-		if (++filter->ptcSamp >= filter->cSamples + filter->nTaps)
-			filter->ptcSamp = filter->cSamples;
 	}
 	return nOut;
 }
 
 int quisk_dInterpolate(double * dSamples, int count, struct quisk_dFilter * filter, int interp)
 {	// This uses the double coefficients of filter (not the complex).  Samples are double.
-	int i, j, k, nOut;
-	double * ptCoef;
+	int i, j, n, nOut;
 	double * ptSample;
-	double dsample;
 
 	if (count > filter->nBuf) {	// increase size of sample buffer
 		filter->nBuf = count * 2;
@@ -149,128 +200,70 @@ int quisk_dInterpolate(double * dSamples, int count, struct quisk_dFilter * filt
 			free(filter->dBuf);
 		filter->dBuf = (double *)malloc(filter->nBuf * sizeof(double));
 	}
+	if (filter->polyInterp != interp) {
+		if (filter->polyCoefs)
+			free(filter->polyCoefs);
+		filter->polyCoefs = MakePolyCoefs(filter->dCoefs, filter->nTaps, interp);
+		filter->polyInterp = interp;
+	}
 	memcpy(filter->dBuf, dSamples, count * sizeof(double));
+	n = filter->nTaps / interp;
 	nOut = 0;
 	for (i = 0; i < count; i++) {
-		// Put samples into buffer left to right.  Use samples right to left.
-		*filter->ptdSamp = filter->dBuf[i];
-		for (j = 0; j < interp; j++) {
-			ptSample = filter->ptdSamp;
-			ptCoef = filter->dCoefs + j;
-			dsample = 0;
-			for (k = 0; k < filter->nTaps / interp; k++, ptCoef += interp) {
-				dsample += *ptSample  *  *ptCoef;
-				if (--ptSample < filter->dSamples)
-					ptSample = filter->dSamples + filter->nTaps - 1;
-			}
-			dSamples[nOut++] = dsample * interp;
-		}
-		if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
-			filter->ptdSamp = filter->dSamples;
+		dPush(filter, filter->dBuf[i]);
+		ptSample = filter->dSamples + filter->index;
+		for (j = 0; j < interp; j++)
+			dSamples[nOut++] = dot_product(filter->polyCoefs + j * n, ptSample, n) * interp;
 	}
 	return nOut;
 }
 
 int quisk_cDecimate(complex double * cSamples, int count, struct quisk_cFilter * filter, int decim)
 {	// This uses the double coefficients of filter (not the complex).
-	int i, k, nOut;
-	complex double * ptSample;
-	double * ptCoef;
-	complex double csample;
+	int i, nOut;
 
 	nOut = 0;
 	for (i = 0; i < count; i++) {
-		*filter->ptcSamp = cSamples[i];
+		cPush(filter, cSamples[i]);
 		if (++filter->counter >= decim) {
 			filter->counter = 0;		// output a sample
-			csample = 0;
-			ptSample = filter->ptcSamp;
-			ptCoef = filter->dCoefs;
-			for (k = 0; k < filter->nTaps; k++, ptCoef++) {
-				csample += *ptSample  *  *ptCoef;
-				if (--ptSample < filter->cSamples)
-					ptSample = filter->cSamples + filter->nTaps - 1;
-			}
-			cSamples[nOut++] = csample;
+			cSamples[nOut++] = dot_product2(filter->dCoefs, filter->sampI + filter->index,
+				filter->sampQ + filter->index, filter->nTaps);
 		}
-		if (++filter->ptcSamp >= filter->cSamples + filter->nTaps)
-			filter->ptcSamp = filter->cSamples;
 	}
 	return nOut;
 }
 
 int quisk_dDecimate(double * dSamples, int count, struct quisk_dFilter * filter, int decim)
 {	// This uses the double coefficients of filter (not the complex).
-	int i, k, nOut;
-	double * ptSample;
-	double * ptCoef;
-	double dsample;
+	int i, nOut;
 
 	nOut = 0;
 	for (i = 0; i < count; i++) {
-		*filter->ptdSamp = dSamples[i];
+		dPush(filter, dSamples[i]);
 		if (++filter->counter >= decim) {
 			filter->counter = 0;		// output a sample
-			dsample = 0;
-			ptSample = filter->ptdSamp;
-			ptCoef = filter->dCoefs;
-			for (k = 0; k < filter->nTaps; k++, ptCoef++) {
-				dsample += *ptSample  *  *ptCoef;
-				if (--ptSample < filter->dSamples)
-					ptSample = filter->dSamples + filter->nTaps - 1;
-			}
-			dSamples[nOut++] = dsample;
+			dSamples[nOut++] = dot_product(filter->dCoefs, filter->dSamples + filter->index, filter->nTaps);
 		}
-		if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
-			filter->ptdSamp = filter->dSamples;
 	}
 	return nOut;
 }
 
 double quisk_dD_out(double samp, struct quisk_dFilter * filter)
 {	// Filter double samples.
-	int k;
-	double * ptSample;
-	double * ptCoef;
-	double dsample;
-
-	*filter->ptdSamp = samp;
-	dsample = 0;
-	ptSample = filter->ptdSamp;
-	ptCoef = filter->dCoefs;
-	for (k = 0; k < filter->nTaps; k++, ptCoef++) {
-		dsample += *ptSample  *  *ptCoef;
-		if (--ptSample < filter->dSamples)
-			ptSample = filter->dSamples + filter->nTaps - 1;
-	}
-	if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
-		filter->ptdSamp = filter->dSamples;
-    return dsample;
+	dPush(filter, samp);
+	return dot_product(filter->dCoefs, filter->dSamples + filter->index, filter->nTaps);
 }
 
 int quisk_dFilter(double * dSamples, int count, struct quisk_dFilter * filter)
 {	// Filter double samples.
-	int i, k, nOut;
-	double * ptSample;
-	double * ptCoef;
-	double dsample;
+	int i;
 
-	nOut = 0;
 	for (i = 0; i < count; i++) {
-		*filter->ptdSamp = dSamples[i];
-		dsample = 0;
-		ptSample = filter->ptdSamp;
-		ptCoef = filter->dCoefs;
-		for (k = 0; k < filter->nTaps; k++, ptCoef++) {
-			dsample += *ptSample  *  *ptCoef;
-			if (--ptSample < filter->dSamples)
-				ptSample = filter->dSamples + filter->nTaps - 1;
-		}
-		dSamples[nOut++] = dsample;
-		if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
-			filter->ptdSamp = filter->dSamples;
+		dPush(filter, dSamples[i]);
+		dSamples[i] = dot_product(filter->dCoefs, filter->dSamples + filter->index, filter->nTaps);
 	}
-	return nOut;
+	return count;
 }
 
 int quisk_cFilter(complex double * cSamples, int count, struct quisk_cFilter * filter)
@@ -387,3 +380,67 @@ int quisk_cInterp2HB45(complex double * cSamples, int count, struct quisk_cHB45F
 	return nOut;
 }
 
+
+// The numerically controlled oscillator uses a 32-bit phase accumulator.  The top 22 bits of the
+// rounded phase select a coarse and a fine table entry, and their product is the unit phasor.
+// The phase error is less than 2 pi / 2**23, and there is no amplitude drift.
+#define NCO_BITS	11
+#define NCO_SIZE	(1 << NCO_BITS)
+static double nco_coarseI[NCO_SIZE], nco_coarseQ[NCO_SIZE];	// exp(j 2 pi k / NCO_SIZE)
+static double nco_fineI[NCO_SIZE], nco_fineQ[NCO_SIZE];		// exp(j 2 pi k / NCO_SIZE**2)
+static int nco_ready;
+
+void quisk_nco_set(struct quisk_nco * nco, double freq, double rate)
+{	// Set the frequency of the oscillator.  The phase is not changed.
+	int i;
+	double d;
+
+	if ( ! nco_ready) {
+		for (i = 0; i < NCO_SIZE; i++) {
+			d = 2.0 * M_PI * i / NCO_SIZE;
+			nco_coarseI[i] = cos(d);
+			nco_coarseQ[i] = sin(d);
+			d /= NCO_SIZE;
+			nco_fineI[i] = cos(d);
+			nco_fineQ[i] = sin(d);
+		}
+		nco_ready = 1;
+	}
+	d = freq / rate;
+	d -= floor(d);		// fraction of a cycle from 0.0 to 1.0
+	nco->delta = (unsigned int)(d * 4294967296.0 + 0.5);
+}
+
+complex double quisk_nco_next(struct quisk_nco * nco)
+{	// Return the unit phasor for the current phase, and advance the phase by one sample
+	unsigned int ph, c, f;
+
+	ph = nco->phase + (1 << (31 - 2 * NCO_BITS));	// round the unused bits
+	c = ph >> (32 - NCO_BITS);
+	f = (ph >> (32 - 2 * NCO_BITS)) & (NCO_SIZE - 1);
+	nco->phase += nco->delta;
+	return (nco_coarseI[c] * nco_fineI[f] - nco_coarseQ[c] * nco_fineQ[f]) +
+		I * (nco_coarseI[c] * nco_fineQ[f] + nco_coarseQ[c] * nco_fineI[f]);
+}
+
+void quisk_nco_mix(struct quisk_nco * nco, complex double * cSamples, int count, double scale)
+{	// Multiply a block of samples by scale times the oscillator
+	int i;
+	unsigned int ph, c, f;
+	double pI, pQ, sI, sQ;
+	double * pt = (double *)cSamples;
+
+	ph = nco->phase + (1 << (31 - 2 * NCO_BITS));
+	for (i = 0; i < count; i++) {
+		c = ph >> (32 - NCO_BITS);
+		f = (ph >> (32 - 2 * NCO_BITS)) & (NCO_SIZE - 1);
+		ph += nco->delta;
+		pI = (nco_coarseI[c] * nco_fineI[f] - nco_coarseQ[c] * nco_fineQ[f]) * scale;
+		pQ = (nco_coarseI[c] * nco_fineQ[f] + nco_coarseQ[c] * nco_fineI[f]) * scale;
+		sI = pt[2 * i];
+		sQ = pt[2 * i + 1];
+		pt[2 * i] = sI * pI - sQ * pQ;
+		pt[2 * i + 1] = sI * pQ + sQ * pI;
+	}
+	nco->phase += (unsigned int)count * nco->delta;
+}
@@ -1,22 +1,36 @@
+// The FIR filters keep the real and imaginary parts of old samples in separate delay lines of
+// size 2 * nTaps.  Each sample is written at index and at index + nTaps, so the newest nTaps
+// samples are always contiguous and the filter is a plain dot product.
+// The members up to nTaps are the same for quisk_cFilter and quisk_dFilter.
+
 struct quisk_cFilter {
 	double  * dCoefs;	// filter coefficients
 	complex double * cpxCoefs;	// make the complex coefficients from dCoefs
+	double * cpxI;		// real part of cpxCoefs
+	double * cpxQ;		// imaginary part of cpxCoefs
 	int nBuf;		// dimension of cBuf
-	int nTaps;		// dimension of dSamples, cSamples, dCoefs and cpxCoefs
+	int nTaps;		// dimension of dCoefs and cpxCoefs
 	int counter;		// used to count samples for decimation
-	complex double * cSamples;	// storage for old samples
-	complex double * ptcSamp;	// next available position in cSamples
+	int index;		// position of the newest sample in sampI and sampQ
+	double * sampI;		// delay line for the real part of the samples
+	double * sampQ;		// delay line for the imaginary part of the samples
+	double * polyCoefs;	// dCoefs arranged by phase for interpolation
+	int polyInterp;		// interpolation of polyCoefs
 	complex double * cBuf;		// auxillary buffer for interpolation
 } ;
 
 struct quisk_dFilter {
 	double  * dCoefs;	// filter coefficients
 	complex double * cpxCoefs;	// make the complex coefficients from dCoefs
+	double * cpxI;		// real part of cpxCoefs
+	double * cpxQ;		// imaginary part of cpxCoefs
 	int nBuf;		// dimension of dBuf
-	int nTaps;		// dimension of dSamples, cSamples, dCoefs and cpxCoefs
+	int nTaps;		// dimension of dCoefs and cpxCoefs
 	int counter;		// used to count samples for decimation
-	double  * dSamples;	// storage for old samples
-	double  * ptdSamp;	// next available position in dSamples
+	int index;		// position of the newest sample in dSamples
+	double  * dSamples;	// delay line for the samples
+	double * polyCoefs;	// dCoefs arranged by phase for interpolation
+	int polyInterp;		// interpolation of polyCoefs
 	double  * dBuf;		// auxillary buffer for interpolation
 } ;
 
@@ -36,6 +50,11 @@ struct quisk_dHB45Filter {   // Real half band decimate by 2 filter with 45 coef
 	double center[11];
 } ;
 
+struct quisk_nco {	// Numerically controlled oscillator
+	unsigned int phase;	// phase accumulator; 2**32 is one cycle
+	unsigned int delta;	// phase increment per sample
+} ;
+
 void quisk_filt_cInit(struct quisk_cFilter *, double *, int);
 void quisk_filt_dInit(struct quisk_dFilter *, double *, int);
 void quisk_filt_tune(struct quisk_dFilter *, double, int);
@@ -50,6 +69,9 @@ int quisk_dInterp2HB45(double *, int, struct quisk_dHB45Filter *);
 int quisk_cInterp2HB45(complex double *, int, struct quisk_cHB45Filter *);
 int quisk_dFilter(double *, int, struct quisk_dFilter *);
 int quisk_cFilter(complex double *, int, struct quisk_cFilter *);
+void quisk_nco_set(struct quisk_nco *, double, double);
+complex double quisk_nco_next(struct quisk_nco *);
+void quisk_nco_mix(struct quisk_nco *, complex double *, int, double);
 
 extern double quiskMicFilt48Coefs[325];
 extern double quiskMic5Filt48Coefs[424];
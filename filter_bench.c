@@ -0,0 +1,336 @@
+// Micro-benchmark for the FIR filters in filter.c.
+// This compares the filters with the older circular buffer filters, which are copied here
+// as a reference.  It checks that the outputs agree and prints the time per sample.
+// Build and run with "make filter_bench" and then "./filter_bench".
+
+#include <Python.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#include <math.h>
+#include <complex.h>
+#include "quisk.h"
+#include "filter.h"
+
+#define BENCH_BLOCK		1024		// samples in each block
+#define BENCH_BLOCKS	2000		// number of blocks to time
+
+struct ref_cFilter {		// The old filter structure
+	double  * dCoefs;
+	int nTaps;
+	int counter;
+	complex double * cSamples;
+	complex double * ptcSamp;
+} ;
+
+struct ref_dFilter {
+	double  * dCoefs;
+	complex double * cpxCoefs;
+	int nTaps;
+	int counter;
+	double  * dSamples;
+	double  * ptdSamp;
+} ;
+
+static void ref_cInit(struct ref_cFilter * filter, double * coefs, int taps)
+{
+	filter->dCoefs = coefs;
+	filter->cSamples = (complex double *)calloc(taps, sizeof(complex double));
+	filter->ptcSamp = filter->cSamples;
+	filter->nTaps = taps;
+	filter->counter = 0;
+}
+
+static void ref_dInit(struct ref_dFilter * filter, double * coefs, int taps)
+{
+	filter->dCoefs = coefs;
+	filter->cpxCoefs = NULL;
+	filter->dSamples = (double *)calloc(taps, sizeof(double));
+	filter->ptdSamp = filter->dSamples;
+	filter->nTaps = taps;
+	filter->counter = 0;
+}
+
+static int ref_cDecimate(complex double * cSamples, int count, struct ref_cFilter * filter, int decim)
+{
+	int i, k, nOut;
+	complex double * ptSample;
+	double * ptCoef;
+	complex double csample;
+
+	nOut = 0;
+	for (i = 0; i < count; i++) {
+		*filter->ptcSamp = cSamples[i];
+		if (++filter->counter >= decim) {
+			filter->counter = 0;
+			csample = 0;
+			ptSample = filter->ptcSamp;
+			ptCoef = filter->dCoefs;
+			for (k = 0; k < filter->nTaps; k++, ptCoef++) {
+				csample += *ptSample  *  *ptCoef;
+				if (--ptSample < filter->cSamples)
+					ptSample = filter->cSamples + filter->nTaps - 1;
+			}
+			cSamples[nOut++] = csample;
+		}
+		if (++filter->ptcSamp >= filter->cSamples + filter->nTaps)
+			filter->ptcSamp = filter->cSamples;
+	}
+	return nOut;
+}
+
+static int ref_cInterpolate(complex double * cSamples, int count, struct ref_cFilter * filter, int interp)
+{
+	int i, j, k, nOut;
+	double * ptCoef;
+	complex double * ptSample;
+	complex double csample;
+	static complex double cBuf[BENCH_BLOCK];
+
+	memcpy(cBuf, cSamples, count * sizeof(complex double));
+	nOut = 0;
+	for (i = 0; i < count; i++) {
+		*filter->ptcSamp = cBuf[i];
+		for (j = 0; j < interp; j++) {
+			ptSample = filter->ptcSamp;
+			ptCoef = filter->dCoefs + j;
+			csample = 0;
+			for (k = 0; k < filter->nTaps / interp; k++, ptCoef += interp) {
+				csample += *ptSample  *  *ptCoef;
+				if (--ptSample < filter->cSamples)
+					ptSample = filter->cSamples + filter->nTaps - 1;
+			}
+			cSamples[nOut++] = csample * interp;
+		}
+		if (++filter->ptcSamp >= filter->cSamples + filter->nTaps)
+			filter->ptcSamp = filter->cSamples;
+	}
+	return nOut;
+}
+
+static int ref_dFilter(double * dSamples, int count, struct ref_dFilter * filter)
+{
+	int i, k;
+	double * ptSample;
+	double * ptCoef;
+	double dsample;
+
+	for (i = 0; i < count; i++) {
+		*filter->ptdSamp = dSamples[i];
+		dsample = 0;
+		ptSample = filter->ptdSamp;
+		ptCoef = filter->dCoefs;
+		for (k = 0; k < filter->nTaps; k++, ptCoef++) {
+			dsample += *ptSample  *  *ptCoef;
+			if (--ptSample < filter->dSamples)
+				ptSample = filter->dSamples + filter->nTaps - 1;
+		}
+		dSamples[i] = dsample;
+		if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
+			filter->ptdSamp = filter->dSamples;
+	}
+	return count;
+}
+
+static complex double ref_dC_out(double sample, struct ref_dFilter * filter)
+{
+	complex double csample;
+	complex double * ptCoef;
+	double  * ptSample;
+	int k;
+
+	ptSample = filter->ptdSamp;
+	*ptSample = sample;
+	ptCoef = filter->cpxCoefs;
+	csample = 0;
+	for (k = 0; k < filter->nTaps; k++, ptCoef++) {
+		csample += *ptSample  *  *ptCoef;
+		if (--ptSample < filter->dSamples)
+			ptSample = filter->dSamples + filter->nTaps - 1;
+	}
+	if (++filter->ptdSamp >= filter->dSamples + filter->nTaps)
+		filter->ptdSamp = filter->dSamples;
+	return csample;
+}
+
+static complex double cInput[BENCH_BLOCK];
+static double dInput[BENCH_BLOCK];
+
+static void MakeInput(void)
+{
+	int i;
+
+	for (i = 0; i < BENCH_BLOCK; i++) {
+		cInput[i] = (rand() - RAND_MAX / 2) + I * (rand() - RAND_MAX / 2);
+		dInput[i] = rand() - RAND_MAX / 2;
+	}
+}
+
+static double Seconds(void)
+{
+	return (double)clock() / CLOCKS_PER_SEC;
+}
+
+static void Report(const char * name, int taps, double t_old, double t_new, double error, int samples)
+{
+	printf("%-16s %5d taps  old %8.2f ns  new %8.2f ns  speedup %5.2f  max error %.2e\n", name, taps,
+		t_old * 1e9 / samples, t_new * 1e9 / samples, t_old / t_new, error);
+}
+
+static void BenchDecimate(const char * name, double * coefs, int taps, int decim)
+{
+	int i, j, n1, n2;
+	double t0, t_old, t_new, error;
+	static complex double b1[BENCH_BLOCK], b2[BENCH_BLOCK];
+	struct ref_cFilter old;
+	struct quisk_cFilter new;
+
+	ref_cInit(&old, coefs, taps);
+	quisk_filt_cInit(&new, coefs, taps);
+	error = 0;
+	for (j = 0; j < 10; j++) {		// check the output
+		memcpy(b1, cInput, sizeof(b1));
+		memcpy(b2, cInput, sizeof(b2));
+		n1 = ref_cDecimate(b1, BENCH_BLOCK, &old, decim);
+		n2 = quisk_cDecimate(b2, BENCH_BLOCK, &new, decim);
+		if (n1 != n2)
+			printf("%s: output count %d != %d\n", name, n1, n2);
+		for (i = 0; i < n1; i++)
+			if (cabs(b1[i] - b2[i]) / RAND_MAX > error)
+				error = cabs(b1[i] - b2[i]) / RAND_MAX;
+	}
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++) {
+		memcpy(b1, cInput, sizeof(b1));
+		ref_cDecimate(b1, BENCH_BLOCK, &old, decim);
+	}
+	t_old = Seconds() - t0;
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++) {
+		memcpy(b2, cInput, sizeof(b2));
+		quisk_cDecimate(b2, BENCH_BLOCK, &new, decim);
+	}
+	t_new = Seconds() - t0;
+	Report(name, taps, t_old, t_new, error, BENCH_BLOCK * BENCH_BLOCKS);
+}
+
+static void BenchInterpolate(const char * name, double * coefs, int taps, int interp)
+{
+	int i, j, n1, n2;
+	double t0, t_old, t_new, error;
+	static complex double b1[BENCH_BLOCK * 8], b2[BENCH_BLOCK * 8];
+	struct ref_cFilter old;
+	struct quisk_cFilter new;
+
+	ref_cInit(&old, coefs, taps);
+	quisk_filt_cInit(&new, coefs, taps);
+	error = 0;
+	for (j = 0; j < 10; j++) {
+		memcpy(b1, cInput, sizeof(cInput));
+		memcpy(b2, cInput, sizeof(cInput));
+		n1 = ref_cInterpolate(b1, BENCH_BLOCK, &old, interp);
+		n2 = quisk_cInterpolate(b2, BENCH_BLOCK, &new, interp);
+		if (n1 != n2)
+			printf("%s: output count %d != %d\n", name, n1, n2);
+		for (i = 0; i < n1; i++)
+			if (cabs(b1[i] - b2[i]) / RAND_MAX > error)
+				error = cabs(b1[i] - b2[i]) / RAND_MAX;
+	}
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++) {
+		memcpy(b1, cInput, sizeof(cInput));
+		ref_cInterpolate(b1, BENCH_BLOCK, &old, interp);
+	}
+	t_old = Seconds() - t0;
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++) {
+		memcpy(b2, cInput, sizeof(cInput));
+		quisk_cInterpolate(b2, BENCH_BLOCK, &new, interp);
+	}
+	t_new = Seconds() - t0;
+	Report(name, taps, t_old, t_new, error, BENCH_BLOCK * BENCH_BLOCKS);
+}
+
+static void BenchFilter(const char * name, double * coefs, int taps)
+{
+	int i, j;
+	double t0, t_old, t_new, error;
+	static double b1[BENCH_BLOCK], b2[BENCH_BLOCK];
+	struct ref_dFilter old;
+	struct quisk_dFilter new;
+
+	ref_dInit(&old, coefs, taps);
+	quisk_filt_dInit(&new, coefs, taps);
+	error = 0;
+	for (j = 0; j < 10; j++) {
+		memcpy(b1, dInput, sizeof(b1));
+		memcpy(b2, dInput, sizeof(b2));
+		ref_dFilter(b1, BENCH_BLOCK, &old);
+		quisk_dFilter(b2, BENCH_BLOCK, &new);
+		for (i = 0; i < BENCH_BLOCK; i++)
+			if (fabs(b1[i] - b2[i]) / RAND_MAX > error)
+				error = fabs(b1[i] - b2[i]) / RAND_MAX;
+	}
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++) {
+		memcpy(b1, dInput, sizeof(b1));
+		ref_dFilter(b1, BENCH_BLOCK, &old);
+	}
+	t_old = Seconds() - t0;
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++) {
+		memcpy(b2, dInput, sizeof(b2));
+		quisk_dFilter(b2, BENCH_BLOCK, &new);
+	}
+	t_new = Seconds() - t0;
+	Report(name, taps, t_old, t_new, error, BENCH_BLOCK * BENCH_BLOCKS);
+}
+
+static void BenchBandpass(const char * name, double * coefs, int taps)
+{
+	int i, j;
+	double t0, t_old, t_new, error;
+	complex double c1, c2;
+	volatile complex double sink;
+	struct ref_dFilter old;
+	struct quisk_dFilter new;
+
+	ref_dInit(&old, coefs, taps);
+	quisk_filt_dInit(&new, coefs, taps);
+	quisk_filt_tune(&new, 1650.0 / 8000, 1);
+	old.cpxCoefs = new.cpxCoefs;
+	error = 0;
+	for (j = 0; j < 10; j++) {
+		for (i = 0; i < BENCH_BLOCK; i++) {
+			c1 = ref_dC_out(dInput[i], &old);
+			c2 = quisk_dC_out(dInput[i], &new);
+			if (cabs(c1 - c2) / RAND_MAX > error)
+				error = cabs(c1 - c2) / RAND_MAX;
+		}
+	}
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++)
+		for (i = 0; i < BENCH_BLOCK; i++)
+			sink = ref_dC_out(dInput[i], &old);
+	t_old = Seconds() - t0;
+	t0 = Seconds();
+	for (j = 0; j < BENCH_BLOCKS; j++)
+		for (i = 0; i < BENCH_BLOCK; i++)
+			sink = quisk_dC_out(dInput[i], &new);
+	t_new = Seconds() - t0;
+	(void)sink;
+	Report(name, taps, t_old, t_new, error, BENCH_BLOCK * BENCH_BLOCKS);
+}
+
+int main(int argc, char * argv[])
+{
+	MakeInput();
+	BenchDecimate("cDecimate / 5", quiskFilt240D5Coefs, sizeof(quiskFilt240D5Coefs) / sizeof(double), 5);
+	BenchDecimate("cDecimate / 2", quiskFilt48dec24Coefs, sizeof(quiskFilt48dec24Coefs) / sizeof(double), 2);
+	BenchDecimate("cFilter", quiskFilt240D5CoefsSharp, sizeof(quiskFilt240D5CoefsSharp) / sizeof(double), 1);
+	BenchInterpolate("cInterpolate * 2", quiskAudio24p4Coefs, sizeof(quiskAudio24p4Coefs) / sizeof(double), 2);
+	BenchInterpolate("cInterpolate * 5", quiskFilt240D5Coefs, sizeof(quiskFilt240D5Coefs) / sizeof(double), 5);
+	BenchFilter("dFilter", quiskAudioFmHpCoefs, sizeof(quiskAudioFmHpCoefs) / sizeof(double));
+	BenchBandpass("dC_out", quiskMicFilt8Coefs, sizeof(quiskMicFilt8Coefs) / sizeof(double));
+	return 0;
+}
@@ -1,3 +1,5 @@
+import math, array
+
 # Rate 24000 sps, ripple 0.2 dB, atten 100 dB, shape 1.2
 Filters = {
 
@@ -548,3 +550,43 @@ Filters = {
  0.000003794338487480, 0.000006365988874769],
 
 }
+
+def DesignFilterCoef(rate, N, bw, center):
+  """Make an I/Q filter with rectangular passband.  Return the I and Q coefficients as array('d').
+
+  The rate is the filter sample rate, and N is the number of taps or None to choose it from the
+  bandwidth.  A filter from Filters is used if there is one for this bandwidth."""
+  lowpass = bw * 24000 // rate // 2
+  if lowpass in Filters:
+    filtD = array.array('d', Filters[lowpass])
+  else:
+    if N is None:
+      shape = 1.5       # Shape factor at 88 dB
+      trans = (bw / 2.0 / rate) * (shape - 1.0)     # 88 dB atten
+      N = int(4.0 / trans)
+      if N > 1000:
+        N = 1000
+      N = (N // 2) * 2 + 1
+    K = bw * N / rate
+    sin = math.sin
+    cos = math.cos
+    a = math.pi * K / N
+    b = math.pi / N
+    c = 2.0 * math.pi / N
+    # Make a lowpass filter and apply a Blackman window; cos(2x) is calculated from cos(x)
+    filtD = array.array('d', [
+      (sin(a * k) / sin(b * k) / N if k else float(K) / N) *
+      (0.34 + 0.5 * w + 0.16 * w * w)
+      for k, w in [(k, cos(c * k)) for k in range(-N//2, N//2 + 1)]])
+  if center:
+    # Make a bandpass filter by tuning the low pass filter to new center frequency.
+    # Make two quadrature filters.
+    NN = len(filtD)
+    D = (NN - 1.0) / 2.0
+    tune = -2.0 * math.pi * center / rate
+    cos = math.cos
+    sin = math.sin
+    filtI = array.array('d', [2.0 * cos(tune * (i - D)) * filtD[i] for i in range(NN)])
+    filtQ = array.array('d', [2.0 * sin(tune * (i - D)) * filtD[i] for i in range(NN)])
+    return filtI, filtQ
+  return filtD, filtD
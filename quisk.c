@@ -19,6 +19,7 @@ static int cleanupWSA = 0;			// Must we call WSACleanup() ?
 #define QUISK_SHUT_BOTH	SHUT_RDWR
 #endif
 
+#include <pythread.h>
 #include "quisk.h"
 #include "filter.h"
 
@@ -28,11 +29,14 @@ static int cleanupWSA = 0;			// Must we call WSACleanup() ?
 #define AGC_DELAY			15					// Delay in AGC buffer in milliseconds
 #define AGC_MAX_OUT			(CLIP32 * 0.7)		// Maximum AGC output level
 #define FFT_ARRAY_SIZE		4					// Number of FFTs
+#define FFT_BATCH_SIZE		2					// Maximum number of adjacent FFT buffers to transform at once
+#define GRAPH_POLL_USEC		5000				// Graph thread sleep time when no FFT is ready
+#define GRAPH_FRAME_NEW		4					// Flag in graph_middle for a frame not yet taken by the GUI
 
 static int fft_error;			// fft error count
 typedef struct fftd {
 	fftw_complex * samples;		// complex data for fft
-	fftw_plan plan;				// fft plan for fftW
+	fftw_plan plan;				// fft plan for fftW; not used by fft_data_array
 	int index;					// position of next fft sample
 	int filled;					// whether the fft is ready to run
 	int block;					// block number 0, 1, ...
@@ -48,16 +52,141 @@ struct AgcState {		// Store state information for the AGC
 	double delta;
 	double target_gain;
 	complex double * c_samp;
+	double * block;			// Envelope and then gain for each sample of a block
+	int block_size;			// Dimension of block
 };
 
+struct rx_decimate {		// Filter state for integer decimation of a receive channel
+	struct quisk_cHB45Filter HalfBand1;
+	struct quisk_cHB45Filter HalfBand2;
+	struct quisk_cHB45Filter HalfBand3;
+	struct quisk_cHB45Filter HalfBand4;
+	struct quisk_cFilter filtSdriq111;
+	struct quisk_cFilter filtSdriq53;
+	struct quisk_cFilter filtSdriq133;
+	struct quisk_cFilter filtSdriq167;
+	struct quisk_cFilter filtSdriq185;
+	struct quisk_cFilter filtDecim3;
+	struct quisk_cFilter filtDecim5;
+	struct quisk_cFilter filtDecim5S;
+	struct quisk_cFilter filtDecim48to24;
+} ;
+
+struct rx_demodulate {		// Filter state for demodulation of a receive channel
+	complex double fm_1;			// Sample delayed by one
+	double dc_remove;		// DC removal for AM
+	double FM_www;
+	double FM_nnn, FM_a_0, FM_a_1, FM_b_1, FM_x_1, FM_y_1;   // filter for FM
+	struct quisk_cHB45Filter HalfBand4;
+	struct quisk_cHB45Filter HalfBand5;
+	struct quisk_dHB45Filter HalfBand6;
+	struct quisk_dFilter filtAudio24p3;
+	struct quisk_dFilter filtAudio24p4;
+	struct quisk_dFilter filtAudio12p2;
+	struct quisk_dFilter filtAudio24p6;
+	struct quisk_dFilter filtAudioFmHp;
+	struct quisk_cFilter filtDecim48to24;
+} ;
+
+struct frac_decim {		// State for fractional decimation
+	double dindex;
+	complex double c0, c1, c2;
+} ;
+
+struct rx_filter {		// Rx filter state: a direct FIR filter, or partitioned FFT convolution
+	int kind;						// 0 for one real filter on complex samples, 1 for separate I and Q filters
+	int taps;						// Number of coefficients, or zero for no filter
+	double * source;				// The coefficients of the design
+	int version;					// The rx_filter_version of the design
+	double * gI, * gQ;				// Coefficients in time order
+	double * delayI, * delayQ;		// Direct filter: delay lines of 2 * taps; each sample is written twice
+	int index;						// Direct filter: position of the newest sample in the delay lines
+	int fft_size;					// FFT filter: size of the FFT, or zero for the direct filter
+	int step;						// FFT filter: new samples for each FFT, and the length of each partition
+	int parts;						// FFT filter: number of partitions of the coefficients
+	fftw_complex * A, * B;			// FFT filter: spectra of (gI + gQ) / 2 and (gI - gQ) / 2 for each partition
+	fftw_complex * X;				// FFT filter: spectra of the last "parts" input blocks
+	int xpos;						// FFT filter: index in X of the newest spectrum
+	fftw_complex * buf;				// FFT filter: FFT data
+	fftw_plan fwd, rev;				// FFT filter: forward and inverse plans
+	complex double * hist;			// FFT filter: "step" old samples followed by the new samples
+	int hist_len;
+	complex double * fifo;			// FFT filter: output samples not yet returned
+	int fifo_len;
+	int fifo_size;
+} ;
+
+struct rx_channel {		// A receive channel with its own frequency, mode, filters and AGC
+	int number;						// Index into rx_channels
+	volatile int state;				// RX_CHANNEL_OFF, etc.; not used for channels 0 and 1
+	volatile int close_request;		// Request from the GUI thread to turn the channel off
+	volatile int freq;				// Tune frequency as +/- sample_rate / 2; for extra channels
+	volatile int mode;				// Mode as for rxMode
+	volatile double volume;			// Volume for RX_SINK_PLAY, 0.0 to 1.0
+	int sink;						// Where the audio goes: RX_SINK_NONE, RX_SINK_PLAY or RX_SINK_FILE
+	char file_name[QUISK_PATH_SIZE];	// The WAV file for RX_SINK_FILE
+	int initialized;				// Have the filters been initialized?
+	double * filterI;				// Rx filter coefficients, or NULL to use cFilterI and cFilterQ
+	double * filterQ;
+	int sizeFilter;					// Number of Rx filter coefficients when filterI is not NULL
+	struct rx_filter filter;		// State of the Rx filter
+	struct quisk_nco tuner;			// Tuning oscillator
+	struct rx_decimate decim;
+	struct rx_demodulate demod;
+	struct frac_decim frac;
+	struct quisk_cHB45Filter HalfBand7;		// Interpolate to the play rate
+	struct quisk_cHB45Filter HalfBand8;
+	struct quisk_cHB45Filter HalfBand9;
+	struct AgcState agc;
+	int size_samples;				// Dimension of cSamples and dsamples
+	complex double * cSamples;		// Sample buffer for extra channels
+	double * dsamples;				// Audio buffer for extra channels
+	double * play;					// RX_SINK_PLAY: audio not yet mixed into the radio sound
+	int play_len;					// Number of samples in play
+	int play_size;					// Dimension of play
+	int play_ready;					// Is there enough audio in play to start mixing?
+} ;
+
+// Channel 0 is the receiver, and channel 1 is the split transmit frequency.  Channels
+// from 2 to QUISK_MAX_RX_CHANNELS - 1 are extra receivers controlled by set_rx_channel().
+#define RX_CHANNEL_MAIN		0
+#define RX_CHANNEL_SPLIT	1
+enum {RX_CHANNEL_OFF, RX_CHANNEL_OPENING, RX_CHANNEL_ON};
+enum {RX_SINK_NONE, RX_SINK_PLAY, RX_SINK_FILE};
+static struct rx_channel rx_channels[QUISK_MAX_RX_CHANNELS];
+
 static fft_data fft_data_array[FFT_ARRAY_SIZE];		// Data for several FFTs
 static int fft_data_index = 0;						// Write the current samples to this FFT
 
 static double * fft_window;		// Window for FFT data
+static char * fft_window_names[] = {"Hanning", "Hamming", "Blackman-Harris", "Flat-top", "Kaiser"};
+#define FFT_WINDOW_COUNT	(int)(sizeof(fft_window_names) / sizeof(fft_window_names[0]))
+static double * fft_window_tables[FFT_WINDOW_COUNT];	// Cached window tables of size fft_size
+static double fft_window_beta = -1;	// Beta of the cached Kaiser window
+static double fft_window_graph_db;	// Graph correction for the window coherent gain relative to Hanning
+static double fft_window_smeter_db;	// S-meter correction for the window power gain
+static fftw_complex * fft_samples;	// Contiguous space for the fft_data_array samples
+static fftw_plan fft_plans[FFT_BATCH_SIZE + 1];	// FFT plans for 1, 2, ... adjacent buffers
 static double * current_graph;	// current graph data as returned
+static double * graph_frames[3];	// Graph frames from the graph thread: data_width points and the S-meter
+static volatile int graph_middle = 1;	// Index of the frame being exchanged, plus GRAPH_FRAME_NEW
+static int graph_front = 0;			// Index of the frame owned by the GUI
+static int graph_back = 2;			// Index of the frame owned by the graph thread
+static volatile int graph_thread_running;	// Is the graph thread running?
+static volatile int graph_thread_stopped;	// Has the graph thread exited?
+static volatile int graph_thread_loops;		// Count of graph thread loops
+static volatile int graph_reset;	// Request to clear the FFT average
+static volatile int use_fft = 1;	// Use the FFT, or return raw data
+static volatile double graph_zoom = 1.0;	// Graph zoom and offset from get_graph()
+static volatile double graph_deltaf;
+static int graph_frames_made;		// Number of graph frames calculated
+static int graph_frames_dropped;	// Number of graph frames replaced before the GUI took them
 static int use_remove_dc=1;		// Remove DC from samples
+static int use_channelizer=1;	// Use the polyphase channelizer for extra receive channels
+static char fftw_wisdom_path[QUISK_PATH_SIZE];	// File name for FFTW wisdom, or ""
 
 static PyObject * QuiskError;		// Exception for this module
+static double BesselI0(double);
 static PyObject * pyApp;		// Application instance
 static int fft_size;			// size of fft, e.g. 1024
 int data_width;				// number of points to return as graph data; fft_size * n
@@ -75,6 +204,13 @@ double quisk_audioVolume;		// Audio output level, 0.0 to 1.0
 static double cFilterI[MAX_FILTER_SIZE];	// Digital filter coefficients for receive
 static double cFilterQ[MAX_FILTER_SIZE];	// Digital filter coefficients
 static int sizeFilter;			// Number of coefficients for filters
+static volatile int rx_filter_version;	// Incremented for each new Rx filter
+static int rx_fft_filter_taps = 256;	// Use FFT convolution for Rx filters with this many taps; zero for never
+#define RX_FFT_MIN_LOG2		7			// Minimum log2 of the Rx filter FFT size; the delay is half the size
+#define RX_FFT_MAX_LOG2		10			// Maximum log2 of the Rx filter FFT size
+#define RX_FFT_MAX_PARTS	32			// Use a larger FFT if a filter needs more partitions than this
+static fftw_plan rx_fft_plan_fwd[RX_FFT_MAX_LOG2 + 1];	// Rx filter FFT plans for each size
+static fftw_plan rx_fft_plan_rev[RX_FFT_MAX_LOG2 + 1];
 static int isFDX;			// Are we in full duplex mode?
 static int filter_bandwidth;		// Current filter bandwidth in Hertz
 static int quisk_decim_srate;				// Sample rate after decimation
@@ -96,7 +232,7 @@ static int vfo_audio;                   // VFO frequency for the audio channel
 
 static double sidetoneVolume;		// Audio output level of the CW sidetone, 0.0 to 1.0
 static int keyupDelay;			// Play silence after sidetone ends
-static complex double sidetonePhase;		// Phase increment for sidetone
+static struct quisk_nco sidetoneOsc;		// Oscillator for the sidetone
 int quisk_sidetoneCtrl;			// sidetone control value 0 to 1000
 
 static double agcReleaseGain=80;		// AGC maximum gain
@@ -110,6 +246,16 @@ int quisk_tx_tune_freq;			// Transmit tuning frequency as +/- sample_rate / 2
 static int rit_freq;			// RIT frequency in Hertz
 
 #define RX_UDP_SIZE		1442		// Expected size of UDP samples packet
+#define RX_UDP_SAMPLES	((RX_UDP_SIZE - 2) / 6)	// Number of samples in a UDP packet
+#define RX_UDP_RING		64			// Maximum number of UDP packets to read at once
+#define RX_UDP_LATE		16			// Sequence numbers this far behind are late packets, not lost packets
+static struct {
+	int bytes;
+	unsigned char buf[1500];	// Maximum Ethernet is 1500 bytes.
+} rx_udp_blocks[RX_UDP_RING];		// UDP packets from the last read
+static int rx_udp_received;			// Number of UDP packets received
+static int rx_udp_lost;				// Number of UDP packets lost
+static int rx_udp_reordered;		// Number of UDP packets received out of order
 static int rx_udp_socket = INVALID_SOCKET;		// Socket for receiving ADC samples from UDP
 static int rx_udp_started = 0;		// Have we received any data yet?
 int quisk_using_udp = 0;			// Are we using rx_udp_socket?  No longer used, but provided for backward compatibility.
@@ -129,6 +275,7 @@ static int quisk_record_full;
 
 // These are used to measure the frequency of a continuous RF signal.
 static void measure_freq(complex double *, int, int);
+static void stop_graph_thread(void);
 static double measured_frequency;
 static int measure_freq_mode=0;
 
@@ -183,16 +330,14 @@ static int fFracDecim(double * dSamples, int nSamples, double fdecim)
 }
 #endif
 
-static int cFracDecim(complex double * cSamples, int nSamples, double fdecim)
+static int cFracDecim(complex double * cSamples, int nSamples, double fdecim, struct frac_decim * st)
 {
 // Fractional decimation of I/Q signals works poorly because it introduces aliases and birdies.
 	int i, nout;
 	double xm0, xm1, xm2, xm3;
-	static double dindex = 1;
-	static complex double c0=0, c1=0, c2=0, c3=0;
-	static int in=0, out=0;
+	double dindex = st->dindex;
+	complex double c0 = st->c0, c1 = st->c1, c2 = st->c2, c3;
 
-	in += nSamples;
 	nout = 0;
 	for (i = 0; i < nSamples; i++) {
 		c3 = cSamples[i];
@@ -210,7 +355,6 @@ static int cFracDecim(complex double * cSamples, int nSamples, double fdecim)
 					(xm1 * xm2 * xm3 * c0 / -6.0 + xm0 * xm2 * xm3 * c1 / 2.0 +
 					xm0 * xm1 * xm3 * c2 / -2.0 + xm0 * xm1 * xm2 * c3 / 6.0);
 #endif
-			out++;
 			dindex += fdecim - 1;
 			c0 = c1;
 			c1 = c2;
@@ -224,7 +368,10 @@ static int cFracDecim(complex double * cSamples, int nSamples, double fdecim)
 			dindex -= 1;
 		}
 	}
-	//printf ("in %d out %d\n", in, out);
+	st->dindex = dindex;
+	st->c0 = c0;
+	st->c1 = c1;
+	st->c2 = c2;
 	return nout;
 }
 			
@@ -597,73 +744,240 @@ static PyObject * get_audio_graph(PyObject * self, PyObject * args)
 }
 #endif
 
-static complex double dRxFilterOut(complex double sample, int bank)
-{  // Rx FIR filter; bank is the static storage index, and must be different for different data streams
-	complex double cx;
-	int j, k;
-	static int init = 0;
-	static struct stStorage {
-		int indexFilter;						// current index into sample buffer
-		complex double bufFilterC[MAX_FILTER_SIZE];	// Digital filter sample buffer
-	} Storage[2];
-	struct stStorage * ptBuf = Storage + bank;
-
-	if ( ! init) {
-		init = 1;
-		memset(Storage, 0, sizeof(struct stStorage));
-		memset(Storage + 1, 0, sizeof(struct stStorage));
-	}
-
-	if ( ! sizeFilter)
-		return sample;
-	if (ptBuf->indexFilter >= sizeFilter)
-		ptBuf->indexFilter = 0;
-	ptBuf->bufFilterC[ptBuf->indexFilter] = sample;
-	cx = 0;
-	j = ptBuf->indexFilter;
-	for (k = 0; k < sizeFilter; k++) {
-		cx += ptBuf->bufFilterC[j] * cFilterI[k];
-		if (++j >= sizeFilter)
-			j = 0;
+static void rx_fft_plans(int plan_flags)	// Called from the GUI thread
+{  // Make the Rx filter FFT plans for every size that rx_filter_design() can use.
+   // The FFTW planner must not run in the sound thread, so rx_filter_design() only uses these plans.
+	int log2, size;
+	fftw_complex * buf;
+
+	if (rx_fft_filter_taps <= 0)
+		return;
+	buf = (fftw_complex *)fftw_malloc((1 << RX_FFT_MAX_LOG2) * sizeof(fftw_complex));
+	for (log2 = RX_FFT_MIN_LOG2; log2 <= RX_FFT_MAX_LOG2; log2++) {
+		if (rx_fft_plan_fwd[log2])		// plans are shared by all filters of this size
+			continue;
+		size = 1 << log2;
+		rx_fft_plan_fwd[log2] = fftw_plan_dft_1d(size, buf, buf, FFTW_FORWARD, plan_flags);
+		rx_fft_plan_rev[log2] = fftw_plan_dft_1d(size, buf, buf, FFTW_BACKWARD, plan_flags);
 	}
-	ptBuf->indexFilter++;
-	return cx;
-}
-
-static complex double cRxFilterOut(complex double sample, int bank)
-{  // Rx FIR filter; bank is the static storage index, and must be different for different data streams
-	double accI, accQ;
-	int j, k;
-	static int init = 0;
-	static struct stStorage {
-		int indexFilter;						// current index into sample buffer
-		double bufFilterI[MAX_FILTER_SIZE];		// Digital filter sample buffer
-		double bufFilterQ[MAX_FILTER_SIZE];		// Digital filter sample buffer
-	} Storage[2];
-	struct stStorage * ptBuf = Storage + bank;
-
-	if ( ! init) {
-		init = 1;
-		memset(Storage, 0, sizeof(struct stStorage));
-		memset(Storage + 1, 0, sizeof(struct stStorage));
-	}
-
-	if ( ! sizeFilter)
-		return sample;
-	if (ptBuf->indexFilter >= sizeFilter)
-		ptBuf->indexFilter = 0;
-	ptBuf->bufFilterI[ptBuf->indexFilter] = creal(sample);
-	ptBuf->bufFilterQ[ptBuf->indexFilter] = cimag(sample);
-	accI = accQ = 0;
-	j = ptBuf->indexFilter;
-	for (k = 0; k < sizeFilter; k++) {
-		accI += ptBuf->bufFilterI[j] * cFilterI[k];
-		accQ += ptBuf->bufFilterQ[j] * cFilterQ[k];
-		if (++j >= sizeFilter)
-			j = 0;
+	fftw_free(buf);
+}
+
+static void rx_filter_coefs(struct rx_filter * ft, double * coefI, double * coefQ)
+{  // Copy the coefficients into the Rx filter, and make the partition spectra for the FFT filter.
+	int i, m, p, N, taps;
+	fftw_complex * Ap, * Bp;
+
+	taps = ft->taps;
+	// The coefficients are used in the same order as the old circular buffer filter: tap m multiplies
+	// the sample from m samples ago by coef[(taps - m) % taps].
+	for (m = 0; m < taps; m++) {
+		i = (taps - m) % taps;
+		ft->gI[m] = coefI[i];
+		ft->gQ[m] = ft->kind ? coefQ[i] : coefI[i];
+	}
+	if ( ! ft->fft_size)
+		return;
+	// Real filters gI on I and gQ on Q equal (gI + gQ) / 2 on x plus (gI - gQ) / 2 on conj(x).
+	// Partition p holds taps p * step to p * step + step - 1.  The spectra include the 1 / fft_size
+	// scale of the inverse FFT.
+	N = ft->fft_size;
+	for (p = 0; p < ft->parts; p++) {
+		Ap = ft->A + p * N;
+		Bp = ft->B + p * N;
+		for (i = 0; i < N; i++)
+			Ap[i] = Bp[i] = 0;
+		for (i = 0; i < ft->step; i++) {
+			m = p * ft->step + i;
+			if (m >= taps)
+				break;
+			Ap[i] = (ft->gI[m] + ft->gQ[m]) / 2.0 / N;
+			Bp[i] = (ft->gI[m] - ft->gQ[m]) / 2.0 / N;
+		}
+		fftw_execute_dft(ft->fwd, Ap, Ap);
+		fftw_execute_dft(ft->fwd, Bp, Bp);
+	}
+}
+
+static void rx_filter_design(struct rx_filter * ft, double * coefI, double * coefQ, int taps, int kind)
+{  // Prepare the Rx filter for new coefficients.  A kind 0 filter applies coefI to the complex samples.
+   // A kind 1 filter applies coefI to the real part and coefQ to the imaginary part.
+	int i, log2;
+
+	ft->kind = kind;
+	ft->source = coefI;
+	ft->version = rx_filter_version;
+	if (ft->gI && ft->taps == taps) {	// Keep the delay lines or FFT history so the audio is continuous
+		rx_filter_coefs(ft, coefI, coefQ);
+		return;
+	}
+	if (ft->gI) {
+		free(ft->gI);
+		free(ft->gQ);
+		free(ft->delayI);
+		free(ft->delayQ);
+		ft->gI = ft->gQ = ft->delayI = ft->delayQ = NULL;
+	}
+	if (ft->fft_size) {
+		fftw_free(ft->A);
+		fftw_free(ft->B);
+		fftw_free(ft->X);
+		fftw_free(ft->buf);
+		free(ft->hist);
+		free(ft->fifo);
+		ft->fifo = NULL;
+		ft->fifo_size = 0;
+		ft->fft_size = 0;
+	}
+	ft->taps = taps;
+	if (taps <= 0)
+		return;
+	ft->gI = (double *)malloc(taps * sizeof(double));
+	ft->gQ = (double *)malloc(taps * sizeof(double));
+	log2 = 0;
+	if (rx_fft_filter_taps > 0 && taps >= rx_fft_filter_taps) {
+		// Use the smallest FFT that needs at most RX_FFT_MAX_PARTS partitions
+		for (log2 = RX_FFT_MIN_LOG2; log2 < RX_FFT_MAX_LOG2; log2++)
+			if ((1 << (log2 - 1)) * RX_FFT_MAX_PARTS >= taps)
+				break;
+		if ( ! rx_fft_plan_fwd[log2])	// the plans are made by rx_fft_plans()
+			log2 = 0;
+	}
+	if (log2 == 0) {
+		// Each sample is written twice, so the newest "taps" samples are always contiguous
+		ft->delayI = (double *)malloc(2 * taps * sizeof(double));
+		ft->delayQ = (double *)malloc(2 * taps * sizeof(double));
+		for (i = 0; i < 2 * taps; i++)
+			ft->delayI[i] = ft->delayQ[i] = 0;
+		ft->index = 0;
+		rx_filter_coefs(ft, coefI, coefQ);
+		return;
+	}
+	// Uniformly partitioned overlap-save convolution.  Each FFT of fft_size takes "step" new samples and
+	// produces "step" outputs, so the delay is "step" samples for any number of taps.
+	ft->fft_size = 1 << log2;
+	ft->step = ft->fft_size / 2;
+	ft->parts = (taps + ft->step - 1) / ft->step;
+	ft->A = (fftw_complex *)fftw_malloc(ft->parts * ft->fft_size * sizeof(fftw_complex));
+	ft->B = (fftw_complex *)fftw_malloc(ft->parts * ft->fft_size * sizeof(fftw_complex));
+	ft->X = (fftw_complex *)fftw_malloc(ft->parts * ft->fft_size * sizeof(fftw_complex));
+	ft->buf = (fftw_complex *)fftw_malloc(ft->fft_size * sizeof(fftw_complex));
+	ft->fwd = rx_fft_plan_fwd[log2];
+	ft->rev = rx_fft_plan_rev[log2];
+	rx_filter_coefs(ft, coefI, coefQ);
+	for (i = 0; i < ft->parts * ft->fft_size; i++)
+		ft->X[i] = 0;
+	ft->xpos = 0;
+	// The history starts with "step" zeros, and the output has a delay of "step" samples
+	ft->hist = (complex double *)malloc(ft->fft_size * sizeof(complex double));
+	ft->hist_len = ft->step;
+	for (i = 0; i < ft->hist_len; i++)
+		ft->hist[i] = 0;
+	ft->fifo_size = ft->step * 4;
+	ft->fifo = (complex double *)malloc(ft->fifo_size * sizeof(complex double));
+	ft->fifo_len = ft->step;
+	for (i = 0; i < ft->fifo_len; i++)
+		ft->fifo[i] = 0;
+}
+
+static void rx_filter_fft(struct rx_filter * ft, complex double * cSamples, int nSamples)
+{  // Partitioned overlap-save FFT convolution of whole blocks.  The samples are replaced by the filter output.
+   // The output is the sum over the partitions p of the spectrum of the input block from p blocks ago
+   // times the spectrum of partition p.
+	int i, k, j, n, p, N;
+	fftw_complex * Xp, * Ap, * Bp;
+
+	N = ft->fft_size;
+	i = 0;
+	while (i < nSamples) {
+		n = N - ft->hist_len;
+		if (n > nSamples - i)
+			n = nSamples - i;
+		memcpy(ft->hist + ft->hist_len, cSamples + i, n * sizeof(complex double));
+		ft->hist_len += n;
+		i += n;
+		if (ft->hist_len < N)
+			break;
+		if (++ft->xpos >= ft->parts)
+			ft->xpos = 0;
+		Xp = ft->X + ft->xpos * N;
+		memcpy(Xp, ft->hist, N * sizeof(complex double));
+		fftw_execute_dft(ft->fwd, Xp, Xp);
+		for (k = 0; k < N; k++)
+			ft->buf[k] = 0;
+		for (p = 0; p < ft->parts; p++) {
+			j = ft->xpos - p;
+			if (j < 0)
+				j += ft->parts;
+			Xp = ft->X + j * N;
+			Ap = ft->A + p * N;
+			if (ft->kind) {		// Y[k] = X[k] A[k] + conj(X[N - k]) B[k]
+				Bp = ft->B + p * N;
+				for (k = 0; k < N; k++)
+					ft->buf[k] += Xp[k] * Ap[k] + conj(Xp[(N - k) & (N - 1)]) * Bp[k];
+			}
+			else {
+				for (k = 0; k < N; k++)
+					ft->buf[k] += Xp[k] * Ap[k];
+			}
+		}
+		fftw_execute_dft(ft->rev, ft->buf, ft->buf);
+		// The first "step" outputs are wrapped around, and the rest are valid
+		if (ft->fifo_len + ft->step > ft->fifo_size) {
+			ft->fifo_size = (ft->fifo_len + ft->step) * 2;
+			ft->fifo = (complex double *)realloc(ft->fifo, ft->fifo_size * sizeof(complex double));
+		}
+		memcpy(ft->fifo + ft->fifo_len, ft->buf + ft->step, ft->step * sizeof(complex double));
+		ft->fifo_len += ft->step;
+		memcpy(ft->hist, ft->hist + ft->step, ft->step * sizeof(complex double));
+		ft->hist_len = ft->step;
+	}
+	// The fifo always holds at least nSamples outputs because it starts with "step" samples
+	memcpy(cSamples, ft->fifo, nSamples * sizeof(complex double));
+	ft->fifo_len -= nSamples;
+	memmove(ft->fifo, ft->fifo + nSamples, ft->fifo_len * sizeof(complex double));
+}
+
+static void rx_filter_block(complex double * cSamples, int nSamples, struct rx_channel * ch, int kind)
+{  // Apply the Rx filter of the channel to a block of samples.  See rx_filter_design() for the kind.
+	int i, k, taps;
+	double accI, accQ, * coefI, * coefQ, * dI, * dQ, * gI, * gQ;
+	struct rx_filter * ft = &ch->filter;
+
+	if (ch->filterI) {
+		coefI = ch->filterI;
+		coefQ = ch->filterQ;
+		taps = ch->sizeFilter;
+	}
+	else {
+		coefI = cFilterI;
+		coefQ = cFilterQ;
+		taps = sizeFilter;
+	}
+	if (ft->taps != taps || ft->kind != kind || ft->source != coefI || ft->version != rx_filter_version)
+		rx_filter_design(ft, coefI, coefQ, taps, kind);
+	if (taps <= 0)
+		return;
+	if (ft->fft_size) {
+		rx_filter_fft(ft, cSamples, nSamples);
+		return;
+	}
+	gI = ft->gI;
+	gQ = ft->gQ;
+	for (i = 0; i < nSamples; i++) {
+		if (--ft->index < 0)
+			ft->index = taps - 1;
+		dI = ft->delayI + ft->index;
+		dQ = ft->delayQ + ft->index;
+		dI[0] = dI[taps] = creal(cSamples[i]);
+		dQ[0] = dQ[taps] = cimag(cSamples[i]);
+		accI = accQ = 0;
+		for (k = 0; k < taps; k++) {	// dI[k] is the sample from k samples ago
+			accI += gI[k] * dI[k];
+			accQ += gQ[k] * dQ[k];
+		}
+		cSamples[i] = accI + I * accQ;
 	}
-	ptBuf->indexFilter++;
-	return accI + I * accQ;
 }
 
 static void AddTestTone(complex double * cSamples, int nSamples)
@@ -816,47 +1130,31 @@ void quisk_tmp_microphone(complex double * cSamples, int nSamples)
 	}
 }
 
-static int quisk_process_decimate(complex double * cSamples, int nSamples, int bank)
+static int quisk_process_decimate(complex double * cSamples, int nSamples, struct rx_channel * ch)
 {
-	int i, final_filter;
-	static struct stStorage {
-		struct quisk_cHB45Filter HalfBand1;
-		struct quisk_cHB45Filter HalfBand2;
-		struct quisk_cHB45Filter HalfBand3;
-		struct quisk_cHB45Filter HalfBand4;
-		struct quisk_cFilter filtSdriq111;
-		struct quisk_cFilter filtSdriq53;
-		struct quisk_cFilter filtSdriq133;
-		struct quisk_cFilter filtSdriq167;
-		struct quisk_cFilter filtSdriq185;
-		struct quisk_cFilter filtDecim3;
-		struct quisk_cFilter filtDecim5;
-		struct quisk_cFilter filtDecim5S;
-		struct quisk_cFilter filtDecim48to24;
-	} Storage[2] ;
+	int final_filter;
+	struct rx_decimate * st = &ch->decim;
 
 	if ( ! cSamples) {	// Initialize all filters
-		for (i = 0; i < 2; i++) {
-			memset(&Storage[i].HalfBand1, 0, sizeof(struct quisk_cHB45Filter));
-			memset(&Storage[i].HalfBand2, 0, sizeof(struct quisk_cHB45Filter));
-			memset(&Storage[i].HalfBand3, 0, sizeof(struct quisk_cHB45Filter));
-			memset(&Storage[i].HalfBand4, 0, sizeof(struct quisk_cHB45Filter));
-			quisk_filt_cInit(&Storage[i].filtSdriq111, quiskFilt111D2Coefs, sizeof(quiskFilt111D2Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtSdriq53, quiskFilt53D1Coefs, sizeof(quiskFilt53D1Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtSdriq133, quiskFilt133D2Coefs, sizeof(quiskFilt133D2Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtSdriq167, quiskFilt167D3Coefs, sizeof(quiskFilt167D3Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtSdriq185, quiskFilt185D3Coefs, sizeof(quiskFilt185D3Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtDecim3, quiskFilt144D3Coefs, sizeof(quiskFilt144D3Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtDecim5, quiskFilt240D5Coefs, sizeof(quiskFilt240D5Coefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtDecim5S, quiskFilt240D5CoefsSharp, sizeof(quiskFilt240D5CoefsSharp)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtDecim48to24, quiskFilt48dec24Coefs, sizeof(quiskFilt48dec24Coefs)/sizeof(double));
-		}
+		memset(&st->HalfBand1, 0, sizeof(struct quisk_cHB45Filter));
+		memset(&st->HalfBand2, 0, sizeof(struct quisk_cHB45Filter));
+		memset(&st->HalfBand3, 0, sizeof(struct quisk_cHB45Filter));
+		memset(&st->HalfBand4, 0, sizeof(struct quisk_cHB45Filter));
+		quisk_filt_cInit(&st->filtSdriq111, quiskFilt111D2Coefs, sizeof(quiskFilt111D2Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtSdriq53, quiskFilt53D1Coefs, sizeof(quiskFilt53D1Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtSdriq133, quiskFilt133D2Coefs, sizeof(quiskFilt133D2Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtSdriq167, quiskFilt167D3Coefs, sizeof(quiskFilt167D3Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtSdriq185, quiskFilt185D3Coefs, sizeof(quiskFilt185D3Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtDecim3, quiskFilt144D3Coefs, sizeof(quiskFilt144D3Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtDecim5, quiskFilt240D5Coefs, sizeof(quiskFilt240D5Coefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtDecim5S, quiskFilt240D5CoefsSharp, sizeof(quiskFilt240D5CoefsSharp)/sizeof(double));
+		quisk_filt_cInit(&st->filtDecim48to24, quiskFilt48dec24Coefs, sizeof(quiskFilt48dec24Coefs)/sizeof(double));
 		return 0;
 	}
 	// Decimate: Lower the sample rate to 48000 sps (or approx).  Filters are designed for
 	// a pass bandwidth of 20 kHz and a stop bandwidth of 24 kHz.
 	// We use 48 ksps to accommodate wide digital modes.
-	final_filter = (rxMode == 7 || rxMode == 8 || rxMode == 9);	// Use sharp FIR final filter for decimate
+	final_filter = (ch->mode == 7 || ch->mode == 8 || ch->mode == 9);	// Use sharp FIR final filter for decimate
 	quisk_decim_srate = 48000;
 	switch((quisk_sound_state.sample_rate + 100) / 1000) {
 	case 41:
@@ -864,105 +1162,105 @@ static int quisk_process_decimate(complex double * cSamples, int nSamples, int b
 		break;
 	case 53:	// SDR-IQ
 		quisk_decim_srate = quisk_sound_state.sample_rate;
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq53, 1);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq53, 1);
 		break;
 	case 96:
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
 		else
-			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
+			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
 		break;
 	case 111:	// SDR-IQ
 		quisk_decim_srate = quisk_sound_state.sample_rate / 2;
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq111, 2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq111, 2);
 		break;
 	case 133:	// SDR-IQ
 		quisk_decim_srate = quisk_sound_state.sample_rate / 2;
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq133, 2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq133, 2);
 		break;
 	case 185:	// SDR-IQ
 		quisk_decim_srate = quisk_sound_state.sample_rate / 3;
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq185, 3);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq185, 3);
 		break;
 	case 192:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
 		else
-			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
+			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
 		break;
 	case 240:
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim5S, 5);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim5S, 5);
 		else
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim5, 5);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim5, 5);
 		break;
     case 288:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim3, 3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim3, 3);
 		break;
 	case 370:
 		quisk_decim_srate = quisk_sound_state.sample_rate / 6;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq185, 3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq185, 3);
 		break;
 	case 384:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand3);
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
 		else
-			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
+			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
 		break;
 	case 480:
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim5, 5);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim5, 5);
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
 		else
-			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
+			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
 		break;
 	case 740:
 		quisk_decim_srate = quisk_sound_state.sample_rate / 12;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand3);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq185, 3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand3);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq185, 3);
 		break;
     case 768:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand3);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand4);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand4);
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
 		else
-			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
+			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
 		break;
 	case 960:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim5, 5);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim5, 5);
 		if (final_filter)
-			nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+			nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
 		else
-			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
+			nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
 		break;
     case 1152:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand3);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim3, 3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand3);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim3, 3);
 		break;
 	case 1333:
 		quisk_decim_srate = quisk_sound_state.sample_rate / 24;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand3);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtSdriq167, 3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand3);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtSdriq167, 3);
 		break;
     case 2304:
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand1);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand2);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand3);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand4);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim3, 3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand1);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand3);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand4);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim3, 3);
 		break;
 	default:
 		printf ("Failure in quisk.c in integer decimation\n");
@@ -971,193 +1269,188 @@ static int quisk_process_decimate(complex double * cSamples, int nSamples, int b
 	return nSamples;
 }
 
-static int quisk_process_demodulate(complex double * cSamples, double * dsamples, int nSamples, int bank)
+static int quisk_process_demodulate(complex double * cSamples, double * dsamples, int nSamples, struct rx_channel * ch)
 {
 	int i;
 	complex double cx, cpx;
 	double d, di, dd;
-	static struct stStorage {
-		complex double fm_1;			// Sample delayed by one
-		double dc_remove;		// DC removal for AM
-		double FM_www;
-		double FM_nnn, FM_a_0, FM_a_1, FM_b_1, FM_x_1, FM_y_1;   // filter for FM
-		struct quisk_cHB45Filter HalfBand4;
-		struct quisk_cHB45Filter HalfBand5;
-		struct quisk_dHB45Filter HalfBand6;
-		struct quisk_dFilter filtAudio24p3;
-		struct quisk_dFilter filtAudio24p4;
-		struct quisk_dFilter filtAudio12p2;
-		struct quisk_dFilter filtAudio24p6;
-		struct quisk_dFilter filtAudioFmHp;
-		struct quisk_cFilter filtDecim48to24;
-	} Storage[2] ;
+	struct rx_demodulate * st = &ch->demod;
 
 	if ( ! cSamples) {	// Initialize all filters
-		for (i = 0; i < 2; i++) {
-			memset(&Storage[i].HalfBand4, 0, sizeof(struct quisk_cHB45Filter));
-			memset(&Storage[i].HalfBand5, 0, sizeof(struct quisk_cHB45Filter));
-			memset(&Storage[i].HalfBand6, 0, sizeof(struct quisk_dHB45Filter));
-			quisk_filt_dInit(&Storage[i].filtAudio24p3, quiskAudio24p3Coefs, sizeof(quiskAudio24p3Coefs)/sizeof(double));
-			quisk_filt_dInit(&Storage[i].filtAudio24p4, quiskAudio24p4Coefs, sizeof(quiskAudio24p4Coefs)/sizeof(double));
-			quisk_filt_dInit(&Storage[i].filtAudio12p2, quiskAudio24p4Coefs, sizeof(quiskAudio24p4Coefs)/sizeof(double));
-			quisk_filt_dInit(&Storage[i].filtAudio24p6, quiskAudio24p6Coefs, sizeof(quiskAudio24p6Coefs)/sizeof(double));
-			quisk_filt_dInit(&Storage[i].filtAudioFmHp, quiskAudioFmHpCoefs, sizeof(quiskAudioFmHpCoefs)/sizeof(double));
-			quisk_filt_cInit(&Storage[i].filtDecim48to24, quiskFilt48dec24Coefs, sizeof(quiskFilt48dec24Coefs)/sizeof(double));
-			Storage[i].fm_1 = 10;
-			Storage[i].FM_www = tan(M_PI * FM_FILTER_DEMPH / 24000);   // filter for FM
-			Storage[i].FM_nnn = 1.0 / (1.0 + Storage[i].FM_www);
-			Storage[i].FM_a_0 = Storage[i].FM_www * Storage[i].FM_nnn;
-			Storage[i].FM_a_1 = Storage[i].FM_a_0;
-			Storage[i].FM_b_1 = Storage[i].FM_nnn * (Storage[i].FM_www - 1.0);
-			//printf ("dsamples[i] = y_1 = di * %12.6lf + x_1 * %12.6lf - y_1 * %12.6lf\n", FM_a_0, FM_a_1, FM_b_1);
-		}
+		memset(&st->HalfBand4, 0, sizeof(struct quisk_cHB45Filter));
+		memset(&st->HalfBand5, 0, sizeof(struct quisk_cHB45Filter));
+		memset(&st->HalfBand6, 0, sizeof(struct quisk_dHB45Filter));
+		quisk_filt_dInit(&st->filtAudio24p3, quiskAudio24p3Coefs, sizeof(quiskAudio24p3Coefs)/sizeof(double));
+		quisk_filt_dInit(&st->filtAudio24p4, quiskAudio24p4Coefs, sizeof(quiskAudio24p4Coefs)/sizeof(double));
+		quisk_filt_dInit(&st->filtAudio12p2, quiskAudio24p4Coefs, sizeof(quiskAudio24p4Coefs)/sizeof(double));
+		quisk_filt_dInit(&st->filtAudio24p6, quiskAudio24p6Coefs, sizeof(quiskAudio24p6Coefs)/sizeof(double));
+		quisk_filt_dInit(&st->filtAudioFmHp, quiskAudioFmHpCoefs, sizeof(quiskAudioFmHpCoefs)/sizeof(double));
+		quisk_filt_cInit(&st->filtDecim48to24, quiskFilt48dec24Coefs, sizeof(quiskFilt48dec24Coefs)/sizeof(double));
+		st->fm_1 = 10;
+		st->dc_remove = 0;
+		st->FM_x_1 = st->FM_y_1 = 0;
+		st->FM_www = tan(M_PI * FM_FILTER_DEMPH / 24000);   // filter for FM
+		st->FM_nnn = 1.0 / (1.0 + st->FM_www);
+		st->FM_a_0 = st->FM_www * st->FM_nnn;
+		st->FM_a_1 = st->FM_a_0;
+		st->FM_b_1 = st->FM_nnn * (st->FM_www - 1.0);
+		//printf ("dsamples[i] = y_1 = di * %12.6lf + x_1 * %12.6lf - y_1 * %12.6lf\n", FM_a_0, FM_a_1, FM_b_1);
 		return 0;
 	}
 
 	// Filter and demodulate signal, copy capture buffer cSamples to play buffer dsamples.
 	// quisk_decim_srate is the sample rate after integer decimation.
     quisk_demod_srate = quisk_decim_srate;
-	switch(rxMode) {
+	switch(ch->mode) {
 	case 0:		// lower sideband CW at 6 ksps
 		quisk_demod_srate /= 8;
 		quisk_filter_srate = quisk_demod_srate;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand5);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand4);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand5);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand4);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
+		rx_filter_block(cSamples, nSamples, ch, 1);
 		for (i = 0; i < nSamples; i++) {
-			cx = cRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			dsamples[i] = dd = creal(cx) + cimag(cx);
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		if(bank == 0)
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, rit_freq, quisk_filter_srate);
-		nSamples = quisk_dInterpolate(dsamples, nSamples, &Storage[bank].filtAudio12p2, 2);
-		nSamples = quisk_dInterp2HB45(dsamples, nSamples, &Storage[bank].HalfBand6);
+		nSamples = quisk_dInterpolate(dsamples, nSamples, &st->filtAudio12p2, 2);
+		nSamples = quisk_dInterp2HB45(dsamples, nSamples, &st->HalfBand6);
 		quisk_demod_srate *= 4;
 		break;
 	case 1:		// upper sideband CW at 6 ksps
 		quisk_demod_srate /= 8;
 		quisk_filter_srate = quisk_demod_srate;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand5);
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand4);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand5);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand4);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
+		rx_filter_block(cSamples, nSamples, ch, 1);
 		for (i = 0; i < nSamples; i++) {
-			cx = cRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			dsamples[i] = dd = creal(cx) - cimag(cx);
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		if(bank == 0)
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, rit_freq, quisk_filter_srate);
-		nSamples = quisk_dInterpolate(dsamples, nSamples, &Storage[bank].filtAudio12p2, 2);
-		nSamples = quisk_dInterp2HB45(dsamples, nSamples, &Storage[bank].HalfBand6);
+		nSamples = quisk_dInterpolate(dsamples, nSamples, &st->filtAudio12p2, 2);
+		nSamples = quisk_dInterp2HB45(dsamples, nSamples, &st->HalfBand6);
 		quisk_demod_srate *= 4;
 		break;
 	case 2:	 // lower sideband SSB at 12 ksps
 		quisk_demod_srate /= 4;
 		quisk_filter_srate = quisk_demod_srate;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand5);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand5);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
+		rx_filter_block(cSamples, nSamples, ch, 1);
 		for (i = 0; i < nSamples; i++) {
-			cx = cRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			dsamples[i] = dd = creal(cx) + cimag(cx);
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		if(bank == 0)
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, 0, quisk_filter_srate);
 		//calc_audio_graph(dsamples, nSamples);
-		nSamples = quisk_dInterpolate(dsamples, nSamples, &Storage[bank].filtAudio24p4, 2);
+		nSamples = quisk_dInterpolate(dsamples, nSamples, &st->filtAudio24p4, 2);
 		quisk_demod_srate *= 2;
 		break;
 	case 3:	 // upper sideband SSB at 12 ksps
 	default:
 		quisk_demod_srate /= 4;
 		quisk_filter_srate = quisk_demod_srate;
-		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &Storage[bank].HalfBand5);
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+		nSamples = quisk_cDecim2HB45(cSamples, nSamples, &st->HalfBand5);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
+		rx_filter_block(cSamples, nSamples, ch, 1);
 		for (i = 0; i < nSamples; i++) {
-			cx = cRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			dsamples[i] = dd = creal(cx) - cimag(cx);
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		if(bank == 0)
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, 0, quisk_filter_srate);
 		//calc_audio_graph(dsamples, nSamples);
-		nSamples = quisk_dInterpolate(dsamples, nSamples, &Storage[bank].filtAudio24p4, 2);
+		nSamples = quisk_dInterpolate(dsamples, nSamples, &st->filtAudio24p4, 2);
 		quisk_demod_srate *= 2;
 		break;
 	case 4:		// AM at 24 ksps
 		quisk_demod_srate /= 2;
 		quisk_filter_srate = quisk_demod_srate;
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
+		rx_filter_block(cSamples, nSamples, ch, 0);
 		for (i = 0; i < nSamples; i++) {
-			cx = dRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			di = cabs(cx);
-			d = di + Storage[bank].dc_remove * 0.99;	// DC removal; R.G. Lyons page 553
-			di = d - Storage[bank].dc_remove;
-			Storage[bank].dc_remove = d;
+			d = di + st->dc_remove * 0.99;	// DC removal; R.G. Lyons page 553
+			di = d - st->dc_remove;
+			st->dc_remove = d;
 			dsamples[i] = di;
 			measure_audio_sum += di * di;
 			measure_audio_count += 1;
 		}
-		nSamples = quisk_dFilter(dsamples, nSamples, &Storage[bank].filtAudio24p6);
-		if(bank == 0)
+		nSamples = quisk_dFilter(dsamples, nSamples, &st->filtAudio24p6);
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, 0, quisk_filter_srate);
 		break;
 	case 5:		// FM at 24 ksps
 		quisk_demod_srate /= 2;
 		quisk_filter_srate = quisk_demod_srate;
-		nSamples = quisk_cDecimate(cSamples, nSamples, &Storage[bank].filtDecim48to24, 2);
+		nSamples = quisk_cDecimate(cSamples, nSamples, &st->filtDecim48to24, 2);
+		rx_filter_block(cSamples, nSamples, ch, 0);
 		for (i = 0; i < nSamples; i++) {
-			cx = dRxFilterOut(cSamples[i], bank);
-			cpx = cx * conj(Storage[bank].fm_1);
-			Storage[bank].fm_1 = cx;
+			cx = cSamples[i];
+			cpx = cx * conj(st->fm_1);
+			st->fm_1 = cx;
 			di = quisk_demod_srate * carg(cpx);
 			// FM de-emphasis
-			dsamples[i] = dd = Storage[bank].FM_y_1 = di * Storage[bank].FM_a_0 +
-				Storage[bank].FM_x_1 * Storage[bank].FM_a_1 - Storage[bank].FM_y_1 * Storage[bank].FM_b_1;
-			Storage[bank].FM_x_1 = di;
+			dsamples[i] = dd = st->FM_y_1 = di * st->FM_a_0 +
+				st->FM_x_1 * st->FM_a_1 - st->FM_y_1 * st->FM_b_1;
+			st->FM_x_1 = di;
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		nSamples = quisk_dDecimate(dsamples, nSamples, &Storage[bank].filtAudio24p3, 2);
-		nSamples = quisk_dFilter(dsamples, nSamples, &Storage[bank].filtAudioFmHp);
-		nSamples = quisk_dInterp2HB45(dsamples, nSamples, &Storage[bank].HalfBand6);
-		if(bank == 0)
+		nSamples = quisk_dDecimate(dsamples, nSamples, &st->filtAudio24p3, 2);
+		nSamples = quisk_dFilter(dsamples, nSamples, &st->filtAudioFmHp);
+		nSamples = quisk_dInterp2HB45(dsamples, nSamples, &st->HalfBand6);
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, 0, quisk_filter_srate);
 		break;
 	case 7:     // digital mode DGT-U at 48 ksps
 		quisk_filter_srate = quisk_demod_srate;
+		rx_filter_block(cSamples, nSamples, ch, 1);
 		for (i = 0; i < nSamples; i++) {
-			cx = cRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			dsamples[i] = dd = creal(cx) - cimag(cx);
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		if(bank == 0)
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, 0, quisk_filter_srate);
 		break;
 	case 8:     // digital mode DGT-L at 48 ksps
 		quisk_filter_srate = quisk_demod_srate;
+		rx_filter_block(cSamples, nSamples, ch, 1);
 		for (i = 0; i < nSamples; i++) {
-			cx = cRxFilterOut(cSamples[i], bank);
+			cx = cSamples[i];
 			dsamples[i] = dd = creal(cx) + cimag(cx);
 			measure_audio_sum += dd * dd;
 			measure_audio_count += 1;
 		}
-		if(bank == 0)
+		if(ch->number == RX_CHANNEL_MAIN)
 			dAutoNotch(dsamples, nSamples, 0, quisk_filter_srate);
 		break;
 	case 9:     // digital mode DGT-IQ at 48 ksps
 		quisk_filter_srate = quisk_demod_srate;
 		if (filter_bandwidth < 19000) {		// No filtering for wide bandwidth
-			for (i = 0; i < nSamples; i++)
-				cSamples[i] = dRxFilterOut(cSamples[i], bank);
-			measure_audio_sum = measure_audio_sum + cSamples[i] * conj(cSamples[i]);
-			measure_audio_count += 1;
+			rx_filter_block(cSamples, nSamples, ch, 0);
+			for (i = 0; i < nSamples; i++) {
+				measure_audio_sum += creal(cSamples[i] * conj(cSamples[i]));
+				measure_audio_count += 1;
+			}
 		}
 		break;
 	}
@@ -1168,10 +1461,15 @@ static int quisk_process_demodulate(complex double * cSamples, double * dsamples
 	return nSamples;
 }
 
-static void process_agc(struct AgcState * dat, complex double * csamples, int count, int is_cpx)
-{
-	int i;
-	double out_magn, buf_magn, dtmp, clip_gain;
+static void process_agc(struct AgcState * dat, complex double * csamples, int count, int is_cpx, int mode)
+{  // The AGC works on a whole block.  It finds the squared envelope of the new samples, then runs
+   // the gain control on the envelope to find the gain for each output sample, and then applies
+   // the gains to the delayed samples.  Square roots are only needed when the gain changes.
+   // The mode is the mode of the channel, as for rxMode.
+	int i, j, n, index, index_read, index_start, is_clipping;
+	double sq, dtmp, clip_gain, out_sq, max_sq, * block;
+	double themax, gain, delta, target_gain;
+	double * pt = (double *)csamples;
 	complex double csample;
 #if DEBUG
 	static int printit=0;
@@ -1185,7 +1483,7 @@ static void process_agc(struct AgcState * dat, complex double * csamples, int co
 		dat->index_read = 0;				// Index to output; and then write a new sample here
 		dat->index_start = 0;				// Start index for measure of maximum sample
 		dat->is_clipping = 0;				// Are we decreasing gain to handle a clipping condition?
-		dat->themax = 1.0;					// Maximum sample in the buffer
+		dat->themax = 1.0;					// Maximum squared sample in the buffer
 		dat->gain = 100;					// Current output gain
 		dat->delta = 0;						// Amount to change dat->gain at each sample
 		dat->target_gain = 100;				// Move to this gain unless we clip
@@ -1194,104 +1492,485 @@ static void process_agc(struct AgcState * dat, complex double * csamples, int co
 			dat->c_samp[i] = 0;
 		return;
 	}
+	if (count > dat->block_size) {
+		if (dat->block)
+			free(dat->block);
+		dat->block_size = count * 2;
+		dat->block = (double *)malloc(dat->block_size * sizeof(double));
+	}
+	block = dat->block;
+	// Find the squared envelope of the new samples
+	if (is_cpx) {
+		for (i = 0; i < count; i++)
+			block[i] = pt[2 * i] * pt[2 * i] + pt[2 * i + 1] * pt[2 * i + 1];
+	}
+	else {
+		for (i = 0; i < count; i++)
+			block[i] = pt[2 * i] * pt[2 * i];
+	}
+	// Run the gain control.  Replace each envelope value with the gain for that output sample.
+	// The state is kept in local variables so the compiler need not reload it after each store.
+	max_sq = AGC_MAX_OUT * AGC_MAX_OUT;
+	index = index_read = dat->index_read;
+	index_start = dat->index_start;
+	is_clipping = dat->is_clipping;
+	themax = dat->themax;
+	gain = dat->gain;
+	delta = dat->delta;
+	target_gain = dat->target_gain;
 	for (i = 0; i < count; i++) {
-		csample = csamples[i];
-		csamples[i] = dat->c_samp[dat->index_read] * dat->gain;		// FIFO output
-		if (is_cpx)
-			out_magn = cabs(csamples[i]);
-		else
-			out_magn = fabs(creal(csamples[i]));
-		//if(dat->is_clipping == 1)
-			//printf("      index %5d  out_magn %.5lf  gain %.2lf  delta  %.5lf\n",dat->index_read, out_magn / CLIP32, dat->gain, dat->delta);
-#if DEBUG
-		if (out_magn > maxout)
-			maxout = out_magn;
-#endif
-		if (out_magn > CLIP32)	{
-			csamples[i] /= out_magn;
-#if DEBUG
-			printf("Clip out_magn %8.5lf  is_clipping %d  index_read %5d  index_start %5d  gain %8.5lf\n",
-				out_magn / CLIP32, dat->is_clipping, dat->index_read, dat->index_start, dat->gain);
-#endif
-		}
-		dat->c_samp[dat->index_read] = csample;		// write new sample at read index
-		if (is_cpx)
-			buf_magn = cabs(csample);
-		else
-			buf_magn = fabs(creal(csample));
-		if (dat->is_clipping == 0) {
-			if (buf_magn * dat->gain > AGC_MAX_OUT) {
-				dat->target_gain = AGC_MAX_OUT / buf_magn;
-				dat->delta = (dat->gain - dat->target_gain) / dat->buf_size;
-				dat->is_clipping = 1;
-				dat->themax = buf_magn;
+		sq = block[i];
+		block[i] = gain;
+		if (is_clipping == 0) {
+			if (sq * gain * gain > max_sq) {
+				target_gain = AGC_MAX_OUT / sqrt(sq);
+				delta = (gain - target_gain) / dat->buf_size;
+				is_clipping = 1;
+				themax = sq;
 				// printf("Start index %5d  buf_magn %10.8lf  target %8.2lf  gain %8.2lf  delta  %8.5lf\n",
-				// 	dat->index_read, buf_magn / CLIP32, dat->target_gain, dat->gain, dat->delta);
-				dat->gain -= dat->delta;
+				// 	index_read, sqrt(sq) / CLIP32, target_gain, gain, delta);
+				gain -= delta;
 			}
-			else if (dat->index_read == dat->index_start) {
-				clip_gain = AGC_MAX_OUT / dat->themax;		// clip gain based on the maximum sample in the buffer
-				if (rxMode == 5)		// mode is FM
-					dat->target_gain = clip_gain;
+			else if (index_read == index_start) {
+				clip_gain = AGC_MAX_OUT / sqrt(themax);		// clip gain based on the maximum sample in the buffer
+				if (mode == 5)		// mode is FM
+					target_gain = clip_gain;
 				else if (agcReleaseGain > clip_gain)
-					dat->target_gain = clip_gain;
+					target_gain = clip_gain;
 				else
-					dat->target_gain = agcReleaseGain;
-				dat->themax = buf_magn;
-				dat->gain = dat->gain * (1.0 - agcTimeRelease) + dat->target_gain * agcTimeRelease;
+					target_gain = agcReleaseGain;
+				themax = sq;
+				gain = gain * (1.0 - agcTimeRelease) + target_gain * agcTimeRelease;
 				// printf("New   index %5d  themax %7.5lf  clip_gain %5.0lf  agcReleaseGain %5.0lf\n",
-				// 	dat->index_start, dat->themax / CLIP32, clip_gain, agcReleaseGain);
+				// 	index_start, sqrt(themax) / CLIP32, clip_gain, agcReleaseGain);
 			}
 			else {
-				if (dat->themax < buf_magn)
-					dat->themax = buf_magn;
-				dat->gain = dat->gain * (1.0 - agcTimeRelease) + dat->target_gain * agcTimeRelease;
+				if (themax < sq)
+					themax = sq;
+				gain = gain * (1.0 - agcTimeRelease) + target_gain * agcTimeRelease;
 			}
 		}
-		else {		// dat->is_clipping == 1;  we are handling a clip condition
-			if (buf_magn > dat->themax) {
-				dat->themax = buf_magn;
-				dat->target_gain = AGC_MAX_OUT / buf_magn;
-				dtmp = (dat->gain - dat->target_gain) / dat->buf_size;	// new value of delta
-				if (dtmp > dat->delta) {
-					dat->delta = dtmp;
-					// printf(" Strt index %5d  buf_magn %10.8lf  target %8.2lf  gain %8.2lf  delta  %8.5lf\n",
-					// 	dat->index_read, buf_magn / CLIP32, dat->target_gain, dat->gain, dat->delta);
-				}
-				else {
-					// printf(" Plus index %5d  buf_magn %10.8lf  target %8.2lf  gain %8.2lf  delta  %8.5lf\n",
-					// 	dat->index_read, buf_magn / CLIP32, dat->target_gain, dat->gain, dat->delta);
-				}
+		else {		// is_clipping == 1;  we are handling a clip condition
+			if (sq > themax) {
+				themax = sq;
+				target_gain = AGC_MAX_OUT / sqrt(sq);
+				dtmp = (gain - target_gain) / dat->buf_size;	// new value of delta
+				if (dtmp > delta)
+					delta = dtmp;
 			}
-			dat->gain -= dat->delta;
-			if (dat->gain <= dat->target_gain) {
-				dat->is_clipping = 0;
-				dat->gain = dat->target_gain;
+			gain -= delta;
+			if (gain <= target_gain) {
+				is_clipping = 0;
+				gain = target_gain;
 				// printf("End   index %5d  buf_magn %10.8lf  target %8.2lf  gain %8.2lf  delta  %8.5lf  themax %10.8lf\n",
-				// 	dat->index_read, buf_magn / CLIP32, dat->target_gain, dat->gain, dat->delta, dat->themax / CLIP32);
-				dat->themax = buf_magn;
-				dat->index_start = dat->index_read;
+				// 	index_read, sqrt(sq) / CLIP32, target_gain, gain, delta, sqrt(themax) / CLIP32);
+				themax = sq;
+				index_start = index_read;
 			}
 		}
-		if (++dat->index_read >= dat->buf_size)
-			dat->index_read = 0;
-#if DEBUG
-		if (printit++ >= quisk_sound_state.playback_rate * 500 / 1000) {
-			printit = 0;
-			dtmp = 20 * log10(maxout / CLIP32);
-			if (dtmp >= 0)
-				clip = "Clip";
+		if (++index_read >= dat->buf_size)
+			index_read = 0;
+	}
+	dat->index_read = index_read;
+	dat->index_start = index_start;
+	dat->is_clipping = is_clipping;
+	dat->themax = themax;
+	dat->gain = gain;
+	dat->delta = delta;
+	dat->target_gain = target_gain;
+	// Output the delayed samples times their gain, and write the new samples into the delay buffer.
+	// The delay buffer is used in runs up to its end, so there is no index test for each sample.
+	// Limit the output to CLIP32.
+	max_sq = (double)CLIP32 * CLIP32;
+	i = 0;
+	while (i < count) {
+		n = dat->buf_size - index;
+		if (n > count - i)
+			n = count - i;
+		for (j = index; j < index + n; j++, i++) {
+			csample = csamples[i];
+			csamples[i] = dat->c_samp[j] * block[i];		// FIFO output
+			dat->c_samp[j] = csample;		// write new sample at read index
+			if (is_cpx)
+				out_sq = pt[2 * i] * pt[2 * i] + pt[2 * i + 1] * pt[2 * i + 1];
 			else
-				clip = "";
-			printf("Out agcGain %5.0lf   target_gain %9.0lf   gain %9.0lf  output %7.2lf %s\n",
-				agcReleaseGain, dat->target_gain, dat->gain, dtmp, clip);
-			maxout = 1;
-		}
+				out_sq = pt[2 * i] * pt[2 * i];
+#if DEBUG
+			if (out_sq > maxout * maxout)
+				maxout = sqrt(out_sq);
+#endif
+			if (out_sq > max_sq) {
+				csamples[i] /= sqrt(out_sq);
+#if DEBUG
+				printf("Clip out_magn %8.5lf  is_clipping %d  index_read %5d  index_start %5d  gain %8.5lf\n",
+					sqrt(out_sq) / CLIP32, dat->is_clipping, dat->index_read, dat->index_start, dat->gain);
 #endif
+			}
+		}
+		index += n;
+		if (index >= dat->buf_size)
+			index = 0;
+	}
+#if DEBUG
+	printit += count;
+	if (printit >= quisk_sound_state.playback_rate * 500 / 1000) {
+		printit = 0;
+		dtmp = 20 * log10(maxout / CLIP32);
+		if (dtmp >= 0)
+			clip = "Clip";
+		else
+			clip = "";
+		printf("Out agcGain %5.0lf   target_gain %9.0lf   gain %9.0lf  output %7.2lf %s\n",
+			agcReleaseGain, dat->target_gain, dat->gain, dtmp, clip);
+		maxout = 1;
 	}
+#endif
 	return;
 }
 
+#define CHANNELIZER_SPACING	48000		// Channel spacing of the channelizer; the output rate is twice this
+#define CHANNELIZER_MAX_K	48			// Maximum number of channels
+
+static struct {		// Polyphase FFT filter bank that splits the samples into evenly spaced channels
+	int K;						// Number of channels, or zero for no channelizer; the decimation is K / 2
+	int taps;					// Number of coefficients in each polyphase branch
+	int sample_rate;			// Sample rate of the design
+	double * coefs;				// Prototype lowpass filter arranged by branch: coefs[p * taps + q] = h[q * K + p]
+	complex double * hist;		// Sample history; the newest sample is last
+	int hist_len;				// Number of samples in hist
+	int hist_size;				// Dimension of hist
+	int next;					// Index in hist of the sample for the next output
+	int odd;					// Is the next output an odd one?
+	fftw_complex * fft_in;		// Outputs of the K branches
+	complex double * out;		// Channel outputs; row m holds channels 0 to K-1
+	int out_rows;				// Dimension of out in rows
+} Channelizer;
+
+// Inverse FFT plans of size K for the channelizer.  These are made in the GUI thread by
+// channelizer_plans(), because the FFTW planner must not run in the sound thread.
+static fftw_plan channelizer_plan[CHANNELIZER_MAX_K + 1];
+
+static void channelizer_plans(int plan_flags)	// Called from the GUI thread
+{  // Make the FFT plans for every even number of channels
+	int K;
+	fftw_complex * in, * out;
+
+	if ( ! use_channelizer || channelizer_plan[CHANNELIZER_MAX_K])
+		return;
+	in = (fftw_complex *)fftw_malloc(CHANNELIZER_MAX_K * sizeof(fftw_complex));
+	out = (fftw_complex *)fftw_malloc(CHANNELIZER_MAX_K * sizeof(fftw_complex));
+	// Each row of out is a separate output of the plan, so the plan must allow unaligned arrays
+	for (K = 4; K <= CHANNELIZER_MAX_K; K += 2)
+		channelizer_plan[K] = fftw_plan_dft_1d(K, in, out, FFTW_BACKWARD, plan_flags | FFTW_UNALIGNED);
+	fftw_free(in);
+	fftw_free(out);
+}
+
+static int channelizer_setup(int sample_rate)
+{  // Design the channelizer for this sample rate.  Return the number of channels, or zero.
+	int i, n, p, q, K, ntaps;
+	double * h, fc, x, beta, dsum;
+
+	if (sample_rate == Channelizer.sample_rate)
+		return Channelizer.K;
+	if (Channelizer.K) {
+		fftw_free(Channelizer.fft_in);
+		free(Channelizer.coefs);
+		free(Channelizer.hist);
+		free(Channelizer.out);
+		Channelizer.hist = Channelizer.out = NULL;
+		Channelizer.hist_size = Channelizer.out_rows = 0;
+	}
+	Channelizer.sample_rate = sample_rate;
+	Channelizer.K = 0;
+	// The bank is oversampled by two, so K must be even.  With K == 2 there would be no decimation.
+	if (sample_rate % CHANNELIZER_SPACING != 0)
+		return 0;
+	K = sample_rate / CHANNELIZER_SPACING;
+	if (K < 4 || K > CHANNELIZER_MAX_K || K % 2 != 0 || ! channelizer_plan[K])
+		return 0;
+	// The outputs are at 96 ksps.  The prototype lowpass filter has a pass band of 40 kHz and a stop
+	// band at 56 kHz, so the aliases from decimation by K / 2 stay outside the 40 kHz pass band.  A
+	// signal up to 24 kHz from the channel center and 32 kHz wide is in the pass band.
+	beta = 7.86;		// Kaiser window design for about 80 dB of stop band attenuation
+	ntaps = (int)(72.0 / (2.285 * 2.0 * M_PI * 16000.0 / sample_rate)) + 1;
+	h = (double *)malloc(ntaps * sizeof(double));
+	fc = 48000.0 / sample_rate;
+	dsum = 0;
+	for (i = 0; i < ntaps; i++) {
+		x = i - (ntaps - 1) / 2.0;
+		h[i] = x == 0 ? 2.0 * fc : sin(2.0 * M_PI * fc * x) / (M_PI * x);
+		x = 2.0 * i / (ntaps - 1) - 1.0;
+		h[i] *= BesselI0(beta * sqrt(1.0 - x * x)) / BesselI0(beta);
+		dsum += h[i];
+	}
+	for (i = 0; i < ntaps; i++)		// unity gain at DC
+		h[i] /= dsum;
+	Channelizer.taps = (ntaps + K - 1) / K;
+	Channelizer.coefs = (double *)malloc(K * Channelizer.taps * sizeof(double));
+	for (p = 0; p < K; p++) {
+		for (q = 0; q < Channelizer.taps; q++) {
+			n = q * K + p;
+			Channelizer.coefs[p * Channelizer.taps + q] = n < ntaps ? h[n] : 0;
+		}
+	}
+	free(h);
+	// The history starts with enough zeros for the first output
+	Channelizer.hist_size = K * Channelizer.taps * 2;
+	Channelizer.hist = (complex double *)malloc(Channelizer.hist_size * sizeof(complex double));
+	Channelizer.hist_len = Channelizer.next = K * Channelizer.taps - 1;
+	for (i = 0; i < Channelizer.hist_len; i++)
+		Channelizer.hist[i] = 0;
+	Channelizer.odd = 0;
+	Channelizer.out_rows = 64;
+	Channelizer.out = (complex double *)malloc(Channelizer.out_rows * K * sizeof(complex double));
+	Channelizer.fft_in = (fftw_complex *)fftw_malloc(K * sizeof(fftw_complex));
+	Channelizer.K = K;
+	return K;
+}
+
+static int channelizer_run(complex double * cSamples, int nSamples)
+{  // Split the samples into Channelizer.K channels.  Return the number of rows in Channelizer.out.
+   // Channel k is the signal at k * CHANNELIZER_SPACING tuned to zero, filtered and decimated by K / 2.
+   // The cost is one polyphase filter of "taps" coefficients per branch plus one FFT of size K
+   // for each K / 2 input samples.
+	int i, k, p, q, K, D, taps, rows, drop;
+	double * cf;
+	complex double acc, * x, * row;
+
+	K = Channelizer.K;
+	D = K / 2;
+	taps = Channelizer.taps;
+	if (Channelizer.hist_len + nSamples > Channelizer.hist_size) {
+		Channelizer.hist_size = Channelizer.hist_len + nSamples * 2;
+		Channelizer.hist = (complex double *)realloc(Channelizer.hist, Channelizer.hist_size * sizeof(complex double));
+	}
+	memcpy(Channelizer.hist + Channelizer.hist_len, cSamples, nSamples * sizeof(complex double));
+	Channelizer.hist_len += nSamples;
+	rows = (Channelizer.hist_len - Channelizer.next + D - 1) / D;
+	if (rows > Channelizer.out_rows) {
+		Channelizer.out_rows = rows * 2;
+		free(Channelizer.out);
+		Channelizer.out = (complex double *)malloc(Channelizer.out_rows * K * sizeof(complex double));
+	}
+	rows = 0;
+	while (Channelizer.next < Channelizer.hist_len) {
+		for (p = 0; p < K; p++) {
+			cf = Channelizer.coefs + p * taps;
+			x = Channelizer.hist + Channelizer.next - p;
+			acc = 0;
+			for (q = 0; q < taps; q++)
+				acc += cf[q] * x[-q * K];
+			Channelizer.fft_in[p] = acc;
+		}
+		row = Channelizer.out + rows * K;
+		fftw_execute_dft(channelizer_plan[K], Channelizer.fft_in, row);
+		// Advancing by K / 2 samples rotates channel k by pi * k; undo this for the odd outputs
+		if (Channelizer.odd)
+			for (k = 1; k < K; k += 2)
+				row[k] = -row[k];
+		Channelizer.odd = ! Channelizer.odd;
+		rows++;
+		Channelizer.next += D;
+	}
+	// Keep the samples needed for the next output
+	drop = Channelizer.next - (K * taps - 1);
+	for (i = drop; i < Channelizer.hist_len; i++)
+		Channelizer.hist[i - drop] = Channelizer.hist[i];
+	Channelizer.hist_len -= drop;
+	Channelizer.next -= drop;
+	return rows;
+}
+
+static void rx_channel_init(struct rx_channel * ch)
+{  // Initialize the filters and state of a receive channel
+	ch->number = ch - rx_channels;
+	if ( ! ch->initialized) {
+		quisk_process_decimate(NULL, 0, ch);
+		quisk_process_demodulate(NULL, NULL, 0, ch);
+		ch->initialized = 1;
+	}
+	ch->filter.taps = -1;		// design the Rx filter again at the next block
+	ch->tuner.phase = 0;
+	ch->frac.dindex = 1;
+	ch->frac.c0 = ch->frac.c1 = ch->frac.c2 = 0;
+	ch->play_len = 0;
+	ch->play_ready = 0;
+	if (ch->agc.c_samp)
+		free(ch->agc.c_samp);
+	if (ch->agc.block)
+		free(ch->agc.block);
+	memset(&ch->agc, 0, sizeof(struct AgcState));
+}
+
+static int rx_channels_in_use(void)
+{  // Return 1 if any extra receive channel is not off
+	int i;
+
+	for (i = RX_CHANNEL_SPLIT + 1; i < QUISK_MAX_RX_CHANNELS; i++)
+		if (rx_channels[i].state != RX_CHANNEL_OFF)
+			return 1;
+	return 0;
+}
+
+static void process_rx_channel(struct rx_channel * ch, complex double * cInput, int nInput,
+		int bank_rows, complex double * cOut, int nOut)
+{  // Tune, filter and demodulate an extra receive channel.  Then mix its audio into cOut, or record it.
+   // If bank_rows >= 0, the channel is taken from the Channelizer output instead of cInput.
+	int i, k, n, interp, size, spacing, srate;
+	int decim_srate, demod_srate, filter_srate, audio_count;
+	double d, tune, audio_sum, audio, double_filter_decim;
+
+	if (ch->state == RX_CHANNEL_OPENING) {
+		rx_channel_init(ch);
+		if (ch->sink == RX_SINK_FILE && ! quisk_record_channel(ch->number, NULL, -1, ch->file_name)) {
+			printf ("Failure to open file %s for receive channel %d\n", ch->file_name, ch->number);
+			ch->close_request = 0;
+			quisk_barrier();
+			ch->state = RX_CHANNEL_OFF;
+			return;
+		}
+		ch->state = RX_CHANNEL_ON;
+	}
+	if (ch->close_request) {
+		if (ch->sink == RX_SINK_FILE)
+			quisk_record_channel(ch->number, NULL, -2, NULL);	// Close file
+		ch->close_request = 0;
+		quisk_barrier();		// the GUI thread may re-use the channel when it is off
+		ch->state = RX_CHANNEL_OFF;
+		return;
+	}
+	size = nInput * (2 + quisk_sound_state.playback_rate / quisk_sound_state.sample_rate);
+	if (size > ch->size_samples) {
+		if (ch->cSamples)
+			free(ch->cSamples);
+		if (ch->dsamples)
+			free(ch->dsamples);
+		ch->size_samples = size;
+		ch->cSamples = (complex double *)malloc(size * sizeof(complex double));
+		ch->dsamples = (double *)malloc(size * sizeof(double));
+	}
+	if (multiple_sample_rates == 0)
+		tune = ch->freq;
+	else
+		tune = ch->freq + vfo_screen - vfo_audio;
+	if (bank_rows >= 0) {	// Take the nearest channel, and tune the remainder at the low sample rate
+		spacing = quisk_sound_state.sample_rate / Channelizer.K;
+		srate = spacing * 2;
+		k = (int)floor(tune / spacing + 0.5);
+		tune -= k * spacing;
+		if (k < 0)
+			k += Channelizer.K;
+		n = bank_rows;
+		for (i = 0; i < n; i++)
+			ch->cSamples[i] = Channelizer.out[i * Channelizer.K + k];
+	}
+	else {
+		srate = quisk_sound_state.sample_rate;
+		n = nInput;
+		memcpy(ch->cSamples, cInput, nInput * sizeof(complex double));
+	}
+	// Tune the channel to frequency
+	if (tune != 0) {
+		quisk_nco_set(&ch->tuner, -tune, srate);
+		quisk_nco_mix(&ch->tuner, ch->cSamples, n, 1.0);
+	}
+	// The sample rates and audio measurement belong to the main channel
+	decim_srate = quisk_decim_srate;
+	demod_srate = quisk_demod_srate;
+	filter_srate = quisk_filter_srate;
+	audio_sum = measure_audio_sum;
+	audio_count = measure_audio_count;
+	audio = measured_audio;
+	if (bank_rows >= 0) {	// Decimate the 96 ksps channel to 48 ksps as quisk_process_decimate() does
+		if (ch->mode == 7 || ch->mode == 8 || ch->mode == 9)
+			n = quisk_cDecimate(ch->cSamples, n, &ch->decim.filtDecim48to24, 2);
+		else
+			n = quisk_cDecim2HB45(ch->cSamples, n, &ch->decim.HalfBand1);
+		quisk_decim_srate = srate / 2;
+	}
+	else {
+		n = quisk_process_decimate(ch->cSamples, n, ch);
+	}
+	n = quisk_process_demodulate(ch->cSamples, ch->dsamples, n, ch);
+	for (i = 0; i < n; i++)
+		ch->cSamples[i] = ch->dsamples[i];
+	if (quisk_decim_srate != 48000) {
+		double_filter_decim = quisk_decim_srate / 48000.0;
+		n = cFracDecim(ch->cSamples, n, double_filter_decim, &ch->frac);
+		quisk_demod_srate = (int)(quisk_demod_srate / double_filter_decim + 0.5);
+	}
+	quisk_demod_srate = ((quisk_demod_srate + 12000) / 24000) * 24000;
+	interp = quisk_sound_state.playback_rate / quisk_demod_srate;
+	if (interp > 1) {
+		n = quisk_cInterp2HB45(ch->cSamples, n, &ch->HalfBand7);
+		interp /= 2;
+	}
+	if (interp > 1) {
+		n = quisk_cInterp2HB45(ch->cSamples, n, &ch->HalfBand8);
+		interp /= 2;
+	}
+	if (interp > 1) {
+		n = quisk_cInterp2HB45(ch->cSamples, n, &ch->HalfBand9);
+		interp /= 2;
+	}
+	quisk_decim_srate = decim_srate;
+	quisk_demod_srate = demod_srate;
+	quisk_filter_srate = filter_srate;
+	measure_audio_sum = audio_sum;
+	measure_audio_count = audio_count;
+	measured_audio = audio;
+	process_agc(&ch->agc, ch->cSamples, n, 0, ch->mode);
+	switch (ch->sink) {
+	case RX_SINK_PLAY:		// Add the audio to both play channels
+		// The number of samples n varies from block to block, so keep the audio in a fifo and
+		// take nOut samples.  Wait for a margin of nOut / 4 samples before starting or after a gap.
+		if (ch->play_len + n > ch->play_size) {
+			ch->play_size = (ch->play_len + n) * 2;
+			ch->play = (double *)realloc(ch->play, ch->play_size * sizeof(double));
+		}
+		for (i = 0; i < n; i++)
+			ch->play[ch->play_len + i] = creal(ch->cSamples[i]);
+		ch->play_len += n;
+		if ( ! ch->play_ready) {
+			if (ch->play_len < nOut + nOut / 4)
+				break;
+			ch->play_ready = 1;
+		}
+		n = ch->play_len < nOut ? ch->play_len : nOut;
+		if (n < nOut)		// not enough audio; wait for the margin again
+			ch->play_ready = 0;
+		for (i = 0; i < n; i++) {
+			d = ch->play[i] * ch->volume;
+			cOut[i] += d + I * d;
+		}
+		if (ch->play_len - n > nOut)		// too much audio; limit the delay to the margin
+			n = ch->play_len - nOut / 4;
+		ch->play_len -= n;
+		memmove(ch->play, ch->play + n, ch->play_len * sizeof(double));
+		break;
+	case RX_SINK_FILE:
+		quisk_record_channel(ch->number, ch->cSamples, n, NULL);
+		break;
+	}
+}
+
+// Time spent in each stage of quisk_process_samples(), for the DSP benchmark
+enum {DSP_STAGE_TUNE, DSP_STAGE_DECIMATE, DSP_STAGE_DEMODULATE, DSP_STAGE_INTERPOLATE,
+	DSP_STAGE_AGC, DSP_STAGE_CHANNELS, DSP_STAGE_COUNT};
+static double dsp_stage_time[DSP_STAGE_COUNT];		// Total seconds in each stage
+static double dsp_stage_mark;				// Time at the end of the previous stage
+
+static void dsp_stage_end(int stage)
+{  // Add the time since the last mark to the stage total; a stage < 0 just sets the mark
+	double tm;
+
+	tm = QuiskTimeHiRes();
+	if (stage >= 0)
+		dsp_stage_time[stage] += tm - dsp_stage_mark;
+	dsp_stage_mark = tm;
+}
+
 int quisk_process_samples(complex double * cSamples, int nSamples)
 {
 // Called when samples are available.
@@ -1299,27 +1978,22 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 	int i, n, nout, is_key_down, interp;
 	double d, di, tune;
 	double double_filter_decim;
-	complex double phase;
-	int orig_nSamples;
+	int orig_nSamples, rx_extra, bank_rows;
 	fft_data * ptFFT;
 
 	static int size_dsamples = 0;		// Current dimension of dsamples, dsamples2, orig_cSamples
 	static double * dsamples = NULL;
 	static double * dsamples2 = NULL;
 	static complex double * orig_cSamples = NULL;
-	static complex double rxTuneVector = 1;
-	static complex double txTuneVector = 1;
-	static complex double sidetoneVector = BIG_VOLUME;
+	static complex double * rx_input = NULL;	// Input samples for the extra channels
 	static double dOutCounter = 0;		// Cumulative net output samples for sidetone etc.
 	static int sidetoneIsOn = 0;		// The status of the sidetone
 	static double sidetoneEnvelope;		// Shape the rise and fall times of the sidetone
 	static double keyupEnvelope = 1.0;	// Shape the rise time on key up
 	static int playSilence;
 	static int is_squelch = 0;		// Are we squelched?
-	static struct quisk_cHB45Filter HalfBand7 = {NULL, 0, 0};
-	static struct quisk_cHB45Filter HalfBand8 = {NULL, 0, 0};
-	static struct quisk_cHB45Filter HalfBand9 = {NULL, 0, 0};
-	static struct AgcState Agc1 = {0}, Agc2 = {0};
+	struct rx_channel * chMain = rx_channels + RX_CHANNEL_MAIN;
+	struct rx_channel * chSplit = rx_channels + RX_CHANNEL_SPLIT;
 
 #if DEBUG
 	static int printit;
@@ -1343,10 +2017,13 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 			free(dsamples2);
 		if (orig_cSamples)
 			free(orig_cSamples);
+		if (rx_input)
+			free(rx_input);
 		size_dsamples = nSamples * 2;
 		dsamples = (double *)malloc(size_dsamples * sizeof(double));
 		dsamples2 = (double *)malloc(size_dsamples * sizeof(double));
 		orig_cSamples = (complex double *)malloc(size_dsamples * sizeof(complex double));
+		rx_input = (complex double *)malloc(size_dsamples * sizeof(complex double));
 	}
 	is_key_down = quisk_transmit_mode || quisk_is_key_down();
 	orig_nSamples = nSamples;
@@ -1364,7 +2041,7 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 			if (! sidetoneIsOn) {			// turn on sidetone
 				sidetoneIsOn = 1;
 				sidetoneEnvelope = 0;
-				sidetoneVector = BIG_VOLUME;
+				sidetoneOsc.phase = 0;
 			}
 			for (i = 0 ; i < nout; i++) {
 				if (sidetoneEnvelope < 1.0) {
@@ -1372,9 +2049,8 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 					if (sidetoneEnvelope > 1.0)
 						sidetoneEnvelope = 1.0;
 				}
-				d = creal(sidetoneVector) * sidetoneVolume * sidetoneEnvelope;
+				d = BIG_VOLUME * creal(quisk_nco_next(&sidetoneOsc)) * sidetoneVolume * sidetoneEnvelope;
 				cSamples[i] = d + I * d;
-				sidetoneVector *= sidetonePhase;
 			}
 		}
 		else {			// Otherwise play silence
@@ -1396,9 +2072,8 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 				sidetoneEnvelope = 0;
 				break;		// sidetone is zero
 			}
-			d = creal(sidetoneVector) * sidetoneVolume * sidetoneEnvelope;
+			d = BIG_VOLUME * creal(quisk_nco_next(&sidetoneOsc)) * sidetoneVolume * sidetoneEnvelope;
 			cSamples[i] = d + I * d;
-			sidetoneVector *= sidetonePhase;
 		}
 		for ( ; i < nout; i++) {	// continue with playSilence, even if zero
 			cSamples[i] = 0;
@@ -1418,6 +2093,7 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 	}
 	// We are done replacing sound with a sidetone or silence.  Filter and
 	// demodulate the samples as radio sound.
+	dsp_stage_end(-1);
 
 	// Add a test tone to the data
 	if (testtonePhase)
@@ -1435,7 +2111,7 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 	// Put samples into the fft input array.
 	// Thanks to WB4JFI for the code to add a third FFT buffer, July 2010.
 	// Changed to multiple FFTs May 2014.
-	if (multiple_sample_rates == 0) {
+	if (multiple_sample_rates == 0 && fft_samples) {
 	    ptFFT = fft_data_array + fft_data_index;
 	    for (i = 0; i < nSamples; i++) {
 		    ptFFT->samples[ptFFT->index] = cSamples[i];
@@ -1446,6 +2122,7 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 			    if (fft_data_array[n].filled == 0) {				// Is the next buffer empty?
 				    fft_data_array[n].index = 0;
 				    fft_data_array[n].block = 0;
+				    quisk_barrier();		// write the samples before the filled flag
 				    fft_data_array[fft_data_index].filled = 1;	// Mark the previous buffer ready.
 				    fft_data_index = n;							// Write samples into the new buffer.
 				    ptFFT = fft_data_array + fft_data_index;
@@ -1461,22 +2138,24 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 	// No need to tune and demodulate if we don't play sound
 	if (quisk_sound_state.dev_play_name[0] == 0)
 		return 0;
+	// Save the samples for the extra receive channels
+	rx_extra = rx_channels_in_use();
+	if (rx_extra)
+		memcpy(rx_input, cSamples, nSamples * sizeof(complex double));
 	// Tune the data to frequency
 	if (multiple_sample_rates == 0)
         tune = rx_tune_freq;
     else
         tune = rx_tune_freq + vfo_screen - vfo_audio;
 	if (tune != 0) {
-		phase = cexp((I * -2.0 * M_PI * tune) / quisk_sound_state.sample_rate);
-		for (i = 0; i < nSamples; i++) {
-			cSamples[i] *= rxTuneVector;
-			rxTuneVector *= phase;
-		}
+		quisk_nco_set(&chMain->tuner, -tune, quisk_sound_state.sample_rate);
+		quisk_nco_mix(&chMain->tuner, cSamples, nSamples, 1.0);
 	}
 
 	if (rxMode == 6) {		// External filter and demodulate
 		d = (double)quisk_sound_state.sample_rate / quisk_sound_state.playback_rate;	// total decimation needed
 		nSamples = quisk_extern_demod(cSamples, nSamples, d);
+		dsp_stage_end(DSP_STAGE_DEMODULATE);
 		goto start_agc;
 	}
 
@@ -1500,8 +2179,10 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 			levelA = d;
 	}
 #endif
+	dsp_stage_end(DSP_STAGE_TUNE);
 
-	nSamples = quisk_process_decimate(cSamples, nSamples, 0);
+	nSamples = quisk_process_decimate(cSamples, nSamples, chMain);
+	dsp_stage_end(DSP_STAGE_DECIMATE);
 
 #if DEBUG
 	for (i = 0; i < nSamples; i++) {
@@ -1514,20 +2195,17 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 	if (measure_freq_mode)
 		measure_freq(cSamples, nSamples, quisk_decim_srate);
 
-	nSamples = quisk_process_demodulate(cSamples, dsamples, nSamples, 0);
+	nSamples = quisk_process_demodulate(cSamples, dsamples, nSamples, chMain);
 
 	if (rxMode == 9) {
 		;		// This mode is already stereo
 	}
 	else if (split_rxtx) {		// Demodulate a second channel
-		phase = cexp((I * -2.0 * M_PI * quisk_tx_tune_freq) / quisk_sound_state.sample_rate);
 		// Tune the second channel to frequency
-		for (i = 0; i < orig_nSamples; i++) {
-			orig_cSamples[i] *= txTuneVector;
-			txTuneVector *= phase;
-		}
-		n = quisk_process_decimate(orig_cSamples, orig_nSamples, 1);
-		n = quisk_process_demodulate(orig_cSamples, dsamples2, n, 1);
+		quisk_nco_set(&chSplit->tuner, -quisk_tx_tune_freq, quisk_sound_state.sample_rate);
+		quisk_nco_mix(&chSplit->tuner, orig_cSamples, orig_nSamples, 1.0);
+		n = quisk_process_decimate(orig_cSamples, orig_nSamples, chSplit);
+		n = quisk_process_demodulate(orig_cSamples, dsamples2, n, chSplit);
 		// We assume that n == nSamples
 		switch(split_rxtx) {
 		default:
@@ -1568,10 +2246,12 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 		}
 	}
 
+	dsp_stage_end(DSP_STAGE_DEMODULATE);
+
 	// Perhaps decimate by an additional fraction
 	if (quisk_decim_srate != 48000) {
 		double_filter_decim = quisk_decim_srate / 48000.0;
-		nSamples = cFracDecim(cSamples, nSamples, double_filter_decim);
+		nSamples = cFracDecim(cSamples, nSamples, double_filter_decim, &chMain->frac);
 		quisk_demod_srate = (int)(quisk_demod_srate / double_filter_decim + 0.5);
 	}
 
@@ -1580,37 +2260,38 @@ int quisk_process_samples(complex double * cSamples, int nSamples)
 	quisk_demod_srate = ((quisk_demod_srate + 12000) / 24000) * 24000;
 	interp = quisk_sound_state.playback_rate / quisk_demod_srate;
 	if (interp > 1) {
-		nSamples = quisk_cInterp2HB45(cSamples, nSamples, &HalfBand7);
+		nSamples = quisk_cInterp2HB45(cSamples, nSamples, &chMain->HalfBand7);
 		interp /= 2;
 	}
 	if (interp > 1) {
-		nSamples = quisk_cInterp2HB45(cSamples, nSamples, &HalfBand8);
+		nSamples = quisk_cInterp2HB45(cSamples, nSamples, &chMain->HalfBand8);
 		interp /= 2;
 	}
 	if (interp > 1) {
-		nSamples = quisk_cInterp2HB45(cSamples, nSamples, &HalfBand9);
+		nSamples = quisk_cInterp2HB45(cSamples, nSamples, &chMain->HalfBand9);
 		interp /= 2;
 	}
 	if (interp != 1)
 		printf ("Failure in quisk.c in integer interpolation\n");
+	dsp_stage_end(DSP_STAGE_INTERPOLATE);
 
 	// Find the peak signal amplitude
 start_agc:
 	if (rxMode == 6 || rxMode == 9) {		// DGT-IQ stereo sound
-		process_agc(&Agc1, cSamples, nSamples, 1);
+		process_agc(&chMain->agc, cSamples, nSamples, 1, rxMode);
 	}
 	else if (split_rxtx) {		// separate AGC for left and right channels
 		for (i = 0; i < nSamples; i++) {
 			orig_cSamples[i] = cimag(cSamples[i]);
 			cSamples[i] = creal(cSamples[i]);
 		}
-		process_agc(&Agc1, cSamples, nSamples, 0);
-		process_agc(&Agc2, orig_cSamples, nSamples, 0);
+		process_agc(&chMain->agc, cSamples, nSamples, 0, rxMode);
+		process_agc(&chSplit->agc, orig_cSamples, nSamples, 0, rxMode);
 		for (i = 0; i < nSamples; i++)
 			cSamples[i] = creal(cSamples[i]) + I * creal(orig_cSamples[i]);
 	}
 	else {					// monophonic sound
-		process_agc(&Agc1, cSamples, nSamples, 0);
+		process_agc(&chMain->agc, cSamples, nSamples, 0, rxMode);
 	}
 #if DEBUG
 	if (printit) {
@@ -1648,6 +2329,17 @@ start_agc:
 			cSamples[i] *= keyupEnvelope;
 		}
 	}
+	dsp_stage_end(DSP_STAGE_AGC);
+	// Demodulate the extra receive channels, and mix or record their audio
+	if (rx_extra) {
+		bank_rows = -1;
+		if (use_channelizer && channelizer_setup(quisk_sound_state.sample_rate))
+			bank_rows = channelizer_run(rx_input, orig_nSamples);
+		for (i = RX_CHANNEL_SPLIT + 1; i < QUISK_MAX_RX_CHANNELS; i++)
+			if (rx_channels[i].state != RX_CHANNEL_OFF)
+				process_rx_channel(rx_channels + i, rx_input, orig_nSamples, bank_rows, cSamples, nSamples);
+		dsp_stage_end(DSP_STAGE_CHANNELS);
+	}
 	if (quisk_record_state == RECORD_RADIO && ! is_squelch)
 		quisk_tmp_record(cSamples, nSamples, 1.0);		// save radio sound
 	if (quisk_record_state == PLAYBACK)
@@ -1705,11 +2397,176 @@ static PyObject * get_filter_rate(PyObject * self, PyObject * args)
 	if (!PyArg_ParseTuple (args, ""))
 		return NULL;
 	// run some fake data through the filters to calculate the rates
-	quisk_process_decimate(cSamples, 0, 0);
-	quisk_process_demodulate(cSamples, dsamples, 0, 0);
+	quisk_process_decimate(cSamples, 0, rx_channels + RX_CHANNEL_MAIN);
+	quisk_process_demodulate(cSamples, dsamples, 0, rx_channels + RX_CHANNEL_MAIN);
 	return PyInt_FromLong(quisk_filter_srate);
 }
 
+// The DSP benchmark runs quisk_process_samples() without hardware or a sound card.
+// It must not be used while the radio is running.
+static struct {
+	int active;
+	int sample_rate;		// saved state to restore at the end
+	int playback_rate;
+	int rxMode;
+	int rx_tune_freq;
+	char dev_play_name[QUISK_SC_SIZE];
+} Benchmark;
+
+static PyObject * set_benchmark(PyObject * self, PyObject * args)
+{  // Set up the DSP benchmark for a sample rate and mode; a sample_rate of zero ends the benchmark.
+	int i, sample_rate, mode;
+
+	if (!PyArg_ParseTuple (args, "ii", &sample_rate, &mode))
+		return NULL;
+	if (pyApp) {
+		PyErr_SetString (QuiskError, "The benchmark can not run with the radio");
+		return NULL;
+	}
+	if (sample_rate <= 0) {		// restore the saved state
+		if (Benchmark.active) {
+			quisk_sound_state.sample_rate = Benchmark.sample_rate;
+			quisk_sound_state.playback_rate = Benchmark.playback_rate;
+			rxMode = Benchmark.rxMode;
+			rx_tune_freq = Benchmark.rx_tune_freq;
+			strncpy(quisk_sound_state.dev_play_name, Benchmark.dev_play_name, QUISK_SC_SIZE);
+			Benchmark.active = 0;
+		}
+		rx_channels[RX_CHANNEL_MAIN].mode = rx_channels[RX_CHANNEL_SPLIT].mode = rxMode;
+		Py_INCREF (Py_None);
+		return Py_None;
+	}
+	if (mode < 0 || mode > 9) {
+		PyErr_SetString (QuiskError, "The benchmark mode must be 0 to 9");
+		return NULL;
+	}
+	if ( ! Benchmark.active) {
+		Benchmark.sample_rate = quisk_sound_state.sample_rate;
+		Benchmark.playback_rate = quisk_sound_state.playback_rate;
+		Benchmark.rxMode = rxMode;
+		Benchmark.rx_tune_freq = rx_tune_freq;
+		strncpy(Benchmark.dev_play_name, quisk_sound_state.dev_play_name, QUISK_SC_SIZE);
+		Benchmark.active = 1;
+	}
+	channelizer_plans(FFTW_MEASURE);
+	rx_fft_plans(FFTW_MEASURE);
+	quisk_sound_state.sample_rate = sample_rate;
+	quisk_sound_state.playback_rate = 48000;
+	strncpy(quisk_sound_state.dev_play_name, "benchmark", QUISK_SC_SIZE);
+	rxMode = mode;
+	rx_tune_freq = 10000;		// exercise the tuning
+	for (i = 0; i <= RX_CHANNEL_SPLIT; i++) {
+		rx_channel_init(rx_channels + i);
+		rx_channels[i].mode = mode;
+	}
+	Py_INCREF (Py_None);
+	return Py_None;
+}
+
+static PyObject * benchmark(PyObject * self, PyObject * args)
+{  // Run sample blocks through quisk_process_samples() and return a dictionary of timing results.
+   // The samples are a string of float32 I/Q pairs with full scale 1.0, or synthetic samples.
+	int i, k, block, nsrc, iq_bytes, sample_rate;
+	long total, nin, nout;
+	double seconds, elapsed, tm, d, ns;
+	const char * iq_data;
+	float * fpt;
+	complex double * src, * work, phase1, phase2, vec1, vec2;
+
+	block = 0;
+	iq_data = NULL;
+	iq_bytes = 0;
+	if (!PyArg_ParseTuple (args, "d|is#", &seconds, &block, &iq_data, &iq_bytes))
+		return NULL;
+	if ( ! Benchmark.active) {
+		PyErr_SetString (QuiskError, "Call set_benchmark() before benchmark()");
+		return NULL;
+	}
+	sample_rate = quisk_sound_state.sample_rate;
+	if (block <= 0)
+		block = sample_rate / 200;		// 5 milliseconds, the usual data_poll_usec
+	total = (long)(seconds * sample_rate);
+	if (total < block)
+		total = block;
+	if (iq_data) {
+		nsrc = iq_bytes / (2 * sizeof(float));
+		if (nsrc < 1) {
+			PyErr_SetString (QuiskError, "The benchmark I/Q data is too short");
+			return NULL;
+		}
+	}
+	else {
+		nsrc = sample_rate / 10;
+		if (nsrc < block)
+			nsrc = block;
+	}
+	src = (complex double *)malloc(nsrc * sizeof(complex double));
+	work = (complex double *)malloc((block * 2 + 64) * sizeof(complex double));
+	if ( ! src || ! work) {
+		if (src)
+			free(src);
+		if (work)
+			free(work);
+		return PyErr_NoMemory();
+	}
+	if (iq_data) {
+		fpt = (float *)iq_data;
+		for (i = 0; i < nsrc; i++)
+			src[i] = (fpt[2 * i] + I * fpt[2 * i + 1]) * CLIP32;
+	}
+	else {		// a strong and a weak signal near the tuning frequency, and noise
+		phase1 = cexp((I * 2.0 * M_PI * (rx_tune_freq + 700)) / sample_rate);
+		phase2 = cexp((I * 2.0 * M_PI * (rx_tune_freq - 1900)) / sample_rate);
+		vec1 = CLIP32 * 0.1;
+		vec2 = CLIP32 * 0.001;
+		srand(1);
+		for (i = 0; i < nsrc; i++) {
+			d = CLIP32 * 1e-5;
+			src[i] = vec1 + vec2 + d * ((double)rand() / RAND_MAX - 0.5) + I * d * ((double)rand() / RAND_MAX - 0.5);
+			vec1 *= phase1;
+			vec2 *= phase2;
+		}
+	}
+	for (i = 0; i < DSP_STAGE_COUNT; i++)
+		dsp_stage_time[i] = 0;
+	nin = nout = 0;
+	elapsed = 0;
+	k = 0;
+	Py_BEGIN_ALLOW_THREADS
+	while (nin < total) {
+		for (i = 0; i < block; i++) {
+			work[i] = src[k];
+			if (++k >= nsrc)
+				k = 0;
+		}
+		tm = QuiskTimeHiRes();
+		nout += quisk_process_samples(work, block);
+		elapsed += QuiskTimeHiRes() - tm;
+		nin += block;
+	}
+	Py_END_ALLOW_THREADS
+	free(src);
+	free(work);
+	if (elapsed <= 0)
+		elapsed = 1e-9;
+	ns = 1e9 / nin;
+	return Py_BuildValue("{s:i,s:i,s:l,s:l,s:d,s:d,s:d,s:d,s:d,s:d,s:d,s:d,s:d,s:d}",
+		"sample_rate", sample_rate,
+		"mode", rxMode,
+		"samples", nin,
+		"output", nout,
+		"seconds", elapsed,
+		"samples_per_sec", nin / elapsed,
+		"realtime", (double)nin / sample_rate / elapsed,
+		"ns_per_sample", elapsed * ns,
+		"tune", dsp_stage_time[DSP_STAGE_TUNE] * ns,
+		"decimate", dsp_stage_time[DSP_STAGE_DECIMATE] * ns,
+		"demodulate", dsp_stage_time[DSP_STAGE_DEMODULATE] * ns,
+		"interpolate", dsp_stage_time[DSP_STAGE_INTERPOLATE] * ns,
+		"agc", dsp_stage_time[DSP_STAGE_AGC] * ns,
+		"channels", dsp_stage_time[DSP_STAGE_CHANNELS] * ns);
+}
+
 static PyObject * get_smeter(PyObject * self, PyObject * args)
 {
 	if (!PyArg_ParseTuple (args, ""))
@@ -1794,10 +2651,101 @@ static PyObject * close_rx_udp(PyObject * self, PyObject * args)
 	return Py_None;
 }
 
+#ifdef MSG_WAITFORONE
+#define QUISK_HAVE_RECVMMSG	1		// Read several UDP blocks with one system call
+#endif
+
+static void rx_udp_sequence(unsigned char seq, unsigned char * seq0)
+{  // Check the block sequence number seq against the expected number seq0, and count lost and reordered blocks.
+	unsigned char diff;
+
+	if (seq == *seq0) {
+		*seq0 = seq + 1;		// Next expected sequence number
+		return;
+	}
+#if DEBUG_IO
+	printf("read_rx_udp: Bad sequence want %3d got %3d\n", (unsigned int)*seq0, (unsigned int)seq);
+#endif
+	quisk_sound_state.read_error++;
+	diff = seq - *seq0;
+	if (diff >= 256 - RX_UDP_LATE) {	// an old block arrived late; keep the expected number
+		rx_udp_reordered++;
+	}
+	else {		// blocks were lost
+		rx_udp_lost += diff;
+		*seq0 = seq + 1;
+	}
+}
+
+static int rx_udp_read_blocks(int max_blocks)
+{  // Wait for UDP blocks, and then read all blocks that are available up to max_blocks.
+   // The blocks are placed in rx_udp_blocks.  Return the number of blocks, or zero for timeout or error.
+	int i, n;
+	struct timeval tm_wait;
+	fd_set fds;
+#ifdef QUISK_HAVE_RECVMMSG
+	static struct mmsghdr msgs[RX_UDP_RING];
+	static struct iovec iovecs[RX_UDP_RING];
+#endif
+
+	if (max_blocks > RX_UDP_RING)
+		max_blocks = RX_UDP_RING;
+	else if (max_blocks < 1)
+		max_blocks = 1;
+	tm_wait.tv_sec = 0;
+	tm_wait.tv_usec = 100000; // Linux seems to have problems with very small time intervals
+	FD_ZERO (&fds);
+	FD_SET (rx_udp_socket, &fds);
+	i = select (rx_udp_socket + 1, &fds, NULL, NULL, &tm_wait);
+	if (i == 0) {
+#if DEBUG_IO
+		printf("Udp socket timeout\n");
+#endif
+		return 0;
+	}
+	else if (i != 1) {
+#if DEBUG_IO
+		printf("Udp select error %d\n", i);
+#endif
+		return 0;
+	}
+#ifdef QUISK_HAVE_RECVMMSG
+	for (i = 0; i < max_blocks; i++) {
+		iovecs[i].iov_base = rx_udp_blocks[i].buf;
+		iovecs[i].iov_len = sizeof(rx_udp_blocks[i].buf);
+		memset(&msgs[i], 0, sizeof(msgs[i]));
+		msgs[i].msg_hdr.msg_iov = iovecs + i;
+		msgs[i].msg_hdr.msg_iovlen = 1;
+	}
+	n = recvmmsg(rx_udp_socket, msgs, max_blocks, MSG_DONTWAIT, NULL);
+	if (n <= 0)
+		return 0;
+	for (i = 0; i < n; i++)
+		rx_udp_blocks[i].bytes = msgs[i].msg_len;
+#else
+	n = 0;
+	while (1) {		// read the available blocks one at a time
+		rx_udp_blocks[n].bytes = recv(rx_udp_socket, (char *)rx_udp_blocks[n].buf, sizeof(rx_udp_blocks[n].buf),  0);
+		if (++n >= max_blocks)
+			break;
+		tm_wait.tv_sec = 0;
+		tm_wait.tv_usec = 0;
+		FD_ZERO (&fds);
+		FD_SET (rx_udp_socket, &fds);
+		if (select (rx_udp_socket + 1, &fds, NULL, NULL, &tm_wait) != 1)
+			break;
+	}
+#endif
+	rx_udp_received += n;
+	return n;
+}
+
 static int quisk_read_rx_udp(complex double * samp)	// Read samples from UDP
 {		// Size of complex sample array is SAMP_BUFFER_SIZE
 	ssize_t bytes;
-	unsigned char buf[1500];	// Maximum Ethernet is 1500 bytes.
+	unsigned char start_buf[1500];	// Maximum Ethernet is 1500 bytes.
+	unsigned char * buf;
+	int nBlocks, iBlock;
 	static unsigned char seq0;	// must be 8 bits
 	int i, nSamples, xr, xi, index, want_samples;
 	unsigned char * ptxr, * ptxi;
@@ -1824,110 +2772,90 @@ static int quisk_read_rx_udp(complex double * samp)	// Read samples from UDP
 		FD_ZERO (&fds);
 		FD_SET (rx_udp_socket, &fds);
 		if (select (rx_udp_socket + 1, &fds, NULL, NULL, &tm_wait) == 1) {	// see if data is available
-			bytes = recv(rx_udp_socket, (char *)buf, 1500,  0);	// throw away the first block
-			seq0 = buf[0] + 1;	// Next expected sequence number
+			bytes = recv(rx_udp_socket, (char *)start_buf, 1500,  0);	// throw away the first block
+			seq0 = start_buf[0] + 1;	// Next expected sequence number
 			rx_udp_started = 1;
 #if DEBUG_IO
 			printf("Udp data started\n");
 #endif
 		}
 		else {		// send our return address to the sample source
-			buf[0] = buf[1] = 0x72;	// UDP command "register return address"
-			send(rx_udp_socket, (char *)buf, 2, 0);
+			start_buf[0] = start_buf[1] = 0x72;	// UDP command "register return address"
+			send(rx_udp_socket, (char *)start_buf, 2, 0);
 			return 0;
 		}
 	}
 	nSamples = 0;
 	want_samples = (int)(quisk_sound_state.data_poll_usec * 1e-6 * quisk_sound_state.sample_rate + 0.5);
 	while (nSamples < want_samples) {		// read several UDP blocks
-		tm_wait.tv_sec = 0;
-		tm_wait.tv_usec = 100000; // Linux seems to have problems with very small time intervals
-		FD_ZERO (&fds);
-		FD_SET (rx_udp_socket, &fds);
-		i = select (rx_udp_socket + 1, &fds, NULL, NULL, &tm_wait);
-		if (i == 1)
-			;
-		else if (i == 0) {
-#if DEBUG_IO
-			printf("Udp socket timeout\n");
-#endif
-			return 0;
-		}
-		else {
-#if DEBUG_IO
-			printf("Udp select error %d\n", i);
-#endif
+		nBlocks = rx_udp_read_blocks((SAMP_BUFFER_SIZE - nSamples) / RX_UDP_SAMPLES);
+		if (nBlocks == 0)		// timeout or error
 			return 0;
-		}
-		bytes = recv(rx_udp_socket, (char *)buf, 1500,  0);	// blocking read
-		if (bytes != RX_UDP_SIZE) {		// Known size of sample block
-			quisk_sound_state.read_error++;
-#if DEBUG_IO
-			printf("read_rx_udp: Bad block size\n");
-#endif
-			continue;
-		}
-		// buf[0] is the sequence number
-		// buf[1] is the status:
-		//		bit 0:  key up/down state
-		//		bit 1:	set for ADC overrange (clip)
-		if (buf[0] != seq0) {
+		for (iBlock = 0; iBlock < nBlocks; iBlock++) {
+			bytes = rx_udp_blocks[iBlock].bytes;
+			buf = rx_udp_blocks[iBlock].buf;
+			if (bytes != RX_UDP_SIZE) {		// Known size of sample block
+				quisk_sound_state.read_error++;
 #if DEBUG_IO
-			printf("read_rx_udp: Bad sequence want %3d got %3d\n",
-					(unsigned int)seq0, (unsigned int)buf[0]);
+				printf("read_rx_udp: Bad block size\n");
 #endif
-			quisk_sound_state.read_error++;
-		}
-		seq0 = buf[0] + 1;		// Next expected sequence number
-		quisk_set_key_down(buf[1] & 0x01);	// bit zero is key state
-		if (buf[1] & 0x02)					// bit one is ADC overrange
-			quisk_sound_state.overrange++;
-		index = 2;
-		ptxr = (unsigned char *)&xr;
-		ptxi = (unsigned char *)&xi;
-		// convert 24-bit samples to 32-bit samples; int must be 32 bits.
-		if (is_little_endian) {
-			while (index < bytes) {
-				xr = xi = 0;
-				memcpy (ptxr + 1, buf + index, 3);
-				index += 3;
-				memcpy (ptxi + 1, buf + index, 3);
-				index += 3;
-				samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;
-				xr = xi = 0;
-				memcpy (ptxr + 1, buf + index, 3);
-				index += 3;
-				memcpy (ptxi + 1, buf + index, 3);
-				index += 3;
-				samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;
-	//if (nSamples == 2) printf("%12d %12d\n", xr, xi);
+				continue;
 			}
-		}
-		else {		// big-endian
-			while (index < bytes) {
-				*(ptxr    ) = buf[index + 2];
-				*(ptxr + 1) = buf[index + 1];
-				*(ptxr + 2) = buf[index    ];
-				*(ptxr + 3) = 0;
-				index += 3;
-				*(ptxi    ) = buf[index + 2];
-				*(ptxi + 1) = buf[index + 1];
-				*(ptxi + 2) = buf[index    ];
-				*(ptxi + 3) = 0;
-				index += 3;
-				samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;;
-				*(ptxr    ) = buf[index + 2];
-				*(ptxr + 1) = buf[index + 1];
-				*(ptxr + 2) = buf[index    ];
-				*(ptxr + 3) = 0;
-				index += 3;
-				*(ptxi    ) = buf[index + 2];
-				*(ptxi + 1) = buf[index + 1];
-				*(ptxi + 2) = buf[index    ];
-				*(ptxi + 3) = 0;
-				index += 3;
-				samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;;
+			// buf[0] is the sequence number
+			// buf[1] is the status:
+			//		bit 0:  key up/down state
+			//		bit 1:	set for ADC overrange (clip)
+			rx_udp_sequence(buf[0], &seq0);
+			quisk_set_key_down(buf[1] & 0x01);	// bit zero is key state
+			if (buf[1] & 0x02)					// bit one is ADC overrange
+				quisk_sound_state.overrange++;
+			index = 2;
+			ptxr = (unsigned char *)&xr;
+			ptxi = (unsigned char *)&xi;
+			// convert 24-bit samples to 32-bit samples; int must be 32 bits.
+			if (is_little_endian) {
+				while (index < bytes) {
+					xr = xi = 0;
+					memcpy (ptxr + 1, buf + index, 3);
+					index += 3;
+					memcpy (ptxi + 1, buf + index, 3);
+					index += 3;
+					samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;
+					xr = xi = 0;
+					memcpy (ptxr + 1, buf + index, 3);
+					index += 3;
+					memcpy (ptxi + 1, buf + index, 3);
+					index += 3;
+					samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;
+		//if (nSamples == 2) printf("%12d %12d\n", xr, xi);
+				}
+			}
+			else {		// big-endian
+				while (index < bytes) {
+					*(ptxr    ) = buf[index + 2];
+					*(ptxr + 1) = buf[index + 1];
+					*(ptxr + 2) = buf[index    ];
+					*(ptxr + 3) = 0;
+					index += 3;
+					*(ptxi    ) = buf[index + 2];
+					*(ptxi + 1) = buf[index + 1];
+					*(ptxi + 2) = buf[index    ];
+					*(ptxi + 3) = 0;
+					index += 3;
+					samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;;
+					*(ptxr    ) = buf[index + 2];
+					*(ptxr + 1) = buf[index + 1];
+					*(ptxr + 2) = buf[index    ];
+					*(ptxr + 3) = 0;
+					index += 3;
+					*(ptxi    ) = buf[index + 2];
+					*(ptxi + 1) = buf[index + 1];
+					*(ptxi + 2) = buf[index    ];
+					*(ptxi + 3) = 0;
+					index += 3;
+					samp[nSamples++] = (xr + xi * I) * rx_udp_gain_correct;;
 
+				}
 			}
 		}
 	}
@@ -1961,7 +2889,9 @@ static int quisk_read_rx_udp(complex double * samp)	// Read samples from UDP
 static int read_rx_udp17(complex double * cSamples0)	// Read samples from UDP
 {		// Size of complex sample array is SAMP_BUFFER_SIZE
 	ssize_t bytes;
-	unsigned char buf[1500];	// Maximum Ethernet is 1500 bytes.
+	unsigned char start_buf[1500];	// Maximum Ethernet is 1500 bytes.
+	unsigned char * buf;
+	int nBlocks, iBlock;
 	static unsigned char seq0;	// must be 8 bits
 	int i, n, nSamples0, xr, xi, index, want_samples, key_down;
 	complex double sample;
@@ -1992,16 +2922,16 @@ static int read_rx_udp17(complex double * cSamples0)	// Read samples from UDP
 		FD_ZERO (&fds);
 		FD_SET (rx_udp_socket, &fds);
 		if (select (rx_udp_socket + 1, &fds, NULL, NULL, &tm_wait) == 1) {	// see if data is available
-			bytes = recv(rx_udp_socket, (char *)buf, 1500,  0);	// throw away the first block
-			seq0 = buf[0] + 1;	// Next expected sequence number
+			bytes = recv(rx_udp_socket, (char *)start_buf, 1500,  0);	// throw away the first block
+			seq0 = start_buf[0] + 1;	// Next expected sequence number
 			rx_udp_started = 1;
 #if DEBUG_IO
 			printf("Udp data started\n");
 #endif
 		}
 		else {		// send our return address to the sample source
-			buf[0] = buf[1] = 0x72;	// UDP command "register return address"
-			send(rx_udp_socket, (char *)buf, 2, 0);
+			start_buf[0] = start_buf[1] = 0x72;	// UDP command "register return address"
+			send(rx_udp_socket, (char *)start_buf, 2, 0);
 			return 0;
 		}
 	}
@@ -2009,121 +2939,102 @@ static int read_rx_udp17(complex double * cSamples0)	// Read samples from UDP
 	want_samples = (int)(quisk_sound_state.data_poll_usec * 1e-6 * quisk_sound_state.sample_rate + 0.5);
 	key_down = quisk_is_key_down();
 	while (nSamples0 < want_samples) {		// read several UDP blocks
-		tm_wait.tv_sec = 0;
-		tm_wait.tv_usec = 100000; // Linux seems to have problems with very small time intervals
-		FD_ZERO (&fds);
-		FD_SET (rx_udp_socket, &fds);
-		i = select (rx_udp_socket + 1, &fds, NULL, NULL, &tm_wait);
-		if (i == 1)
-			;
-		else if (i == 0) {
-#if DEBUG_IO
-			printf("Udp socket timeout\n");
-#endif
-			return 0;
-		}
-		else {
-#if DEBUG_IO
-			printf("Udp select error %d\n", i);
-#endif
+		nBlocks = rx_udp_read_blocks((SAMP_BUFFER_SIZE - nSamples0) / RX_UDP_SAMPLES);
+		if (nBlocks == 0)		// timeout or error
 			return 0;
-		}
-		bytes = recv(rx_udp_socket, (char *)buf, 1500,  0);	// blocking read
-		if (bytes != RX_UDP_SIZE) {		// Known size of sample block
-			quisk_sound_state.read_error++;
+		for (iBlock = 0; iBlock < nBlocks; iBlock++) {
+			bytes = rx_udp_blocks[iBlock].bytes;
+			buf = rx_udp_blocks[iBlock].buf;
+			if (bytes != RX_UDP_SIZE) {		// Known size of sample block
+				quisk_sound_state.read_error++;
 #if DEBUG_IO
-			printf("read_rx_udp: Bad block size\n");
+				printf("read_rx_udp: Bad block size\n");
 #endif
-			continue;
-		}
-		// buf[0] is the sequence number
-		// buf[1] is the status:
-		//		bit 0:  key up/down state
-		//		bit 1:	set for ADC overrange (clip)
-		if (buf[0] != seq0) {
-#if DEBUG_IO
-			printf("read_rx_udp: Bad sequence want %3d got %3d\n",
-					(unsigned int)seq0, (unsigned int)buf[0]);
-#endif
-			quisk_sound_state.read_error++;
-		}
-		seq0 = buf[0] + 1;		// Next expected sequence number
-		//quisk_set_key_down(buf[1] & 0x01);	// bit zero is key state
-		if (buf[1] & 0x02)					// bit one is ADC overrange
-			quisk_sound_state.overrange++;
-		index = 2;
-		ptxr = (unsigned char *)&xr;
-		ptxi = (unsigned char *)&xi;
-		// convert 24-bit samples to 32-bit samples; int must be 32 bits.
-		while (index < bytes) {
-			if (is_little_endian) {
-				xr = xi = 0;
-				memcpy (ptxr + 1, buf + index, 3);
-				index += 3;
-				memcpy (ptxi + 1, buf + index, 3);
-				index += 3;
-				sample = (xr + xi * I) * rx_udp_gain_correct;
+				continue;
 			}
-			else {		// big-endian
-				*(ptxr    ) = buf[index + 2];
-				*(ptxr + 1) = buf[index + 1];
-				*(ptxr + 2) = buf[index    ];
-				*(ptxr + 3) = 0;
-				index += 3;
-				*(ptxi    ) = buf[index + 2];
-				*(ptxi + 1) = buf[index + 1];
-				*(ptxi + 2) = buf[index    ];
-				*(ptxi + 3) = 0;
-				index += 3;
-				sample = (xr + xi * I) * rx_udp_gain_correct;
-			}
-			if (xr & 0x100) {		// channel 1
-				if (quisk_invert_spectrum)		// Invert spectrum
-					sample = conj(sample);
-				// Put samples into the fft input array.
-				ptFFT = fft_data_array + fft_data_index;
-				if ( ! (xi & 0x100)) {		// zero marker for start of first block
-					if (ptFFT->index != 0) {
-						//printf("Resync block\n");
-						fft_error++;
-						ptFFT->index = 0;
-					}
-					ptFFT->block = block_number = 0;
+			// buf[0] is the sequence number
+			// buf[1] is the status:
+			//		bit 0:  key up/down state
+			//		bit 1:	set for ADC overrange (clip)
+			rx_udp_sequence(buf[0], &seq0);
+			//quisk_set_key_down(buf[1] & 0x01);	// bit zero is key state
+			if (buf[1] & 0x02)					// bit one is ADC overrange
+				quisk_sound_state.overrange++;
+			index = 2;
+			ptxr = (unsigned char *)&xr;
+			ptxi = (unsigned char *)&xi;
+			// convert 24-bit samples to 32-bit samples; int must be 32 bits.
+			while (index < bytes) {
+				if (is_little_endian) {
+					xr = xi = 0;
+					memcpy (ptxr + 1, buf + index, 3);
+					index += 3;
+					memcpy (ptxi + 1, buf + index, 3);
+					index += 3;
+					sample = (xr + xi * I) * rx_udp_gain_correct;
 				}
-				else if (ptFFT->index == 0) {
-					if (scan_blocks) {
-						if (++block_number < scan_blocks)
-							ptFFT->block = block_number;
-						else
-							ptFFT->block = block_number = 0;
-					}
-					else {
+				else {		// big-endian
+					*(ptxr    ) = buf[index + 2];
+					*(ptxr + 1) = buf[index + 1];
+					*(ptxr + 2) = buf[index    ];
+					*(ptxr + 3) = 0;
+					index += 3;
+					*(ptxi    ) = buf[index + 2];
+					*(ptxi + 1) = buf[index + 1];
+					*(ptxi + 2) = buf[index    ];
+					*(ptxi + 3) = 0;
+					index += 3;
+					sample = (xr + xi * I) * rx_udp_gain_correct;
+				}
+				if (xr & 0x100) {		// channel 1
+					if (quisk_invert_spectrum)		// Invert spectrum
+						sample = conj(sample);
+					// Put samples into the fft input array.
+					ptFFT = fft_data_array + fft_data_index;
+					if ( ! (xi & 0x100)) {		// zero marker for start of first block
+						if (ptFFT->index != 0) {
+							//printf("Resync block\n");
+							fft_error++;
+							ptFFT->index = 0;
+						}
 						ptFFT->block = block_number = 0;
 					}
-					if (scan_blocks && block_number >= scan_blocks)
-						printf("Bad block_number %d\n", block_number);
-				}
-				ptFFT->samples[ptFFT->index] = sample;
-				if ((isFDX || ! key_down) && ++(ptFFT->index) >= fft_size) {		// check sample count
-					n = fft_data_index + 1;				// next FFT data location
-					if (n >= FFT_ARRAY_SIZE)
-						n = 0;
-					if (fft_data_array[n].filled == 0) {				// Is the next buffer empty?
-						fft_data_array[n].index = 0;
-						fft_data_array[n].block = 0;
-						fft_data_array[fft_data_index].filled = 1;	// Mark the previous buffer ready.
-						fft_data_index = n;							// Write samples into the new buffer.
-						ptFFT = fft_data_array + fft_data_index;
+					else if (ptFFT->index == 0) {
+						if (scan_blocks) {
+							if (++block_number < scan_blocks)
+								ptFFT->block = block_number;
+							else
+								ptFFT->block = block_number = 0;
+						}
+						else {
+							ptFFT->block = block_number = 0;
+						}
+						if (scan_blocks && block_number >= scan_blocks)
+							printf("Bad block_number %d\n", block_number);
 					}
-					else {				// no place to write samples
-						ptFFT->index = 0;
-						ptFFT->block = 0;
-						fft_error++;
+					ptFFT->samples[ptFFT->index] = sample;
+					if ((isFDX || ! key_down) && ++(ptFFT->index) >= fft_size) {		// check sample count
+						n = fft_data_index + 1;				// next FFT data location
+						if (n >= FFT_ARRAY_SIZE)
+							n = 0;
+						if (fft_data_array[n].filled == 0) {				// Is the next buffer empty?
+							fft_data_array[n].index = 0;
+							fft_data_array[n].block = 0;
+							quisk_barrier();		// write the samples before the filled flag
+							fft_data_array[fft_data_index].filled = 1;	// Mark the previous buffer ready.
+							fft_data_index = n;							// Write samples into the new buffer.
+							ptFFT = fft_data_array + fft_data_index;
+						}
+						else {				// no place to write samples
+							ptFFT->index = 0;
+							ptFFT->block = 0;
+							fft_error++;
+						}
 					}
 				}
-			}
-			else {					// channel 0
-				cSamples0[nSamples0++] = sample;
+				else {					// channel 0
+					cSamples0[nSamples0++] = sample;
+				}
 			}
 		}
 	}
@@ -2154,6 +3065,13 @@ static int read_rx_udp17(complex double * cSamples0)	// Read samples from UDP
 	return nSamples0;
 }
 
+static PyObject * get_udp_stats(PyObject * self, PyObject * args)
+{  // Return the number of UDP sample packets received, lost and received out of order.
+	if (!PyArg_ParseTuple (args, ""))
+		return NULL;
+	return Py_BuildValue("iii", rx_udp_received, rx_udp_lost, rx_udp_reordered);
+}
+
 static PyObject * open_rx_udp(PyObject * self, PyObject * args)
 {
 	const char * ip;
@@ -2189,9 +3107,10 @@ static PyObject * open_rx_udp(PyObject * self, PyObject * args)
 	}
 #endif
 	quisk_using_udp = 1;
+	rx_udp_received = rx_udp_lost = rx_udp_reordered = 0;
 	rx_udp_socket = socket(PF_INET, SOCK_DGRAM, 0);
 	if (rx_udp_socket != INVALID_SOCKET) {
-		recvsize = 256000;
+		recvsize = QuiskGetConfigInt("rx_udp_recv_buffer", 256000);
 		setsockopt(rx_udp_socket, SOL_SOCKET, SO_RCVBUF, (char *)&recvsize, sizeof(recvsize));
 		memset(&Addr, 0, sizeof(Addr)); 
 		Addr.sin_family = AF_INET;
@@ -2269,10 +3188,19 @@ static PyObject * open_sound(PyObject * self, PyObject * args)
 
 static PyObject * close_sound(PyObject * self, PyObject * args)
 {
+	int i;
+
 	if (!PyArg_ParseTuple (args, ""))
 		return NULL;
+	stop_graph_thread();
 	quisk_close_mic();
 	quisk_close_sound();
+	for (i = RX_CHANNEL_SPLIT + 1; i < QUISK_MAX_RX_CHANNELS; i++) {	// Turn off the extra receive channels
+		if (rx_channels[i].state == RX_CHANNEL_ON && rx_channels[i].sink == RX_SINK_FILE)
+			quisk_record_channel(i, NULL, -2, NULL);
+		rx_channels[i].close_request = 0;
+		rx_channels[i].state = RX_CHANNEL_OFF;
+	}
 	quisk_close_key();
 	Py_INCREF (Py_None);
 	return Py_None;
@@ -2377,43 +3305,80 @@ static PyObject * set_agc(PyObject * self, PyObject * args)
 	return Py_None;
 }
 
+static int is_double_array(PyObject * obj)
+{  // Return 1 if obj is an array.array('d'), whose buffer holds packed doubles
+	PyObject * code, * size;
+	int ret;
+
+	code = PyObject_GetAttrString(obj, "typecode");
+	size = PyObject_GetAttrString(obj, "itemsize");
+	ret = code && size && PyString_Check(code) && strcmp(PyString_AsString(code), "d") == 0 &&
+		PyInt_Check(size) && PyInt_AsLong(size) == sizeof(double);
+	Py_XDECREF(code);
+	Py_XDECREF(size);
+	PyErr_Clear();
+	return ret;
+}
+
 static PyObject * set_filters(PyObject * self, PyObject * args)
 {  // Enter the coefficients of the I and Q digital filters.  The storage for
    // filters is not malloc'd because filters may be changed while being used.
+   // The filters are sequences of floats.  An array.array('d') is copied directly from its buffer.
 	PyObject * filterI, * filterQ;
-	int i, size;
+	int i, size, is_buffer;
 	PyObject * obj;
+	const void * bufI, * bufQ;
+	Py_ssize_t lenI, lenQ;
 	char buf98[98];
 
 	if (!PyArg_ParseTuple (args, "OOi", &filterI, &filterQ, &filter_bandwidth))
 		return NULL;
-	if (PySequence_Check(filterI) != 1) {
-		PyErr_SetString (QuiskError, "Filter I is not a sequence");
-		return NULL;
-	}
-	if (PySequence_Check(filterQ) != 1) {
-		PyErr_SetString (QuiskError, "Filter Q is not a sequence");
-		return NULL;
+	is_buffer = is_double_array(filterI) && is_double_array(filterQ);
+	if (is_buffer) {
+		if (PyObject_AsReadBuffer(filterI, &bufI, &lenI) || PyObject_AsReadBuffer(filterQ, &bufQ, &lenQ))
+			return NULL;
+		if (lenI != lenQ) {
+			PyErr_SetString (QuiskError, "The size of filters I and Q must be equal");
+			return NULL;
+		}
+		size = lenI / sizeof(double);
 	}
-	size = PySequence_Size(filterI);
-	if (size != PySequence_Size(filterQ)) {
-		PyErr_SetString (QuiskError, "The size of filters I and Q must be equal");
-		return NULL;
+	else {
+		if (PySequence_Check(filterI) != 1) {
+			PyErr_SetString (QuiskError, "Filter I is not a sequence");
+			return NULL;
+		}
+		if (PySequence_Check(filterQ) != 1) {
+			PyErr_SetString (QuiskError, "Filter Q is not a sequence");
+			return NULL;
+		}
+		size = PySequence_Size(filterI);
+		if (size != PySequence_Size(filterQ)) {
+			PyErr_SetString (QuiskError, "The size of filters I and Q must be equal");
+			return NULL;
+		}
 	}
 	if (size >= MAX_FILTER_SIZE) {
 		snprintf(buf98, 98, "Filter size must be less than %d", MAX_FILTER_SIZE);
 		PyErr_SetString (QuiskError, buf98);
 		return NULL;
 	}
-	for (i = 0; i < size; i++) {
-		obj = PySequence_GetItem(filterI, i);
-		cFilterI[i] = PyFloat_AsDouble(obj);
-		Py_XDECREF(obj);
-		obj = PySequence_GetItem(filterQ, i);
-		cFilterQ[i] = PyFloat_AsDouble(obj);
-		Py_XDECREF(obj);
+	if (is_buffer) {
+		memcpy(cFilterI, bufI, size * sizeof(double));
+		memcpy(cFilterQ, bufQ, size * sizeof(double));
+	}
+	else {
+		for (i = 0; i < size; i++) {
+			obj = PySequence_GetItem(filterI, i);
+			cFilterI[i] = PyFloat_AsDouble(obj);
+			Py_XDECREF(obj);
+			obj = PySequence_GetItem(filterQ, i);
+			cFilterQ[i] = PyFloat_AsDouble(obj);
+			Py_XDECREF(obj);
+		}
 	}
 	sizeFilter = size;
+	rx_filter_version++;
 	Py_INCREF (Py_None);
 	return Py_None;
 }
@@ -2439,6 +3404,7 @@ static PyObject * set_rx_mode(PyObject * self, PyObject * args)
 {
 	if (!PyArg_ParseTuple (args, "i", &rxMode))
 		return NULL;
+	rx_channels[RX_CHANNEL_MAIN].mode = rx_channels[RX_CHANNEL_SPLIT].mode = rxMode;
 	quisk_set_tx_mode();
 	Py_INCREF (Py_None);
 	return Py_None;
@@ -2471,6 +3437,132 @@ static PyObject * set_split_rxtx(PyObject * self, PyObject * args)
 	return Py_None;
 }
 
+static PyObject * set_rx_channel(PyObject * self, PyObject * args)
+{  // Start an extra receive channel, or change the frequency, mode and volume of a running channel.
+   // The sink is "" for no output, "play" to mix the audio into the radio sound, or a WAV file name.
+   // The optional filter coefficients replace the Rx filter from set_filters() for this channel.
+	int channel, freq, mode, i, size;
+	double volume = 1.0;
+	char * sink;
+	char buf98[98];
+	PyObject * filterI = NULL, * filterQ = NULL, * obj;
+	struct rx_channel * ch;
+
+	if (!PyArg_ParseTuple (args, "iiis|dOO", &channel, &freq, &mode, &sink, &volume, &filterI, &filterQ))
+		return NULL;
+	if (channel <= RX_CHANNEL_SPLIT || channel >= QUISK_MAX_RX_CHANNELS) {
+		snprintf(buf98, 98, "The channel must be from %d to %d", RX_CHANNEL_SPLIT + 1, QUISK_MAX_RX_CHANNELS - 1);
+		PyErr_SetString (QuiskError, buf98);
+		return NULL;
+	}
+	if (mode < 0 || mode > 8 || mode == 6) {
+		PyErr_SetString (QuiskError, "The mode is not available for extra receive channels");
+		return NULL;
+	}
+	ch = rx_channels + channel;
+	if (ch->state != RX_CHANNEL_OFF) {		// change a running channel
+		if (ch->close_request) {
+			PyErr_SetString (QuiskError, "The channel is closing");
+			return NULL;
+		}
+		ch->freq = freq;
+		ch->mode = mode;
+		ch->volume = volume;
+		Py_INCREF (Py_None);
+		return Py_None;
+	}
+	// The channel is off, so the sound thread does not use it
+	size = 0;
+	if (filterI || filterQ) {
+		if ( ! filterI || ! filterQ || PySequence_Check(filterI) != 1 || PySequence_Check(filterQ) != 1) {
+			PyErr_SetString (QuiskError, "Filters I and Q must be sequences");
+			return NULL;
+		}
+		size = PySequence_Size(filterI);
+		if (size != PySequence_Size(filterQ)) {
+			PyErr_SetString (QuiskError, "The size of filters I and Q must be equal");
+			return NULL;
+		}
+		if (size >= MAX_FILTER_SIZE) {
+			snprintf(buf98, 98, "Filter size must be less than %d", MAX_FILTER_SIZE);
+			PyErr_SetString (QuiskError, buf98);
+			return NULL;
+		}
+	}
+	if (ch->filterI) {
+		free(ch->filterI);
+		free(ch->filterQ);
+		ch->filterI = ch->filterQ = NULL;
+	}
+	if (size > 0) {
+		ch->filterI = (double *)malloc(size * sizeof(double));
+		ch->filterQ = (double *)malloc(size * sizeof(double));
+		for (i = 0; i < size; i++) {
+			obj = PySequence_GetItem(filterI, i);
+			ch->filterI[i] = PyFloat_AsDouble(obj);
+			Py_XDECREF(obj);
+			obj = PySequence_GetItem(filterQ, i);
+			ch->filterQ[i] = PyFloat_AsDouble(obj);
+			Py_XDECREF(obj);
+		}
+	}
+	ch->sizeFilter = size;
+	if (sink[0] == 0) {
+		ch->sink = RX_SINK_NONE;
+	}
+	else if (strcmp(sink, "play") == 0) {
+		ch->sink = RX_SINK_PLAY;
+	}
+	else {
+		ch->sink = RX_SINK_FILE;
+		strncpy(ch->file_name, sink, QUISK_PATH_SIZE);
+		ch->file_name[QUISK_PATH_SIZE - 1] = 0;
+	}
+	ch->freq = freq;
+	ch->mode = mode;
+	ch->volume = volume;
+	ch->close_request = 0;
+	quisk_barrier();		// set up the channel before the sound thread sees it
+	ch->state = RX_CHANNEL_OPENING;
+	Py_INCREF (Py_None);
+	return Py_None;
+}
+
+static PyObject * clear_rx_channel(PyObject * self, PyObject * args)
+{  // Turn off an extra receive channel and close its file
+	int channel;
+
+	if (!PyArg_ParseTuple (args, "i", &channel))
+		return NULL;
+	if (channel > RX_CHANNEL_SPLIT && channel < QUISK_MAX_RX_CHANNELS &&
+			rx_channels[channel].state != RX_CHANNEL_OFF)
+		rx_channels[channel].close_request = 1;
+	Py_INCREF (Py_None);
+	return Py_None;
+}
+
+static PyObject * get_rx_channels(PyObject * self, PyObject * args)
+{  // Return a list of (channel, freq, mode, sink, volume) for the running extra channels
+	int i;
+	struct rx_channel * ch;
+	PyObject * pylist, * obj;
+
+	if (!PyArg_ParseTuple (args, ""))
+		return NULL;
+	pylist = PyList_New(0);
+	for (i = RX_CHANNEL_SPLIT + 1; i < QUISK_MAX_RX_CHANNELS; i++) {
+		ch = rx_channels + i;
+		if (ch->state == RX_CHANNEL_OFF || ch->close_request)
+			continue;
+		obj = Py_BuildValue("iiisd", i, ch->freq, ch->mode,
+			ch->sink == RX_SINK_FILE ? ch->file_name : (ch->sink == RX_SINK_PLAY ? "play" : ""),
+			ch->volume);
+		PyList_Append(pylist, obj);
+		Py_DECREF(obj);
+	}
+	return pylist;
+}
+
 static PyObject * set_tune(PyObject * self, PyObject * args)
 {  /* Change the tuning frequency */
 	if (!PyArg_ParseTuple (args, "ii", &rx_tune_freq, &quisk_tx_tune_freq))
@@ -2488,7 +3580,7 @@ static PyObject * set_sidetone(PyObject * self, PyObject * args)
 	//printf("Sidetone control times 5 = %d\n", quisk_sidetoneCtrl * 5);
 	// Simulate log taper pot
 	sidetoneVolume = (exp(quisk_sidetoneCtrl * 0.006908) - 1) / 1000.0;
-	sidetonePhase = cexp((I * 2.0 * M_PI * abs(rit_freq)) / quisk_sound_state.playback_rate);
+	quisk_nco_set(&sidetoneOsc, abs(rit_freq), quisk_sound_state.playback_rate);
 	keyupDelay = (int)(quisk_sound_state.playback_rate *1e-3 * delay + 0.5);
 	if (rxMode == 0 || rxMode == 1)
 		dAutoNotch(NULL, 0, 0, 0);		// for CW, changing the RIT affects autonotch
@@ -2539,34 +3631,160 @@ static PyObject * set_key_down(PyObject * self, PyObject * args)
 	return Py_None;
 }
 
-static PyObject * get_graph(PyObject * self, PyObject * args)	// Called by the GUI thread
+struct quisk_buffer {		// A caller-supplied writable buffer
+	Py_buffer view;			// new style buffer interface
+	int is_view;			// Do we need to release view?
+	void * buf;
+	Py_ssize_t len;			// size of buf in bytes
+};
+
+static int GetWriteBuffer(PyObject * obj, struct quisk_buffer * qbuf, Py_ssize_t size)
+{  // Get a writable pointer to the buffer of obj with at least size bytes.  Accept array.array,
+   // bytearray, NumPy arrays, etc.  Return 1 for success, or 0 with an exception set.
+	qbuf->is_view = 0;
+	if (PyObject_CheckBuffer(obj)) {
+		if (PyObject_GetBuffer(obj, &qbuf->view, PyBUF_WRITABLE) != 0)
+			return 0;
+		qbuf->is_view = 1;
+		qbuf->buf = qbuf->view.buf;
+		qbuf->len = qbuf->view.len;
+	}
+	else if (PyObject_AsWriteBuffer(obj, &qbuf->buf, &qbuf->len) != 0) {	// old style buffer interface
+		return 0;
+	}
+	if (qbuf->len < size) {
+		if (qbuf->is_view)
+			PyBuffer_Release(&qbuf->view);
+		qbuf->is_view = 0;
+		PyErr_SetString (QuiskError, "The buffer is too small");
+		return 0;
+	}
+	return 1;
+}
+
+static void ReleaseWriteBuffer(struct quisk_buffer * qbuf)
 {
-	int i, j, k, m, n, index, ffts, ii, mm, m0, deltam;
+	if (qbuf->is_view)
+		PyBuffer_Release(&qbuf->view);
+	qbuf->is_view = 0;
+}
+
+static double BesselI0(double x)
+{  // Modified Bessel function of the first kind, order zero, by its power series
+	double term, sum, y;
+	int k;
+
+	y = x * x / 4.0;
+	term = sum = 1.0;
+	for (k = 1; k < 200; k++) {
+		term *= y / ((double)k * k);
+		sum += term;
+		if (term < sum * 1e-16)
+			break;
+	}
+	return sum;
+}
+
+static int SetFftWindow(const char * name, double beta)
+{  // Select the window for the graph FFT.  The tables are calculated once for each fft_size.
+   // The Kaiser table is replaced when beta changes.  Return the window index, or -1.
+	int i, j, index, loops;
+	double x, sum, sum2;
+	double * window, * old_window;
+
+	for (index = 0; index < FFT_WINDOW_COUNT; index++)
+		if ( ! strcmp(name, fft_window_names[index]))
+			break;
+	if (index >= FFT_WINDOW_COUNT)
+		return -1;
+	window = old_window = fft_window_tables[index];
+	if ( ! window || (index == 4 && beta != fft_window_beta)) {
+		// Make a new table.  The graph thread may still be using the old one.
+		window = (double *) malloc(sizeof(double) * fft_size);
+		for (i = 0, j = -fft_size / 2; i < fft_size; i++, j++) {	// The window is centered at i == fft_size / 2
+			x = 2. * M_PI * j / fft_size;
+			switch (index) {
+			case 0:		// Hanning
+			default:
+				window[i] = 0.5 + 0.5 * cos(x);
+				break;
+			case 1:		// Hamming
+				window[i] = 0.54 + 0.46 * cos(x);
+				break;
+			case 2:		// Blackman-Harris, four term
+				window[i] = 0.35875 + 0.48829 * cos(x) + 0.14128 * cos(2 * x) + 0.01168 * cos(3 * x);
+				break;
+			case 3:		// Flat-top
+				window[i] = 0.21557895 + 0.41663158 * cos(x) + 0.277263158 * cos(2 * x) +
+					0.083578947 * cos(3 * x) + 0.006947368 * cos(4 * x);
+				break;
+			case 4:		// Kaiser
+				x = 2.0 * j / fft_size;
+				window[i] = BesselI0(beta * sqrt(1.0 - x * x)) / BesselI0(beta);
+				break;
+			}
+		}
+		if (index == 4)
+			fft_window_beta = beta;
+		fft_window_tables[index] = window;
+	}
+	// Calculate the coherent gain and the power gain of the window
+	sum = sum2 = 0;
+	for (i = 0; i < fft_size; i++) {
+		sum += window[i];
+		sum2 += window[i] * window[i];
+	}
+	// Correct the graph so that a steady signal has the same level as with the Hanning window,
+	// whose coherent gain is 0.5.  Correct the S-meter for the noise power gain of the window.
+	fft_window_graph_db = 20.0 * log10(sum / fft_size / 0.5);
+	fft_window_smeter_db = -10.0 * log10(sum2 / fft_size);
+	quisk_barrier();		// write the table before publishing it
+	fft_window = window;
+	graph_reset = 1;
+	if (old_window && old_window != window) {
+		// Free the old table after the graph thread finishes the loop that may be using it
+		quisk_barrier();
+		loops = graph_thread_loops;
+		while (graph_thread_running && graph_thread_loops == loops)
+			QuiskSleepMicrosec(GRAPH_POLL_USEC / 5);
+		free(old_window);
+	}
+	return index;
+}
+
+static int graph_process(double * frame)	// Called by the graph thread
+{  // Run the FFTs that are ready, and average them.  When enough FFTs are averaged, write
+   // data_width graph points followed by the S-meter value to frame and return 1.  Otherwise return 0.
+	int i, j, k, m, n, index, ffts, ii, mm, m0, deltam, nready, pending;
+	int ready[FFT_ARRAY_SIZE];
 	fft_data * ptFft;
-	PyObject * tuple2;
-	double d1, d2, scale, zoom, deltaf;
+	double d1, d2, scale, smeter;
+	double * pd, * window;
 	complex double c;
+	double zoom = graph_zoom;
+	double deltaf = graph_deltaf;
 	static double meter = 0;		// RMS s-meter
-	static int use_fft = 1;			// Use the FFT, or return raw data
 	static double * fft_avg=NULL;	// Array to average the FFT
 	static double * fft_tmp;
 	static int count_fft=0;			// how many fft's have occurred (for average)
 
-	if (!PyArg_ParseTuple (args, "idd", &k, &zoom, &deltaf))
-		return NULL;
-	if (k != use_fft) {		// change in data return type; re-initialize
-		use_fft = k;
-		count_fft = 0;
-	}
 	if ( ! fft_avg) {
 		fft_avg = (double *) malloc(sizeof(double) * fft_size);
 		fft_tmp = (double *) malloc(sizeof(double) * fft_size);
+		graph_reset = 1;
+	}
+	if (graph_reset) {		// change in data return type; re-initialize
+		graph_reset = 0;
+		count_fft = 0;
+		meter = 0;
 		for (i = 0; i < fft_size; i++)
 			fft_avg[i] = 0;
 	}
-	// Process all FFTs that are ready to run.
+	// Find the FFTs that are ready to run, but no more than are needed for the next graph.
+	nready = 0;
+	pending = count_fft;
 	index = fft_data_index;		// oldest data first - FIFO
-	for (ffts = 0; ffts < FFT_ARRAY_SIZE; ffts++) {
+	for (ffts = 0; ffts < FFT_ARRAY_SIZE && pending < average_count; ffts++) {
 		if (++index >= FFT_ARRAY_SIZE)
 			index = 0;
 		if (fft_data_array[index].filled)
@@ -2578,20 +3796,31 @@ static PyObject * get_graph(PyObject * self, PyObject * args)	// Called by the G
 			ptFft->filled = 0;
 			continue;
 		}
-		if ( ! use_fft) {		// return raw data, not FFT
-			use_remove_dc = 0;	// No DC removal when returning raw data
-			tuple2 = PyTuple_New(data_width);
-			for (i = 0; i < data_width; i++)
-				PyTuple_SetItem(tuple2, i,
-					PyComplex_FromDoubles(creal(ptFft->samples[i]), cimag(ptFft->samples[i])));
-			ptFft->filled = 0;
-			return tuple2;
+		ready[nready++] = index;
+		if ( ! scan_blocks || ptFft->block == (scan_blocks - 1))
+			pending++;
+	}
+	quisk_barrier();		// read the samples after the filled flags
+	// Multiply by the window.  The samples are treated as (real, imag) pairs of doubles.
+	window = fft_window;
+	for (m = 0; m < nready; m++) {
+		pd = (double *)fft_data_array[ready[m]].samples;
+		for (i = 0; i < fft_size; i++) {
+			pd[2 * i]     *= window[i];
+			pd[2 * i + 1] *= window[i];
 		}
-		use_remove_dc = 1;
-		// Continue with FFT calculation
-		for (i = 0; i < fft_size; i++)		// multiply by window
-			ptFft->samples[i] *= fft_window[i];
-		fftw_execute(ptFft->plan);	// Calculate FFT
+	}
+	// Calculate the FFTs.  Buffers that are adjacent in memory are transformed together.
+	for (m = 0; m < nready; m += n) {
+		for (n = 1; n < FFT_BATCH_SIZE && m + n < nready; n++)
+			if (ready[m + n] != ready[m] + n)
+				break;
+		pd = (double *)fft_data_array[ready[m]].samples;
+		fftw_execute_dft(fft_plans[n], (fftw_complex *)pd, (fftw_complex *)pd);
+	}
+	// Process the FFT results in order.
+	for (ffts = 0; ffts < nready; ffts++) {
+		ptFft = fft_data_array + ready[ffts];
 		// Create RMS s-meter value at known bandwidth
 		// d2 is the number of FFT bins required for the bandwidth
 		// i is the starting bin number from  - sample_rate / 2 to + sample_rate / 2
@@ -2653,17 +3882,24 @@ static PyObject * get_graph(PyObject * self, PyObject * args)	// Called by the G
 			//printf(" %d %.4lf At %5d to %5d place %5d to %5d for block %d\n", fft_size, scan_valid, mm, m, ii, i, ptFft->block);
 		}
 		else {
+			// Average the squared amplitude; the square root is taken once per graph.
 			count_fft++;
-			k = 0;
-			for (i = fft_size / 2; i < fft_size; i++)			// Negative frequencies
-				fft_avg[k++] += cabs(ptFft->samples[i]);
-			for (i = 0; i < fft_size / 2; i++)					// Positive frequencies
-				fft_avg[k++] += cabs(ptFft->samples[i]);
+			pd = (double *)ptFft->samples;
+			n = fft_size / 2;
+			for (i = 0; i < n; i++)			// Negative frequencies
+				fft_avg[i] += pd[2 * (i + n)] * pd[2 * (i + n)] + pd[2 * (i + n) + 1] * pd[2 * (i + n) + 1];
+			for (i = 0; i < n; i++)			// Positive frequencies
+				fft_avg[i + n] += pd[2 * i] * pd[2 * i] + pd[2 * i + 1] * pd[2 * i + 1];
 		}
+		quisk_barrier();
 		ptFft->filled = 0;
 		if (count_fft >= average_count) {
 			count_fft = 0;
 			// We have averaged enough fft's to return the graph data.
+			// Convert the sum of squared amplitudes to the sum of amplitudes.
+			if ( ! scan_blocks)
+				for (i = 0; i < fft_size; i++)
+					fft_avg[i] = sqrt(fft_avg[i] * average_count);
 			// Average the fft data of size fft_size into the size of data_width.
 			n = (int)(zoom * (double)fft_size / data_width + 0.5);
 			if (n < 1)
@@ -2679,126 +3915,380 @@ static PyObject * get_graph(PyObject * self, PyObject * args)	// Called by the G
 				fft_avg[i] = d2;
 			}
 			scale = 1.0 / 2147483647.0 / fft_size;
-			Smeter = meter * scale * scale / average_count;		// record the new s-meter value
+			smeter = meter * scale * scale / average_count;		// the new s-meter value
 			meter = 0;
-			if (Smeter > 0)
-				Smeter = 10.0 * log10(Smeter);
+			if (smeter > 0)
+				smeter = 10.0 * log10(smeter);
 			else
-				Smeter = -160.0;
-			// This correction is for a -40 dB strong signal, and is caused by FFT leakage
-			// into adjacent bins. It is the amplitude that is spread out, not the squared amplitude.
-			Smeter += 4.25969;
-			tuple2 = PyTuple_New(data_width);
+				smeter = -160.0;
+			// This correction is for the power gain of the window, and is 4.25969 dB for Hanning.
+			smeter += fft_window_smeter_db;
 			// scale = 1.0 / average_count / fft_size;	// Divide by sample count
 			// scale /= pow(2.0, 31);			// Normalize to max == 1
 			scale = log10(average_count) + log10(fft_size) + 31.0 * log10(2.0);
 			scale *= 20.0;
+			scale += fft_window_graph_db;
 			for (i = 0; i < data_width; i++) {
 				d2 = 20.0 * log10(fft_avg[i]) - scale;
 				if (d2 < -200)
 					d2 = -200;
-				current_graph[i] = d2;
-				PyTuple_SetItem(tuple2, i, PyFloat_FromDouble(d2));
+				frame[i] = d2;
 			}
+			frame[data_width] = smeter;
 			for (i = 0; i < fft_size; i++)
 				fft_avg[i] = 0;
+			return 1;
+		}
+	}
+	return 0;
+}
+
+static void graph_thread(void * arg)
+{  // Calculate the graph data so that the GUI does not need to.  Finished frames are handed
+   // to the GUI with a triple buffer:  graph_frames[graph_back] is written by this thread,
+   // graph_frames[graph_front] is read by the GUI, and graph_middle is exchanged atomically.
+   // This thread does not use the Python API and does not hold the GIL.
+	int old;
+
+	while (graph_thread_running) {
+		graph_thread_loops++;
+		if ( ! use_fft) {		// the GUI is reading raw data
+			QuiskSleepMicrosec(GRAPH_POLL_USEC);
+			continue;
+		}
+		if ( ! graph_process(graph_frames[graph_back])) {
+			QuiskSleepMicrosec(GRAPH_POLL_USEC);
+			continue;
+		}
+		graph_frames_made++;
+		quisk_barrier();		// write the frame before publishing it
+		old = quisk_exchange(&graph_middle, graph_back | GRAPH_FRAME_NEW);
+		if (old & GRAPH_FRAME_NEW)	// the GUI never took the previous frame
+			graph_frames_dropped++;
+		graph_back = old & ~GRAPH_FRAME_NEW;
+	}
+	quisk_barrier();
+	graph_thread_stopped = 1;
+}
+
+static int start_graph_thread(void)
+{  // Start the graph thread if it is not running.  Return 0 for success.
+	if (graph_thread_running)
+		return 0;
+	graph_thread_stopped = 0;
+	graph_thread_running = 1;
+	if (PyThread_start_new_thread(graph_thread, NULL) == -1) {
+		graph_thread_running = 0;
+		return 1;
+	}
+	return 0;
+}
+
+static void stop_graph_thread(void)
+{  // Stop the graph thread and wait for it to exit.  It does not block, so it exits quickly.
+	if ( ! graph_thread_running)
+		return;
+	graph_thread_running = 0;
+	while ( ! graph_thread_stopped)
+		QuiskSleepMicrosec(GRAPH_POLL_USEC);
+}
+
+static PyObject * get_graph(PyObject * self, PyObject * args)	// Called by the GUI thread
+{  // Return a tuple of graph data, or None if no data is ready.  If a buffer is supplied,
+   // fill the buffer in place and return the number of points, or zero if no data is ready.
+   // The FFT data is calculated by the graph thread; raw data is returned directly.
+	int i, j, k, index, ffts, old;
+	fft_data * ptFft;
+	PyObject * tuple2;
+	PyObject * pybuf = Py_None;
+	struct quisk_buffer gbuf;
+	double zoom, deltaf;
+	double * frame;
+
+	if (!PyArg_ParseTuple (args, "idd|O", &k, &zoom, &deltaf, &pybuf))
+		return NULL;
+	if (pybuf != Py_None) {		// raw data is returned as pairs of doubles (real, imag)
+		if ( ! GetWriteBuffer(pybuf, &gbuf, (k ? data_width : data_width * 2) * sizeof(double)))
+			return NULL;
+		ReleaseWriteBuffer(&gbuf);	// we only wanted to check the size
+	}
+	if (k != use_fft) {		// change in data return type; re-initialize
+		use_fft = k;
+		graph_reset = 1;
+	}
+	if ( ! use_fft) {		// return raw data, not FFT
+		index = fft_data_index;		// oldest data first - FIFO
+		for (ffts = 0; ffts < FFT_ARRAY_SIZE; ffts++) {
+			if (++index >= FFT_ARRAY_SIZE)
+				index = 0;
+			if (fft_data_array[index].filled)
+				ptFft = fft_data_array + index;
+			else
+				continue;
+			quisk_barrier();
+			if (scan_blocks && ptFft->block >= scan_blocks) {
+				ptFft->filled = 0;
+				continue;
+			}
+			use_remove_dc = 0;	// No DC removal when returning raw data
+			if (pybuf != Py_None) {
+				if ( ! GetWriteBuffer(pybuf, &gbuf, data_width * 2 * sizeof(double)))
+					return NULL;
+				for (i = 0, j = 0; i < data_width; i++) {
+					((double *)gbuf.buf)[j++] = creal(ptFft->samples[i]);
+					((double *)gbuf.buf)[j++] = cimag(ptFft->samples[i]);
+				}
+				ReleaseWriteBuffer(&gbuf);
+				ptFft->filled = 0;
+				return PyInt_FromLong(data_width);
+			}
+			tuple2 = PyTuple_New(data_width);
+			for (i = 0; i < data_width; i++)
+				PyTuple_SetItem(tuple2, i,
+					PyComplex_FromDoubles(creal(ptFft->samples[i]), cimag(ptFft->samples[i])));
+			ptFft->filled = 0;
+			return tuple2;
+		}
+	}
+	else {
+		use_remove_dc = 1;
+		graph_zoom = zoom;
+		graph_deltaf = deltaf;
+		if (start_graph_thread()) {
+			PyErr_SetString (QuiskError, "Can not start the graph thread");
+			return NULL;
+		}
+		if (graph_middle & GRAPH_FRAME_NEW) {	// a new frame is ready
+			old = quisk_exchange(&graph_middle, graph_front);
+			graph_front = old & ~GRAPH_FRAME_NEW;
+			quisk_barrier();
+			frame = graph_frames[graph_front];
+			memcpy(current_graph, frame, data_width * sizeof(double));
+			Smeter = frame[data_width];		// record the new s-meter value
+			if (pybuf != Py_None) {		// copy the graph into the caller's buffer
+				if ( ! GetWriteBuffer(pybuf, &gbuf, data_width * sizeof(double)))
+					return NULL;
+				memcpy(gbuf.buf, current_graph, data_width * sizeof(double));
+				ReleaseWriteBuffer(&gbuf);
+				return PyInt_FromLong(data_width);
+			}
+			tuple2 = PyTuple_New(data_width);
+			for (i = 0; i < data_width; i++)
+				PyTuple_SetItem(tuple2, i, PyFloat_FromDouble(current_graph[i]));
 			return tuple2;
 		}
 	}
+	if (pybuf != Py_None)		// No data yet
+		return PyInt_FromLong(0);
 	Py_INCREF(Py_None);	// No data yet
 	return Py_None;
 }
 
-static PyObject * get_filter(PyObject * self, PyObject * args)
-{
-	int i, j, k, n;
-	int freq, time;
-	PyObject * tuple2;
-	complex double cx;
-	double d2, scale, accI, accQ;
-	double * average, * bufI, * bufQ;
-	fft_data * FFT;
-	fftw_complex * pt;
-	double phase, delta;
+static PyObject * set_fft_window(PyObject * self, PyObject * args)	// Called by the GUI thread
+{  // Change the graph FFT window.  The FFT plans are not changed.
+	char * name;
+	double beta = 6.0;
+
+	if (!PyArg_ParseTuple (args, "s|d", &name, &beta))
+		return NULL;
+	if ( ! fft_size) {
+		PyErr_SetString (QuiskError, "Call record_app() before set_fft_window()");
+		return NULL;
+	}
+	if (SetFftWindow(name, beta) < 0) {
+		PyErr_Format (QuiskError, "Unknown FFT window %s", name);
+		return NULL;
+	}
+	Py_INCREF (Py_None);
+	return Py_None;
+}
 
+static PyObject * get_graph_stats(PyObject * self, PyObject * args)
+{  // Return the number of graph frames calculated, the number dropped because the GUI did not
+   // take them in time, and the number of FFT buffers lost because the graph thread was late.
 	if (!PyArg_ParseTuple (args, ""))
 		return NULL;
+	return Py_BuildValue("iii", graph_frames_made, graph_frames_dropped, fft_error);
+}
 
-	// Create space for the fft of size data_width
-	FFT = (fft_data *)malloc(sizeof(fft_data));
-	FFT->filled = 0;
-	FFT->index = 0;
-	pt = FFT->samples = (fftw_complex *) fftw_malloc(sizeof(fftw_complex) * data_width);
-	FFT->plan = fftw_plan_dft_1d(data_width, pt, pt, FFTW_FORWARD, FFTW_MEASURE);
-	average = (double *) malloc(sizeof(double) * (data_width + sizeFilter));
-	bufI = (double *) malloc(sizeof(double) * sizeFilter);
-	bufQ = (double *) malloc(sizeof(double) * sizeFilter);
-
-	for (i = 0; i < data_width + sizeFilter; i++)
-		average[i] = 0.5;	// Value for freq == 0
-	for (freq = 1; freq < data_width / 2.0 - 10.0; freq++) {
-		delta = 2 * M_PI / data_width * freq;
-		phase = 0;
-		// generate some initial samples to fill the filter pipeline
-		for (time = 0; time < data_width + sizeFilter; time++) {
-			average[time] += cos(phase);	// current sample
-			phase += delta;
-			if (phase > 2 * M_PI)
-				phase -= 2 * M_PI;
-		}
-	}
-	// now filter the signal
-	n = 0;
-	for (time = 0; time < data_width + sizeFilter; time++) {
-		d2 = average[time];
-		bufI[n] = d2;
-		bufQ[n] = d2;
-		accI = accQ = 0;
-		j = n;
-		for (k = 0; k < sizeFilter; k++) {
-			accI += bufI[j] * cFilterI[k];
-			accQ += bufQ[j] * cFilterQ[k];
-			if (++j >= sizeFilter)
-				j = 0;
-		}
-		cx = accI + I * accQ;	// Filter output
-		if (++n >= sizeFilter)
-			n = 0;
-		if (time >= sizeFilter)
-			FFT->samples[time - sizeFilter] = cx;
-	}
-
-	for (i = 0; i < data_width; i++)	// multiply by window
-		FFT->samples[i] *= fft_window[i];
-	fftw_execute(FFT->plan);		// Calculate FFT
-	// Normalize and convert to log10
-	scale = 1. / data_width;
-	for (k = 0; k < data_width; k++) {
-		cx = FFT->samples[k];
-		average[k] = cabs(cx) * scale;
-		if (average[k] <= 1e-7)		// limit to -140 dB
-			average[k] = -7;
-		else
-			average[k] = log10(average[k]);
+static PyObject * get_current_graph(PyObject * self, PyObject * args)	// Called by the GUI thread
+{  // Return a read-only buffer object that shares the memory of the most recent graph data.
+   // The buffer holds data_width doubles and is valid until record_app() is called again.
+	if (!PyArg_ParseTuple (args, ""))
+		return NULL;
+	if ( ! current_graph) {
+		Py_INCREF(Py_None);
+		return Py_None;
 	}
-	// Return the graph data
-	tuple2 = PyTuple_New(data_width);
-	i = 0;
-	// Negative frequencies:
-	for (k = data_width / 2; k < data_width; k++, i++)
-		PyTuple_SetItem(tuple2, i, PyFloat_FromDouble(20.0 * average[k]));
+	return PyBuffer_FromMemory(current_graph, data_width * sizeof(double));
+}
 
-	// Positive frequencies:
-	for (k = 0; k < data_width / 2; k++, i++)
-		PyTuple_SetItem(tuple2, i, PyFloat_FromDouble(20.0 * average[k]));
+static PyObject * waterfall_row(PyObject * self, PyObject * args)	// Called by the GUI thread
+{  // Convert graph data in dB to one row of RGB pixels for the waterfall.  The data is a buffer
+   // of doubles such as array.array('d') or any sequence of floats; the first pixel is data[start].
+   // The palette is a string of 256 RGB triples.  The palette index is (dB + offset) * y_scale / 10
+   // limited to 0 to 255.  The row is a writable buffer such as a bytearray with three bytes per pixel.
+	PyObject * data, * row, * seq;
+	PyObject ** items;
+	const void * pt;
+	const double * dData;
+	const unsigned char * palette;
+	unsigned char * pix;
+	struct quisk_buffer rbuf;
+	Py_ssize_t size;
+	int i, l, start, count, pal_size;
+	double offset, y_scale, d;
+
+	if (!PyArg_ParseTuple (args, "Ois#ddO", &data, &start, &palette, &pal_size, &offset, &y_scale, &row))
+		return NULL;
+	if (pal_size < 256 * 3) {
+		PyErr_SetString (QuiskError, "The waterfall palette must have 256 RGB colors");
+		return NULL;
+	}
+	if ( ! GetWriteBuffer(row, &rbuf, 0))
+		return NULL;
+	count = (int)(rbuf.len / 3);
+	pix = (unsigned char *)rbuf.buf;
+	y_scale /= 10.0;
+	if (PyObject_AsReadBuffer(data, &pt, &size) == 0) {	// Fast path for array.array('d')
+		dData = (const double *)pt;
+		if (start < 0 || (start + count) * (Py_ssize_t)sizeof(double) > size) {
+			ReleaseWriteBuffer(&rbuf);
+			PyErr_SetString (QuiskError, "The waterfall data is too short");
+			return NULL;
+		}
+		dData += start;
+		for (i = 0; i < count; i++) {
+			l = (int)((dData[i] + offset) * y_scale);
+			if (l < 0)
+				l = 0;
+			else if (l > 255)
+				l = 255;
+			l *= 3;
+			*pix++ = palette[l];
+			*pix++ = palette[l + 1];
+			*pix++ = palette[l + 2];
+		}
+	}
+	else {		// Slow path for a sequence of floats
+		PyErr_Clear();
+		seq = PySequence_Fast(data, "The waterfall data is not a sequence");
+		if ( ! seq) {
+			ReleaseWriteBuffer(&rbuf);
+			return NULL;
+		}
+		if (start < 0 || start + count > PySequence_Fast_GET_SIZE(seq)) {
+			Py_DECREF(seq);
+			ReleaseWriteBuffer(&rbuf);
+			PyErr_SetString (QuiskError, "The waterfall data is too short");
+			return NULL;
+		}
+		items = PySequence_Fast_ITEMS(seq) + start;
+		for (i = 0; i < count; i++) {
+			d = PyFloat_AsDouble(items[i]);
+			l = (int)((d + offset) * y_scale);
+			if (l < 0)
+				l = 0;
+			else if (l > 255)
+				l = 255;
+			l *= 3;
+			*pix++ = palette[l];
+			*pix++ = palette[l + 1];
+			*pix++ = palette[l + 2];
+		}
+		Py_DECREF(seq);
+	}
+	ReleaseWriteBuffer(&rbuf);
+	if (PyErr_Occurred())
+		return NULL;
+	Py_INCREF (Py_None);
+	return Py_None;
+}
 
-	free(bufQ);
-	free(bufI);
-	free(average);
-	fftw_destroy_plan(FFT->plan);
-	fftw_free(FFT->samples);
-	free(FFT);
+// The filter response graph is cached for recent filters, so changing filters is fast.
+#define FILTER_GRAPH_CACHE	16
+static struct {
+	unsigned long hash;		// hash of the filter coefficients
+	int size;			// number of coefficients
+	int width;			// number of graph points
+	double * graph;			// response in dB, negative frequencies first
+} filter_graph_cache[FILTER_GRAPH_CACHE];
+static int filter_graph_next;		// Next cache entry to replace
+
+static unsigned long filter_graph_hash(void)
+{  // Return an FNV-1a hash of the Rx filter coefficients
+	int i;
+	unsigned long hash = 2166136261UL;
+	unsigned char * pt;
+
+	pt = (unsigned char *)cFilterI;
+	for (i = 0; i < sizeFilter * (int)sizeof(double); i++)
+		hash = (hash ^ pt[i]) * 16777619UL;
+	pt = (unsigned char *)cFilterQ;
+	for (i = 0; i < sizeFilter * (int)sizeof(double); i++)
+		hash = (hash ^ pt[i]) * 16777619UL;
+	return hash;
+}
+
+static PyObject * get_filter(PyObject * self, PyObject * args)
+{  // Return the Rx filter response in dB as data_width points from -rate/2 to +rate/2.
+   // The response is the FFT of the filter coefficients, zero padded or wrapped to data_width.
+	int i, k, n, size, width;
+	unsigned long hash;
+	double d, * graph;
+	fftw_complex * samples;
+	fftw_plan plan;
+	PyObject * tuple2;
 
+	if (!PyArg_ParseTuple (args, ""))
+		return NULL;
+	size = sizeFilter;
+	width = data_width;
+	hash = filter_graph_hash();
+	graph = NULL;
+	for (i = 0; i < FILTER_GRAPH_CACHE; i++) {
+		if (filter_graph_cache[i].graph && filter_graph_cache[i].hash == hash &&
+				filter_graph_cache[i].size == size && filter_graph_cache[i].width == width) {
+			graph = filter_graph_cache[i].graph;
+			break;
+		}
+	}
+	if ( ! graph) {
+		samples = (fftw_complex *) fftw_malloc(sizeof(fftw_complex) * width);
+		plan = fftw_plan_dft_1d(width, samples, samples, FFTW_FORWARD, FFTW_ESTIMATE);
+		for (i = 0; i < width; i++)
+			samples[i] = 0;
+		// The filter applies coefficient k to the sample k samples after the newest sample,
+		// modulo the size, so coefficient (size - n) % size is the impulse response at time n.
+		for (n = 0; n < size; n++) {
+			k = (size - n) % size;
+			samples[n % width] += cFilterI[k] + I * cFilterQ[k];
+		}
+		fftw_execute(plan);
+		i = filter_graph_next;
+		if (++filter_graph_next >= FILTER_GRAPH_CACHE)
+			filter_graph_next = 0;
+		if (filter_graph_cache[i].graph)
+			free(filter_graph_cache[i].graph);
+		graph = filter_graph_cache[i].graph = (double *)malloc(sizeof(double) * width);
+		filter_graph_cache[i].hash = hash;
+		filter_graph_cache[i].size = size;
+		filter_graph_cache[i].width = width;
+		// Scale the response as before:  a real test signal through the filter and a Hanning window
+		for (k = 0; k < width; k++) {
+			d = cabs(samples[(k + width / 2) % width]) * 0.25;
+			if (d <= 1e-7)		// limit to -140 dB
+				graph[k] = -140.0;
+			else
+				graph[k] = 20.0 * log10(d);
+		}
+		fftw_destroy_plan(plan);
+		fftw_free(samples);
+	}
+	// Return the graph data; negative frequencies, then positive frequencies
+	tuple2 = PyTuple_New(width);
+	for (k = 0; k < width; k++)
+		PyTuple_SetItem(tuple2, k, PyFloat_FromDouble(graph[k]));
 	return tuple2;
 }
 
@@ -3000,20 +4490,40 @@ static PyObject * idft(PyObject * self, PyObject * args)
 	return Xdft(tuple2, 1, window);
 }
 
+static PyObject * save_fftw_wisdom(PyObject * self, PyObject * args)
+{  // Save the FFTW wisdom to the file named in record_app(), if any.
+	if (args && !PyArg_ParseTuple (args, ""))	// args=NULL internal call
+		return NULL;
+	if (fftw_wisdom_path[0] && ! fftw_export_wisdom_to_filename(fftw_wisdom_path))
+		printf("Failure to save FFTW wisdom to %s\n", fftw_wisdom_path);
+	if ( ! args)
+		return NULL;
+	Py_INCREF (Py_None);
+	return Py_None;
+}
+
 static PyObject * record_app(PyObject * self, PyObject * args)
 {  // Record the Python object for the application instance, malloc space for fft's.
-	int i, j, rate;
+   // If a file name for FFTW wisdom is given, read the wisdom before making the FFT plans.
+	int i, rate, plan_flags;
 	fftw_complex * pt;
+	char * wisdom = "";
 
-	if (!PyArg_ParseTuple (args, "OOiiiil", &pyApp, &quisk_pyConfig, &data_width,
-		&fft_size, &average_count, &rate, &quisk_mainwin_handle))
+	if (!PyArg_ParseTuple (args, "OOiiiil|s", &pyApp, &quisk_pyConfig, &data_width,
+		&fft_size, &average_count, &rate, &quisk_mainwin_handle, &wisdom))
 		return NULL;
+	strncpy(fftw_wisdom_path, wisdom, QUISK_PATH_SIZE);
+	fftw_wisdom_path[QUISK_PATH_SIZE - 1] = 0;
+	if (fftw_wisdom_path[0])
+		fftw_import_wisdom_from_filename(fftw_wisdom_path);	// failure is normal for the first run
 
 	Py_INCREF(quisk_pyConfig);
 
 	rx_udp_clock = QuiskGetConfigDouble("rx_udp_clock", 122.88e6);
 	graph_refresh = QuiskGetConfigInt("graph_refresh", 7);
 	use_rx_udp = QuiskGetConfigInt("use_rx_udp", 0);
+	use_channelizer = QuiskGetConfigInt("rx_channelizer", 1);
+	rx_fft_filter_taps = QuiskGetConfigInt("rx_fft_filter_taps", 256);
 	quisk_sound_state.sample_rate = rate;
 	fft_sample_rate = rate;
 	is_little_endian = 1;	// Test machine byte order
@@ -3022,31 +4532,54 @@ static PyObject * record_app(PyObject * self, PyObject * args)
 	else
 		is_little_endian = 0;
 	strncpy (quisk_sound_state.err_msg, CLOSED_TEXT, QUISK_SC_SIZE);
-	// Initialize space for the FFTs
+	stop_graph_thread();		// get_graph() starts it again
+	// Initialize space for the FFTs.  The buffers are contiguous so that adjacent
+	// buffers can be transformed with a single plan.
+	if (fft_samples) {
+		for (i = 1; i <= FFT_BATCH_SIZE; i++)
+			fftw_destroy_plan(fft_plans[i]);
+		fftw_free(fft_samples);
+	}
+	pt = fft_samples = (fftw_complex *) fftw_malloc(sizeof(fftw_complex) * fft_size * FFT_ARRAY_SIZE);
+	// One plan for each batch size is shared by all the buffers by using fftw_execute_dft().
+	// FFTW_PATIENT is slow, but the result is saved in the wisdom file for later runs.
+	plan_flags = QuiskGetConfigInt("fftw_wisdom_patient", 0) ? FFTW_PATIENT : FFTW_MEASURE;
+	for (i = 1; i <= FFT_BATCH_SIZE; i++)
+		fft_plans[i] = fftw_plan_many_dft(1, &fft_size, i, pt, NULL, 1, fft_size,
+			pt, NULL, 1, fft_size, FFTW_FORWARD, plan_flags);
 	for (i = 0; i < FFT_ARRAY_SIZE; i++) {
 		fft_data_array[i].filled = 0;
 		fft_data_array[i].index = 0;
 		fft_data_array[i].block = 0;
-		pt = fft_data_array[i].samples = (fftw_complex *) fftw_malloc(sizeof(fftw_complex) * fft_size);
-		fft_data_array[i].plan = fftw_plan_dft_1d(fft_size, pt, pt, FFTW_FORWARD, FFTW_MEASURE);
-	}
-	// Create space for the fft average and window
-	if (fft_window)
-		free(fft_window);
-	fft_window = (double *) malloc(sizeof(double) * fft_size);
-	for (i = 0, j = -fft_size / 2; i < fft_size; i++, j++) {
-		if (0)	// Hamming
-			fft_window[i] = 0.54 + 0.46 * cos(2. * M_PI * j / fft_size);
-		else	// Hanning
-			fft_window[i] = 0.5 + 0.5 * cos(2. * M_PI * j / fft_size);
+		fft_data_array[i].samples = fft_samples + i * fft_size;
+		fft_data_array[i].plan = NULL;
+	}
+	// Create the window for the FFT.  The tables depend on fft_size, so discard any old tables.
+	for (i = 0; i < FFT_WINDOW_COUNT; i++) {
+		if (fft_window_tables[i]) {
+			free(fft_window_tables[i]);
+			fft_window_tables[i] = NULL;
+		}
 	}
+	fft_window_beta = -1;
+	if (SetFftWindow(QuiskGetConfigString("fft_window", "Hanning"),
+			QuiskGetConfigDouble("fft_window_kaiser_beta", 6.0)) < 0)
+		SetFftWindow("Hanning", 0);
 	if (current_graph)
 		free(current_graph);
 	current_graph = (double *) malloc(sizeof(double) * data_width);
+	for (i = 0; i < 3; i++) {
+		if (graph_frames[i])
+			free(graph_frames[i]);
+		graph_frames[i] = (double *) malloc(sizeof(double) * (data_width + 1));
+	}
 	measure_freq(NULL, 0, 0);
 	dAutoNotch(NULL, 0, 0, 0);
-	quisk_process_decimate(NULL, 0, 0);
-	quisk_process_demodulate(NULL, NULL, 0, 0);
+	channelizer_plans(plan_flags);
+	rx_fft_plans(plan_flags);
+	save_fftw_wisdom(NULL, NULL);	// save any new plans
+	for (i = 0; i <= RX_CHANNEL_SPLIT; i++)
+		rx_channel_init(rx_channels + i);
 	//calc_audio_graph(NULL, 0);
 #if DEBUG_IO
 	QuiskPrintTime(NULL, 0);
@@ -3102,7 +4635,13 @@ static PyMethodDef QuiskMethods[] = {
 	{"idft", idft, METH_VARARGS, "Calculate the inverse discrete Fourier transform."},
 	{"is_key_down", is_key_down, METH_VARARGS, "Check whether the key is down; return 0 or 1."},
 	{"get_state", get_state, METH_VARARGS, "Return a count of read and write errors."},
-	{"get_graph", get_graph, METH_VARARGS, "Return a tuple of graph data."},
+	{"set_benchmark", set_benchmark, METH_VARARGS, "Set up the DSP benchmark for a sample rate and mode, or end it with a rate of zero."},
+	{"benchmark", benchmark, METH_VARARGS, "Run the DSP benchmark and return a dictionary of timing results."},
+	{"get_graph", get_graph, METH_VARARGS, "Return a tuple of graph data, or fill a buffer with graph data."},
+	{"set_fft_window", set_fft_window, METH_VARARGS, "Select the graph FFT window by name, and the Kaiser beta."},
+	{"get_graph_stats", get_graph_stats, METH_VARARGS, "Return the graph frames made, frames dropped and FFT buffers lost."},
+	{"get_current_graph", get_current_graph, METH_VARARGS, "Return a read-only buffer that shares the current graph data."},
+	{"waterfall_row", waterfall_row, METH_VARARGS, "Convert graph data to a row of RGB waterfall pixels."},
 	{"get_filter", get_filter, METH_VARARGS, "Return the frequency response of the receive filter."},
 	{"get_filter_rate", get_filter_rate, METH_VARARGS, "Return the sample rate used for the filters."},
 	{"get_tx_filter", quisk_get_tx_filter, METH_VARARGS, "Return the frequency response of the transmit filter."},
@@ -3112,6 +4651,7 @@ static PyMethodDef QuiskMethods[] = {
 	{"get_overrange", get_overrange, METH_VARARGS, "Return the count of overrange (clip) for the ADC."},
 	{"get_smeter", get_smeter, METH_VARARGS, "Return the S meter reading."},
 	{"invert_spectrum", invert_spectrum, METH_VARARGS, "Invert the input RF spectrum"},
+	{"save_fftw_wisdom", save_fftw_wisdom, METH_VARARGS, "Save the FFTW wisdom to the file named in record_app()."},
 	{"record_app", record_app, METH_VARARGS, "Save the App instance."},
 	{"record_graph", record_graph, METH_VARARGS, "Record graph parameters."},
 	{"set_ampl_phase", quisk_set_ampl_phase, METH_VARARGS, "Set the sound card amplitude and phase corrections."},
@@ -3134,6 +4674,9 @@ static PyMethodDef QuiskMethods[] = {
 	{"set_tx_audio", (PyCFunction)quisk_set_tx_audio, METH_VARARGS|METH_KEYWORDS, "Set the transmit audio parameters."},
 	{"is_vox", quisk_is_vox, METH_VARARGS, "return the VOX state zero or one."},
 	{"set_split_rxtx", set_split_rxtx, METH_VARARGS, "Set split for rx/tx."},
+	{"set_rx_channel", set_rx_channel, METH_VARARGS, "Start or change an extra receive channel."},
+	{"clear_rx_channel", clear_rx_channel, METH_VARARGS, "Turn off an extra receive channel."},
+	{"get_rx_channels", get_rx_channels, METH_VARARGS, "Return a list of the extra receive channels."},
 	{"set_tune", set_tune, METH_VARARGS, "Set the tuning frequency."},
 	{"test_1", test_1, METH_VARARGS, "Test 1 function."},
 	{"test_2", test_2, METH_VARARGS, "Test 2 function."},
@@ -3141,6 +4684,9 @@ static PyMethodDef QuiskMethods[] = {
 	{"set_fdx", set_fdx, METH_VARARGS, "Set full duplex mode; ignore the key status."},
 	{"sound_devices", quisk_sound_devices, METH_VARARGS, "Return a list of available sound device names."},
 	{"pa_sound_devices", quisk_pa_sound_devices, METH_VARARGS, "Return a list of available PulseAudio sound device names."},
+	{"get_capture_stats", quisk_get_capture_stats, METH_VARARGS, "Return the capture thread state, ring fill, ring size, maximum fill and overruns."},
+	{"get_record_stats", quisk_get_record_stats, METH_VARARGS, "Return the recording blocks lost because the queue was full, and the failed writes."},
+	{"get_timing_stats", quisk_get_timing_stats, METH_VARARGS, "Return the time since reset and the timing statistics for each stage of read_sound."},
 	{"sound_errors", quisk_sound_errors, METH_VARARGS, "Return a list of text strings with sound devices and error counts"},
 	{"open_sound", open_sound, METH_VARARGS, "Open the the soundcard device."},
 	{"close_sound", close_sound, METH_VARARGS, "Stop the soundcard and release resources."},
@@ -3155,6 +4701,7 @@ static PyMethodDef QuiskMethods[] = {
 	{"mixer_set", mixer_set, METH_VARARGS, "Set microphone mixer parameters such as volume."},
 	{"open_key", open_key, METH_VARARGS, "Open access to the state of the key (CW or PTT)."},
 	{"open_rx_udp", open_rx_udp, METH_VARARGS, "Open a UDP port for capture."},
+	{"get_udp_stats", get_udp_stats, METH_VARARGS, "Return the number of UDP sample packets received, lost and reordered."},
 	{"close_rx_udp", close_rx_udp, METH_VARARGS, "Close the UDP port used for capture."},
 	{"set_key_down", set_key_down, METH_VARARGS, "Change the key up/down state for method \"\""},
 	{NULL, NULL, 0, NULL}		/* Sentinel */
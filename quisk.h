@@ -17,6 +17,16 @@
 #define IMD_TONE_2			1600
 #define INTERP_FILTER_TAPS	85			// interpolation filter
 #define MIC_OUT_RATE		48000		// mic post-processing sample rate
+#define QUISK_MAX_RX_CHANNELS	32		// maximum number of receive channels
+
+// Memory barrier and atomic exchange for data shared between threads without a lock
+#if defined(_MSC_VER)
+#define quisk_exchange(ptr, value)	InterlockedExchange((volatile long *)(ptr), (value))
+#define quisk_barrier()				MemoryBarrier()
+#else
+#define quisk_exchange(ptr, value)	__sync_lock_test_and_set((ptr), (value))
+#define quisk_barrier()				__sync_synchronize()
+#endif
 
 // Test the audio: 0 == No test; normal operation;
 // 1 == Copy real data to the output; 2 == copy imaginary data to the output;
@@ -73,6 +83,7 @@ struct sound_dev {				// data for sound capture or playback device
 	unsigned int chan_min;		// min and max available number of channels
 	unsigned int chan_max;
 	complex double dc_remove;			// filter to remove DC from samples
+	int use_mmap;				// ALSA: capture using mmap access
 	double save_sample;			// Used to delay the I or Q sample
 	char msg1[QUISK_SC_SIZE];	// string for information message
 } ;
@@ -142,6 +153,9 @@ extern PyObject * quisk_micplay_channels(PyObject * , PyObject *);
 extern PyObject * quisk_sound_devices(PyObject * , PyObject *);
 extern PyObject * quisk_pa_sound_devices(PyObject * , PyObject *);
 extern PyObject * quisk_sound_errors(PyObject *, PyObject *);
+extern PyObject * quisk_get_capture_stats(PyObject *, PyObject *);
+extern PyObject * quisk_get_record_stats(PyObject *, PyObject *);
+extern PyObject * quisk_get_timing_stats(PyObject *, PyObject *);
 extern PyObject * quisk_set_file_record(PyObject *, PyObject *);
 extern PyObject * quisk_set_tx_audio(PyObject *, PyObject *, PyObject *);
 extern PyObject * quisk_is_vox(PyObject *, PyObject *);
@@ -163,6 +177,7 @@ void quisk_start_sound(void);
 int quisk_get_overrange(void);
 void quisk_mixer_set(char *, int, PyObject *, char *, int);
 int quisk_read_sound(void);
+int quisk_record_channel(int, complex double *, int, const char *);
 int quisk_process_microphone(int, complex double *, int);
 void quisk_open_mic(void);
 void quisk_close_mic(void);
@@ -181,11 +196,13 @@ int  quisk_read_alsa(struct sound_dev *, complex double *);
 void quisk_play_alsa(struct sound_dev *, int, complex double *, int, double);
 void quisk_start_sound_alsa(struct sound_dev **, struct sound_dev **);
 void quisk_close_sound_alsa(struct sound_dev **, struct sound_dev **);
+void quisk_drop_capture_alsa(struct sound_dev **);
 
 int  quisk_read_portaudio(struct sound_dev *, complex double *);
 void quisk_play_portaudio(struct sound_dev *, int, complex double *, int, double);
 void quisk_start_sound_portaudio(struct sound_dev **, struct sound_dev **);
 void quisk_close_sound_portaudio(void);
+void quisk_drop_capture_portaudio(struct sound_dev **);
 
 int  quisk_read_pulseaudio(struct sound_dev *, complex double *);
 void quisk_play_pulseaudio(struct sound_dev *, int, complex double *, int, double);
@@ -222,6 +239,7 @@ int	QuiskGetConfigInt(const char *, int);
 double	QuiskGetConfigDouble(const char *, double);
 char *	QuiskGetConfigString(const char *, char *);
 double	QuiskTimeSec(void);
+double	QuiskTimeHiRes(void);
 void	QuiskSleepMicrosec(int);
 void	QuiskPrintTime(const char *, int);
 void	quisk_sample_source(ty_sample_start, ty_sample_stop, ty_sample_read);
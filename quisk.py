@@ -25,8 +25,8 @@ import wxversion				# Thanks to Mario, DH5YM
 wxversion.ensureMinimal('2.8')
 
 import wx, wx.html, wx.lib.buttons, wx.lib.stattext, wx.lib.colourdb, wx.grid, wx.richtext
-import math, cmath, time, traceback, string
-import threading, pickle, webbrowser
+import math, cmath, time, traceback, string, array
+import threading, pickle, webbrowser, platform, collections
 if sys.version_info[0] == 3:	# Python3
   from xmlrpc.client import ServerProxy
 else:				# Python version 2.x
@@ -34,13 +34,13 @@ else:				# Python version 2.x
 import _quisk as QS
 from types import *
 from quisk_widgets import *
-from filters import Filters
+from filters import DesignFilterCoef
 import dxcluster
 
 # Fldigi XML-RPC control opens a local socket.  If socket.setdefaulttimeout() is not
 # called, the timeout on Linux is zero (1 msec) and on Windows is 2 seconds.  So we
 # call it to insure consistent behavior.
-import socket
+import socket, select, errno
 socket.setdefaulttimeout(0.005)
 
 # Command line parsing: be able to specify the config file.
@@ -142,6 +142,49 @@ class Timer:
 
 ## T = Timer()		# Make a timer instance
 
+class HamlibServer(threading.Thread):
+  """A thread that accepts Hamlib (rigctld) connections and answers each command as soon as it arrives.
+  It waits in select() on all the sockets, so it uses no CPU when there are no commands."""
+  def __init__(self, app, port):
+    threading.Thread.__init__(self)
+    self.setDaemon(True)
+    self.app = app
+    self.info = app.main_frame.GetTitle()	# Reply to the "info" command
+    self.clients = {}		# The HamlibHandler for each client socket
+    self.doQuit = threading.Event()
+    self.doQuit.clear()
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.bind(('localhost', port))
+    self.sock.settimeout(0.0)
+    self.sock.listen(5)	# listen for TCP connections from multiple clients
+  def run(self):
+    while not self.doQuit.isSet():
+      try:
+        readable, writable, errors = select.select([self.sock] + list(self.clients), [], [], 0.5)
+      except (select.error, socket.error):	# A client socket is bad
+        for sock in list(self.clients):
+          if sock.fileno() < 0:
+            del self.clients[sock]
+        continue
+      for sock in readable:
+        if sock is self.sock:		# A new client connection
+          try:
+            conn, address = self.sock.accept()
+          except socket.error:
+            continue
+          # print 'Connection from', address
+          self.clients[conn] = HamlibHandler(self.app, conn, address, self.info)
+        elif not self.clients[sock].Process():	# False return indicates a closed connection
+          # print 'Remove', self.clients[sock].address
+          self.clients[sock].Close()
+          del self.clients[sock]
+    for client in self.clients.values():
+      client.Close()
+    self.sock.close()
+  def stop(self):
+    """Set a flag to indicate that the server thread should end."""
+    self.doQuit.set()
+
 class HamlibHandler:
   """This class is created for each connection to the server.  It services requests from each client"""
   SingleLetters = {		# convert single-letter commands to long commands
@@ -209,11 +252,12 @@ class HamlibHandler:
 0x0
 0
 """
-  def __init__(self, app, sock, address):
+  def __init__(self, app, sock, address, info=''):
     self.app = app		# Reference back to the "hardware"
     self.sock = sock
     sock.settimeout(0.0)
     self.address = address
+    self.info = info
     self.received = ''
     h = self.Handlers = {}
     h[''] = self.ErrProtocol
@@ -230,6 +274,20 @@ class HamlibHandler:
     h['set_split_freq']	= self.SetSplitFreq
     h['get_split_vfo']	= self.GetSplitVfo
     h['set_split_vfo']	= self.SetSplitVfo
+  def Close(self):
+    if self.sock:
+      self.sock.close()
+      self.sock = None
+  def CallGui(self, func, *args):
+    """Call func in the GUI thread, and wait for it so that the next command sees the change."""
+    done = threading.Event()
+    def Call():
+      try:
+        func(*args)
+      finally:
+        done.set()
+    wx.CallAfter(Call)
+    done.wait(2.0)
   def Send(self, text):
     """Send text back to the client."""
     try:
@@ -262,22 +320,25 @@ class HamlibHandler:
   def ErrProtocol(self):	# Protocol error
     self.Reply(-8)
   def Process(self):
-    """This is the main processing loop, and is called frequently.  It reads and satisfies requests."""
+    """Read the data from the socket, and answer every complete command.  Return 0 if the connection is closed."""
     if not self.sock:
       return 0
     try:	# Read any data from the socket
-      text = self.sock.recv(1024)
-    except socket.timeout:	# This does not work
-      pass
-    except socket.error:	# Nothing to read
-      pass
-    else:					# We got some characters
-      self.received += text
-    if '\n' in self.received:	# A complete command ending with newline is available
+      text = self.sock.recv(4096)
+    except socket.error as err:
+      if err.args and err.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):	# Nothing to read
+        return 1
+      return 0
+    if not text:		# The client closed the connection
+      return 0
+    self.received += text
+    while '\n' in self.received:	# A complete command ending with newline is available
       cmd, self.received = self.received.split('\n', 1)	# Split off the command, save any further characters
-    else:
-      return 1
-    cmd = cmd.strip()		# Here is our command
+      if not self.Command(cmd.strip()) or not self.sock:
+        return 0
+    return 1
+  def Command(self, cmd):
+    """Satisfy one command.  Return 0 to close the connection."""
     # print 'Get', cmd
     if not cmd:			# ??? Indicates a closed connection?
       # print 'empty command'
@@ -327,7 +388,7 @@ class HamlibHandler:
       self.ErrParam()
     else:
       freq = int(freq + 0.5)
-      self.app.ChangeRxTxFrequency(freq, None)
+      self.CallGui(self.app.ChangeRxTxFrequency, freq, None)
   def GetSplitFreq(self):
     self.Reply('TX Frequency', self.app.txFreq + self.app.VFO, 0)
   def SetSplitFreq(self):
@@ -338,7 +399,7 @@ class HamlibHandler:
       self.ErrParam()
     else:
       freq = int(freq + 0.5)
-      self.app.ChangeRxTxFrequency(None, freq)
+      self.CallGui(self.app.ChangeRxTxFrequency, None, freq)
   def GetSplitVfo(self):
     # I am not sure if "VFO" is a suitable response
     if self.app.split_rxtx:
@@ -355,9 +416,9 @@ class HamlibHandler:
       # traceback.print_exc()
       self.ErrParam()
     else:
-      self.app.splitButton.SetValue(split, True)
+      self.CallGui(self.app.splitButton.SetValue, split, True)
   def GetInfo(self):
-    self.Reply("Info", self.app.main_frame.GetTitle(), 0)
+    self.Reply("Info", self.info, 0)
   def GetMode(self):
     mode = self.app.mode
     if mode == 'CWU':
@@ -387,6 +448,8 @@ class HamlibHandler:
     else:
       self.ErrParam()
       return
+    self.CallGui(self.SetModeGui, mode, bw)
+  def SetModeGui(self, mode, bw):	# Called in the GUI thread
     self.app.OnBtnMode(None, mode)		# Set mode
     if bw <= 0:		# use default bandwidth
       return
@@ -418,7 +481,7 @@ class HamlibHandler:
     except:
       self.ErrParam()
     else:
-      self.app.pttButton.SetValue(ptt, True)
+      self.CallGui(self.app.pttButton.SetValue, ptt, True)
 
 class SoundThread(threading.Thread):
   """Create a second (non-GUI) thread to read, process and play sound."""
@@ -501,6 +564,9 @@ class ConfigStatus(wx.Panel):
     self.write_error = -1
     self.underrun_error = -1
     self.fft_error = -1
+    self.capture_stats = (0, 0, 1, 0, 0)
+    self.record_stats = (0, 0)
+    self.timing_stats = (0.0, ())
     self.latencyCapt = -1
     self.latencyPlay = -1
     self.y_scale = 0
@@ -525,6 +591,12 @@ class ConfigStatus(wx.Panel):
     self.tabstops1[2] = x = x + self.GetTextExtent("XXXX")[0]
     self.rjustify2 = (0, 0, 1, 1, 1)
     self.tabstops2 = []
+    self.rjustify3 = (0, 1, 1, 1, 1, 1)
+    self.tabstops3 = [0] * 6
+    self.tabstops3[0] = x = charx
+    self.tabstops3[1] = x = x + self.GetTextExtent("Process samplesXXXXXX")[0]
+    for i in range(2, 6):
+      self.tabstops3[i] = x = x + charx * 14
   def MakeTabstops(self):
     luse = lname = 0
     for use, name, rate, latency, errors in QS.sound_errors():
@@ -604,6 +676,13 @@ class ConfigStatus(wx.Panel):
       self.MakeRow2("FFT number of errors", self.fft_error, msg)
     else:
       self.MakeRow2("FFT number of errors", self.fft_error)
+    running, fill, size, max_fill, overruns = self.capture_stats
+    if running:		# samples are read by the capture thread
+      self.MakeRow2("Capture buffer now/max %", "%d/%d" % (fill * 100 // size, max_fill * 100 // size))
+      self.MakeRow2("Capture buffer overruns", overruns)
+    overruns, errors = self.record_stats
+    if overruns or errors:	# recording data was lost
+      self.MakeRow2("Recording overruns/errors", "%d/%d" % (overruns, errors))
     self.mem_y += self.dy
     if not self.tabstops2:
       return
@@ -621,6 +700,33 @@ class ConfigStatus(wx.Panel):
       self.MakeRow2("Capture radio samples", "UDP", application.sample_rate, self.latencyCapt, self.read_error)
     for use, name, rate, latency, errors in QS.sound_errors():
       self.MakeRow2(use, name, rate, latency, errors)
+    self.MakeTimingRows()
+  def MakeTimingRows(self):
+    # Show the time used by each stage of the sound thread
+    elapsed, stages = self.timing_stats
+    if elapsed <= 0:
+      return
+    self.mem_y += self.dy
+    self.tabstops = self.tabstops3
+    self.rjustify = self.rjustify3
+    self.font.SetUnderlined(True)
+    self.mem_dc.SetFont(self.font)
+    self.MakeRow2("Stage (last %.0f sec)" % elapsed, "Calls", "Average usec", "99% usec", "Max usec", "Load %")
+    self.font.SetUnderlined(False)
+    self.mem_dc.SetFont(self.font)
+    self.mem_y += self.dy * 3 // 10
+    for name, count, total, tmax, hist in stages:
+      if count <= 0:
+        continue
+      # Find the histogram bin that holds the 99th percentile
+      limit = count * 0.99
+      cum = 0
+      for i in range(len(hist)):
+        cum += hist[i]
+        if cum >= limit:
+          break
+      self.MakeRow2(name, count, "%.1f" % (total / count * 1e6), "< %d" % 2 ** (i + 1),
+          "%.1f" % (tmax * 1e6), "%.2f" % (total / elapsed * 100.0))
   def OnGraphData(self, data=None):
     if not self.tabstops2:      # Must wait for sound to start
       self.MakeTabstops()
@@ -630,6 +736,11 @@ class ConfigStatus(wx.Panel):
          self.latencyCapt, self.latencyPlay, self.interupts, self.fft_error, self.mic_max_display,
          self.data_poll_usec
 	 ) = QS.get_state()
+    self.capture_stats = QS.get_capture_stats()
+    self.record_stats = QS.get_record_stats()
+    self.timing_stats = QS.get_timing_stats()
+    if self.timing_stats[0] >= 10.0:	# Start a new measurement period
+      self.timing_stats = QS.get_timing_stats(1)
     self.mic_max_display = 20.0 * math.log10((self.mic_max_display + 1) / 32767.0)
     self.RefreshRect(self.mem_rect)
 
@@ -1773,12 +1884,21 @@ class WaterfallDisplay(wx.Window):
       blue.append((i - pal2[n][0]) *
        (pal2[n+1][3] - pal2[n][3]) //
        (pal2[n+1][0] - pal2[n][0]) + pal2[n][3])
-    self.red = red
-    self.green = green
-    self.blue = blue
-    bmp = wx.EmptyBitmap(0, 0)
-    bmp.x_origin = 0
-    self.bitmaps = [bmp] * application.screen_height
+    # The palette is a lookup table of 256 RGB colors used by QS.waterfall_row()
+    self.palette = bytes(bytearray(x for rgb in zip(red, green, blue) for x in rgb))
+    self.row = bytearray(3 * graph_width)	# re-usable buffer for one row of RGB pixels
+    self.row_bitmap = wx.BitmapFromBuffer(graph_width, 1, self.row)
+    # The waterfall rows are kept in one circular image of wf_height rows.  New rows are written
+    # above the previous row, so the newest row is at wf_index and older rows follow it.
+    self.wf_height = application.screen_height
+    self.wf_index = 0
+    self.wf_dc = wx.MemoryDC()
+    self.wf_dc.SelectObject(wx.EmptyBitmap(graph_width, self.wf_height))
+    self.wf_dc.SetBackground(wx.Brush('Black'))
+    self.wf_dc.Clear()
+    # The x_origin of each row depends on the VFO when the row was made.  Rows with equal
+    # x_origin are kept as runs [count, x_origin], newest first; the counts add up to wf_height.
+    self.wf_runs = [[self.wf_height, 0]]
     if sys.platform == 'win32':
       self.Bind(wx.EVT_ENTER_WINDOW, self.OnEnter)
   def OnEnter(self, event):
@@ -1796,21 +1916,33 @@ class WaterfallDisplay(wx.Window):
     for i in range(0, self.margin):
       dc.DrawLine(0, y, self.graph_width, y)
       y += 1
-    index = 0
+    wf_dc = self.wf_dc
+    width = self.graph_width
+    wf_height = self.wf_height
+    index = self.wf_index		# ring index of the next row to draw
+    runs = iter(self.wf_runs)
+    count, x = next(runs)
     if conf.waterfall_scroll_mode:	# Draw the first few lines multiple times
       for i in range(self.top_key, 1, -1):
-        b = self.bitmaps[index]
-        x = b.x_origin - x_origin
+        while count <= 0:
+          count, x = next(runs)
         for j in range(0, i):
-          dc.DrawBitmap(b, x, y)
+          dc.Blit(x - x_origin, y, width, 1, wf_dc, 0, index)
           y += 1
-        index += 1
-    while y < self.height:
-      b = self.bitmaps[index]
-      x = b.x_origin - x_origin
-      dc.DrawBitmap(b, x, y)
-      y += 1
-      index += 1
+        index = (index + 1) % wf_height
+        count -= 1
+    while y < self.height:	# Copy each run of rows with the same x_origin; usually one run and two blits
+      if count > 0:
+        n = min(count, self.height - y, wf_height - index)
+        dc.Blit(x - x_origin, y, width, n, wf_dc, 0, index)
+        y += n
+        count -= n
+        index = (index + n) % wf_height
+      else:
+        try:
+          count, x = next(runs)
+        except StopIteration:
+          break
     dc.SetPen(self.tuningPen)
     dc.SetLogicalFunction(wx.XOR)
     dc.DrawLine(self.tune_tx, 0, self.tune_tx, self.height)
@@ -1819,22 +1951,29 @@ class WaterfallDisplay(wx.Window):
   def SetHeight(self, height):
     self.height = height
     self.SetSize((self.graph_width, height))
-  def OnGraphData(self, data, y_zero, y_scale):
+  def OnGraphData(self, data, y_zero, y_scale, start=0):
     sample_rate = int(self.sample_rate * self.zoom)
     #T('graph start')
-    row = ''		# Make a new row of pixels for a one-line image
-    gain = self.rf_gain
-    for x in data:	# x is -130 to 0, or so (dB)
-      l = int((x - gain + y_zero // 3 + 100) * y_scale / 10)
-      l = max(l, 0)
-      l = min(l, 255)
-      row = row + "%c%c%c" % (chr(self.red[l]), chr(self.green[l]), chr(self.blue[l]))
+    # Make a new row of pixels for a one-line image from data[start:start + graph_width].
+    # Data x is -130 to 0, or so (dB); the palette index is (x - rf_gain + y_zero // 3 + 100) * y_scale / 10.
+    QS.waterfall_row(data, start, self.palette, float(y_zero // 3 + 100 - self.rf_gain), y_scale, self.row)
     #T('graph string')
-    # Perhaps use 4-byte pixels and BitmapFromBufferRGBA()
-    bmp = wx.BitmapFromBuffer(len(row) // 3, 1, row)
-    bmp.x_origin = int(float(self.VFO) / sample_rate * self.data_width + 0.5)
-    self.bitmaps.insert(0, bmp)
-    del self.bitmaps[-1]
+    if hasattr(self.row_bitmap, 'CopyFromBuffer'):
+      self.row_bitmap.CopyFromBuffer(self.row)
+    else:		# older wxPython
+      self.row_bitmap = wx.BitmapFromBuffer(self.graph_width, 1, self.row)
+    # Write the new row above the previous row in the circular image
+    self.wf_index = (self.wf_index - 1) % self.wf_height
+    self.wf_dc.DrawBitmap(self.row_bitmap, 0, self.wf_index)
+    x_origin = int(float(self.VFO) / sample_rate * self.data_width + 0.5)
+    runs = self.wf_runs
+    if runs[0][1] == x_origin:
+      runs[0][0] += 1
+    else:
+      runs.insert(0, [1, x_origin])
+    runs[-1][0] -= 1		# the oldest row is overwritten
+    if runs[-1][0] <= 0:
+      del runs[-1]
     #self.ScrollWindow(0, 1, None)
     #self.Refresh(False, (0, 0, self.graph_width, self.top_size + self.margin))
     self.Refresh(False)
@@ -1925,8 +2064,7 @@ class WaterfallPane(GraphScreen):
     self.y_zero = y_zero
   def OnGraphData(self, data):
     i1 = (self.data_width - self.graph_width) // 2
-    i2 = i1 + self.graph_width
-    self.display.OnGraphData(data[i1:i2], self.y_zero, self.y_scale)
+    self.display.OnGraphData(data, self.y_zero, self.y_scale, i1)
 
 class ScopeScreen(wx.Window):
   """Create an oscilloscope screen (mostly used for debug)."""
@@ -2449,19 +2587,8 @@ class App(wx.App):
     self.digital_tx_level = conf.digital_tx_level
     self.hot_key_ptt_on = False
     self.fft_size = 1
-    # Quisk control by Hamlib through rig 2
-    self.hamlib_clients = []	# list of TCP connections to handle
-    if conf.hamlib_port:
-      try:
-        self.hamlib_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.hamlib_socket.bind(('localhost', conf.hamlib_port))
-        self.hamlib_socket.settimeout(0.0)
-        self.hamlib_socket.listen(0)	# listen for TCP connections from multiple clients
-      except:
-        self.hamlib_socket = None
-        # traceback.print_exc()
-    else:
-      self.hamlib_socket = None
+    # Quisk control by Hamlib through rig 2; the server thread starts after the main frame is made
+    self.hamlib_server = None
     # Quisk control by fldigi
     self.fldigi_new_freq = None
     self.fldigi_freq = None
@@ -2488,6 +2615,8 @@ class App(wx.App):
     self.zooming = False
     self.split_rxtx = False	# Are we in split Rx/Tx mode?
     self.savedState = {}
+    self.filter_cache = collections.OrderedDict()	# Filter coefficients by (rate, N, bw, center)
+    self.filter_cache_path = ''
     self.pttButton = None
     self.tmp_playing = False
     # get the screen size - thanks to Lucian Langa
@@ -2523,6 +2652,18 @@ class App(wx.App):
       print("""Old sound card amplitude and phase corrections must be re-entered (sorry).
 The new code supports multiple corrections per band.""")
       self.bandAmplPhase = {}
+    # Restore the cache of filter coefficients
+    if conf.filter_cache_file:
+      self.filter_cache_path = os.path.join(os.path.dirname(ConfigPath), '.quisk_filters.pkl')
+      try:
+        fp = open(self.filter_cache_path, "rb")
+        items = pickle.load(fp)
+        fp.close()
+        if conf.filter_cache_size > 0:
+          for key, filt in items[-conf.filter_cache_size:]:
+            self.filter_cache[key] = filt
+      except:
+        pass #traceback.print_exc()
     if Hardware.VarDecimGetChoices():	# Hardware can change the decimation.
       self.sample_rate = Hardware.VarDecimSet()	# Get the sample rate.
       self.vardecim_set = self.sample_rate
@@ -2613,12 +2754,18 @@ The new code supports multiple corrections per band.""")
       h = self.main_frame.GetHandle()
     else:
       h = 0
+    if conf.fftw_wisdom:
+      wisdom = self.FftwWisdomPath()
+    else:
+      wisdom = ''
     QS.record_app(self, conf, self.data_width, self.fft_size,
-                 average_count, self.sample_rate, h)
+                 average_count, self.sample_rate, h, wisdom)
     #print ('FFT size %d, FFT mult %d, average_count %d, rate %d, Refresh %.2f Hz' % (
     #    self.fft_size, self.fft_size / self.data_width, average_count, self.sample_rate,
     #    float(self.sample_rate) / self.fft_size / average_count))
     QS.record_graph(0, 0, 1.0)
+    # Graph data is written into this preallocated buffer by QS.get_graph(); it is re-used for each refresh.
+    self.graph_data = array.array('d', [0.0]) * self.data_width
     QS.set_tx_audio(vox_level=20, vox_time=self.timeVOX)	# Turn off VOX, set VOX time
     # Make all the screens and hide all but one
     self.graph = GraphScreen(frame, self.data_width, self.graph_width)
@@ -2745,6 +2892,14 @@ The new code supports multiple corrections per band.""")
       self.Yield()
       self.sound_thread = SoundThread()
       self.sound_thread.start()
+    if conf.hamlib_port:
+      try:
+        self.hamlib_server = HamlibServer(self, conf.hamlib_port)
+      except:
+        self.hamlib_server = None
+        # traceback.print_exc()
+      else:
+        self.hamlib_server.start()
     if conf.dxClHost:
       # create DX Cluster and register listener for change notification
       self.dxCluster = dxcluster.DxCluster()    
@@ -2764,6 +2919,8 @@ The new code supports multiple corrections per band.""")
     time.sleep(0.1)
     if self.sound_thread:
       self.sound_thread.stop()
+    if self.hamlib_server:
+      self.hamlib_server.stop()
     for i in range(0, 20):
       if threading.activeCount() == 1:
         break
@@ -2774,6 +2931,23 @@ The new code supports multiple corrections per band.""")
     QS.close_rx_udp()
     Hardware.close()
     self.SaveState()
+    self.SaveFilterCache()
+    QS.save_fftw_wisdom()
+  def FftwWisdomPath(self):	# Return the FFTW wisdom file name for this CPU and FFT size
+    cpu = ''
+    try:
+      fp = open('/proc/cpuinfo', 'r')
+      for line in fp:
+        if line.startswith('model name'):
+          cpu = line.split(':', 1)[1]
+          break
+      fp.close()
+    except:
+      pass
+    if not cpu:
+      cpu = os.getenv('PROCESSOR_IDENTIFIER', '') or platform.machine()
+    cpu = ''.join([c if c.isalnum() else '_' for c in cpu.strip()])
+    return os.path.join(os.path.dirname(ConfigPath), '.quisk_fftw_%s_%d.wisdom' % (cpu, self.fft_size))
   def CheckState(self):		# check whether state has changed
     changed = False
     if self.init_path:		# save current program state
@@ -2798,6 +2972,14 @@ The new code supports multiple corrections per band.""")
         fp.close()
       except:
         pass #traceback.print_exc()
+  def SaveFilterCache(self):
+    if self.filter_cache_path:		# save the filter coefficients, least recently used first
+      try:
+        fp = open(self.filter_cache_path, "wb")
+        pickle.dump(list(self.filter_cache.items()), fp, 2)
+        fp.close()
+      except:
+        pass #traceback.print_exc()
   def MakeTopRow(self, frame, gbs, button_width, button_height):
     # Down button
     b_down = QuiskRepeatbutton(frame, self.OnBtnDownBand, conf.Xbtn_text_range_dn,
@@ -3068,56 +3250,18 @@ The new code supports multiple corrections per band.""")
       buttons[i].SetLabel(str(args[i]))
       buttons[i].Refresh()
   def MakeFilterCoef(self, rate, N, bw, center):
-    """Make an I/Q filter with rectangular passband."""
-    lowpass = bw * 24000 // rate // 2
-    if lowpass in Filters:
-      filtD = Filters[lowpass]
-      #print "Custom filter rate %d bandwidth %d" % (rate, bw)
-    else:
-      #print "Window filter rate %d bandwidth %d" % (rate, bw)
-      if N is None:
-        shape = 1.5       # Shape factor at 88 dB
-        trans = (bw / 2.0 / rate) * (shape - 1.0)     # 88 dB atten
-        N = int(4.0 / trans)
-        if N > 1000:
-          N = 1000
-        N = (N // 2) * 2 + 1
-      K = bw * N / rate
-      filtD = []
-      pi = math.pi
-      sin = math.sin
-      cos = math.cos
-      for k in range(-N//2, N//2 + 1):
-        # Make a lowpass filter
-        if k == 0:
-          z = float(K) / N
-        else:
-          z = 1.0 / N * sin(pi * k * K / N) / sin(pi * k / N)
-        # Apply a windowing function
-        if 1:	# Blackman window
-          w = 0.42 + 0.5 * cos(2. * pi * k / N) + 0.08 * cos(4. * pi * k / N)
-        elif 0:	# Hamming
-          w = 0.54 + 0.46 * cos(2. * pi * k / N)
-        elif 0:	# Hanning
-          w = 0.5 + 0.5 * cos(2. * pi * k / N)
-        else:
-          w = 1
-        z *= w
-        filtD.append(z)
-    if center:
-      # Make a bandpass filter by tuning the low pass filter to new center frequency.
-      # Make two quadrature filters.
-      filtI = []
-      filtQ = []
-      tune = -1j * 2.0 * math.pi * center / rate;
-      NN = len(filtD)
-      D = (NN - 1.0) / 2.0;
-      for i in range(NN):
-        z = 2.0 * cmath.exp(tune * (i - D)) * filtD[i]
-        filtI.append(z.real)
-        filtQ.append(z.imag)
-      return filtI, filtQ
-    return filtD, filtD
+    """Return I/Q filter coefficients as array('d'), from the cache or a new design."""
+    key = (rate, N, bw, center)
+    try:
+      filt = self.filter_cache.pop(key)
+    except KeyError:
+      filt = DesignFilterCoef(rate, N, bw, center)
+      if conf.filter_cache_size > 0:
+        while len(self.filter_cache) >= conf.filter_cache_size:
+          self.filter_cache.popitem(last=False)	# discard the least recently used filter
+    if conf.filter_cache_size > 0:
+      self.filter_cache[key] = filt		# the most recently used filter is last
+    return filt
   def UpdateFilterDisplay(self):
     # Note: Filter bandwidths are ripple bandwidths with a shape factor of 1.2.
     # Also, SSB filters start at 300 Hz.
@@ -3922,20 +4066,6 @@ The new code supports multiple corrections per band.""")
         if rxtx != 'rx':
           self.fldigi_server.main.rx()
           self.fldigi_timer = time.time()
-  def HamlibPoll(self):		# Poll for Hamlib commands
-    if self.hamlib_socket:
-      try:		# Poll for new client connections.
-        conn, address = self.hamlib_socket.accept()
-      except socket.error:
-        pass
-      else:
-        # print 'Connection from', address
-        self.hamlib_clients.append(HamlibHandler(self, conn, address))
-      for client in self.hamlib_clients:	# Service existing clients
-        if not client.Process():		# False return indicates a closed connection; remove the handler for this client
-          self.hamlib_clients.remove(client)
-          # print 'Remove', client.address
-          break
   def OnReadSound(self):	# called at frequent intervals
     if self.pttButton:	# Manage the PTT button using VOX and hot keys
       ptt = None
@@ -3969,8 +4099,8 @@ The new code supports multiple corrections per band.""")
         self.screen.data = data
         self.screen.OnGraphData(data)
     else:
-      data = QS.get_graph(1, self.zoom, float(self.zoom_deltaf))	# get FFT data
-      if data:
+      if QS.get_graph(1, self.zoom, float(self.zoom_deltaf), self.graph_data):	# get FFT data
+        data = self.graph_data
         #T('')
         if self.smeter_usage == "smeter":
           self.NewSmeter()			# update the S-meter
@@ -4012,7 +4142,6 @@ The new code supports multiple corrections per band.""")
           self.BandFromFreq(tune)
           self.ChangeDisplayFrequency(tune - vfo, vfo)
         self.FldigiPoll()
-        self.HamlibPoll()
       if self.timer - self.save_time0 > 20.0:
         self.save_time0 = self.timer
         if self.CheckState():
@@ -93,6 +93,13 @@ filter_y_zero  = 0
 #persistent_state = False
 persistent_state = True
 
+# Quisk keeps the receive filter coefficients it has designed in a cache, so changing filters
+# is fast.  filter_cache_size is the number of filters to keep.  If filter_cache_file is True,
+# the cache is saved in the file .quisk_filters.pkl in the same directory as your config file.
+# Delete this file if you change filters.py.
+filter_cache_size = 64
+filter_cache_file = False
+
 # The quisk config screen has a "favorites" tab where you can enter the frequencies and modes of
 # stations.  The data is stored in this file; default quisk_favorites.txt in the directory
 # where your config file is located.
@@ -379,6 +386,9 @@ rx_udp_ip = "192.168.2.196"				# Sample source IP address
 rx_udp_ip_netmask = '255.255.255.0'		# The netmask for the network of rx_udp_ip
 rx_udp_port = 0xBC77					# Sample source UDP port
 rx_udp_clock = 122880000				# ADC sample rate in Hertz
+# This is the size in bytes of the operating system receive buffer for the UDP samples.  Increase it
+# if you see lost packets at high sample rates.  The counts are returned by QS.get_udp_stats().
+rx_udp_recv_buffer = 256000
 sndp_active = True						# Enable setting the hardware IP to rx_udp_ip
 
 # Vendor and product ID's for the SoftRock
@@ -809,6 +819,27 @@ if sys.platform == "win32":
 else:
   data_poll_usec = 5000		# poll time in microseconds
 
+# If capture_thread is True, the radio samples are read by a separate high priority thread and passed
+# to the sound processing through a buffer.  A slow sound card write or file write then does not cause
+# lost samples.  The buffer use and overruns are shown on the Config screen.
+capture_thread = True
+
+# If alsa_capture_mmap is True, ALSA sound card capture reads the samples directly from the sound
+# card buffer (mmap access) if the device supports it.  Set it to False to copy the samples
+# with snd_pcm_readi() instead.
+alsa_capture_mmap = True
+
+# Extra receive channels (see set_rx_channel() in quisk.c) can be taken from a polyphase FFT
+# channelizer that splits the samples into channels 48 kHz apart in one pass.  This is used when
+# the sample rate is a multiple of 96000 and at least 192000.  Set rx_channelizer to False to tune
+# and decimate each extra channel separately.
+rx_channelizer = True
+
+# Receive filters with at least rx_fft_filter_taps coefficients use partitioned FFT convolution, which
+# is much faster for long narrow filters.  It adds a delay of 64 samples for filters up to 2048
+# coefficients, which is about 11 milliseconds for CW at 6 ksps.  Use 0 to always use the direct filter.
+rx_fft_filter_taps = 256
+
 # The fft_size is the width of the data on the screen (about 800 to
 # 1200 pixels) times the fft_size_multiplier.  Multiple FFTs are averaged
 # together to achieve your graph refresh rate.  If fft_size_multiplier is
@@ -829,6 +860,27 @@ fft_size_multiplier = 0
 
 graph_refresh = 7			# update the graph at this rate in Hertz
 
+# The fft_window is the window function applied to the samples before the graph FFT.
+# Use "Hanning" for general use.  "Blackman-Harris" has lower sidelobes to show weak signals
+# next to strong ones, "Flat-top" measures signal amplitude accurately, and "Kaiser" uses
+# fft_window_kaiser_beta to trade resolution for sidelobe level.  The graph and S-meter
+# are corrected for the window.  The window can be changed with QS.set_fft_window().
+fft_window = "Hanning"
+# fft_window = "Hamming"
+# fft_window = "Blackman-Harris"
+# fft_window = "Flat-top"
+# fft_window = "Kaiser"
+fft_window_kaiser_beta = 6.0
+
+# Quisk measures the fastest way to calculate its FFTs when it starts, and this can take
+# several seconds for large FFT sizes.  If fftw_wisdom is True, the results ("wisdom") are
+# saved in a file in the same directory as your config file, and startup is fast after the
+# first run.  There is a separate file for each CPU type and FFT size.  Set fftw_wisdom_patient
+# to True and run Quisk once to find even faster FFT plans; this can take minutes, but the
+# result is saved.  You can also make wisdom with the FFTW program "fftw-wisdom".
+fftw_wisdom = True
+fftw_wisdom_patient = False
+
 # latency_millisecs determines how many samples are in the soundcard play buffer.
 # A larger number makes it less likely that you will run out of samples to play,
 # but increases latency.  It is OK to suffer a certain number of play buffer 
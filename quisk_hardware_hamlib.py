@@ -8,12 +8,18 @@
 # the frequency.  If it did, the change is sent to Quisk.
 #
 # These are the attributes we watch:  Rx frequency, mode
+#
+# All socket I/O is done by a separate thread so the GUI never waits for rigctld.  Each poll
+# sends any pending set commands and the frequency and mode queries in one write, and then
+# reads all the replies.  Only the latest frequency and mode are sent, so fast tuning in Quisk
+# does not queue up commands.  Changes made at the rig are sent to the GUI as they arrive.
 
 from __future__ import print_function
 
 DEBUG = 0
 
-import socket, time, traceback
+import socket, select, time, traceback, threading
+import wx
 import _quisk as QS
 
 from quisk_hardware_model import Hardware as BaseHardware
@@ -29,33 +35,28 @@ class Hardware(BaseHardware):
     self.quisk_freq = None
     self.quisk_vfo = None
     self.quisk_mode = 'USB'
-    self.received = ''
-    self.toggle = False
-    self.time0 = 0
+    self.lock = threading.Lock()		# Lock for the radio and quisk frequency and mode
+    self.thread = None
   def open(self):
     ret = BaseHardware.open(self)
-    self.hamlib_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    self.hamlib_socket.settimeout(0.0)
-    self.ConnectRigctld()
+    self.thread = RigctldThread(self)
+    self.thread.start()
     return ret
   def close(self):
-    self.hamlib_socket.close()
+    if self.thread:
+      self.thread.stop()
+      self.thread.join(2.0)
+      self.thread = None
     self.hamlib_connected = False
     return BaseHardware.close(self)
-  def ConnectRigctld(self):
-    if self.hamlib_connected:
-      return True
-    try:
-      self.hamlib_socket.connect(('localhost', self.hamlib_rigctld_port))
-    except:
-      return False      # Failure to connect
-    self.hamlib_connected = True
-    if DEBUG: print("rigctld connected")
-    return True         # Success
   def ChangeFrequency(self, tune, vfo, source='', band='', event=None):
+    self.lock.acquire()
     self.quisk_freq = tune
     self.quisk_vfo = tune
+    self.lock.release()
     if DEBUG: print('Change', source, tune)
+    if source != 'hamlib' and self.thread:
+      self.thread.wakeup.set()		# Send the new frequency now
     return self.quisk_freq, self.quisk_vfo
   def ReturnFrequency(self):
     # Return the current tuning and VFO frequency.  If neither have changed,
@@ -69,88 +70,151 @@ class Hardware(BaseHardware):
       mode = 'CW'
     elif mode[0:4] == 'DGT-':
       mode = 'USB'
+    self.lock.acquire()
     self.quisk_mode = mode
+    self.lock.release()
     if DEBUG: print('Change', mode)
+    if self.thread:
+      self.thread.wakeup.set()
   def ChangeBand(self, band):
     # band is a string: "60", "40", "WWV", etc.
     pass
   def HeartBeat(self):	# Called at about 10 Hz by the main
-    if not self.hamlib_connected:	# Continually try to connect
-      try:
-        self.hamlib_socket.connect(('localhost', self.hamlib_rigctld_port))
-      except:
-        return
-      else:
-        self.hamlib_connected = True
-        if DEBUG: print("rigctld Connected")
-    self.ReadHamlib()
-    if time.time() - self.time0 < self.hamlib_poll_seconds:
-      return
-    self.time0 = time.time()
+    pass
+  def PendingCommands(self):
+    # Called by the I/O thread.  Return the set commands needed to make the radio agree with Quisk.
+    cmds = []
+    self.lock.acquire()
     if self.quisk_mode != self.radio_mode:
-      self.HamlibSend("|M %s 0\n" % self.quisk_mode)
-    elif self.quisk_freq != self.radio_freq:
-      self.HamlibSend("|F %d\n" % self.quisk_freq)
-    elif self.toggle:
-      self.toggle = False
-      self.HamlibSend("|f\n")		# Poll for frequency
-    else:
-      self.toggle = True
-      self.HamlibSend("|m\n")		# Poll for mode
-  def HamlibSend(self, text):
-    if DEBUG: print('Send', text, end=' ')
-    try:
-      self.hamlib_socket.sendall(text)
-    except socket.error:
-      pass
-  def ReadHamlib(self):
-    if not self.hamlib_connected:
+      cmds.append("|M %s 0\n" % self.quisk_mode)
+    if self.quisk_freq is not None and self.quisk_freq != self.radio_freq:
+      cmds.append("|F %d\n" % self.quisk_freq)
+    self.lock.release()
+    return cmds
+  def ParseReply(self, reply):
+    # Called by the I/O thread for each reply line.
+    fields = reply.split('|')
+    if fields[-1] != 'RPRT 0':
+      if DEBUG: print('Reject', reply)
       return
-    try:	# Read any data from the socket
-      text = self.hamlib_socket.recv(1024)
-    except socket.timeout:	# This does not work
-      pass
-    except socket.error:	# Nothing to read
-      pass
-    else:					# We got some characters
-      self.received += text
-    while '\n' in self.received:	# A complete response ending with newline is available
-      reply, self.received = self.received.split('\n', 1)	# Split off the reply, save any further characters
-      reply = reply.strip()		# Here is our reply
-      if reply[-6:] != 'RPRT 0':
-        if DEBUG: print('Reject', reply)
-        continue
-      try:
-        if reply[0:9] == 'set_freq:':		# set_freq: 18120472|RPRT 0
-          freq, status = reply[9:].split('|')
-          freq = int(freq)
-          if DEBUG: print('  Radio S freq', freq)
+    cmd = fields[0]
+    self.lock.acquire()
+    try:
+      if cmd[0:9] == 'set_freq:':		# set_freq: 18120472|RPRT 0
+        freq = int(cmd[9:])
+        if DEBUG: print('  Radio S freq', freq)
+        self.radio_freq = freq
+      elif cmd == 'get_freq:':		# get_freq:|Frequency: 18120450|RPRT 0
+        freq = int(fields[1].split(':')[1])
+        if DEBUG: print('    Radio G freq', freq)
+        if self.quisk_freq == self.radio_freq and self.radio_freq != freq:	# The radio changed the frequency
           self.radio_freq = freq
-        elif reply[0:9] == 'get_freq:':	# get_freq:|Frequency: 18120450|RPRT 0
-          z, freq, status = reply.split('|')
-          z, freq = freq.split(':')
-          freq = int(freq)
-          if DEBUG: print('    Radio G freq', freq)
-          if self.quisk_freq == self.radio_freq:
-            self.radio_freq = freq
-            self.ChangeFrequency(freq, self.quisk_vfo, 'hamlib')
-        elif reply[0:9] == 'set_mode:':	# set_mode: FM 0|RPRT 0
-          mode, status = reply[9:].split('|')
-          mode, z = mode.split()
-          if DEBUG: print('  Radio S mode', mode)
+          self.quisk_freq = freq
+          self.quisk_vfo = freq
+          wx.CallAfter(self.OnRadioFrequency)
+      elif cmd[0:9] == 'set_mode:':	# set_mode: FM 0|RPRT 0
+        mode = cmd[9:].split()[0]
+        if DEBUG: print('  Radio S mode', mode)
+        self.radio_mode = mode
+      elif cmd == 'get_mode:':		# get_mode:|Mode: FM|Passband: 12000|RPRT 0
+        mode = fields[1].split()[1]
+        if DEBUG: print('    Radio G mode', mode)
+        if self.quisk_mode == self.radio_mode and self.radio_mode != mode:	# The radio changed the mode
           self.radio_mode = mode
-        elif reply[0:9] == 'get_mode:':	# get_mode:|Mode: FM|Passband: 12000|RPRT 0
-          z, mode, passb, status = reply.split('|')
-          z, mode = mode.split()
-          if DEBUG: print('    Radio G mode', mode)
-          if self.quisk_mode == self.radio_mode:
-            if self.radio_mode != mode:		# The radio changed the mode
-              self.radio_mode = mode
-              self.quisk_mode = mode
-              if mode in ('CW', 'CWR'):
-                mode = 'CWU'
-              self.application.OnBtnMode(None, mode)		# Set mode
-        else:
-          if DEBUG: print('Unknown', reply)
-      except:
-        if DEBUG: traceback.print_exc()
+          self.quisk_mode = mode
+          if mode in ('CW', 'CWR'):
+            mode = 'CWU'
+          wx.CallAfter(self.application.OnBtnMode, None, mode)		# Set mode
+      else:
+        if DEBUG: print('Unknown', reply)
+    except:
+      if DEBUG: traceback.print_exc()
+    finally:
+      self.lock.release()
+  def OnRadioFrequency(self):
+    # Called in the GUI thread when the radio changed its frequency.
+    tune, vfo = self.quisk_freq, self.quisk_vfo
+    if tune is not None and vfo is not None:
+      self.application.BandFromFreq(tune)
+      self.application.ChangeDisplayFrequency(tune - vfo, vfo)
+
+class RigctldThread(threading.Thread):
+  """Connect to rigctld, send pending commands and poll for changes."""
+  min_backoff = 0.5	# Seconds to wait before the first reconnect attempt
+  max_backoff = 10.0	# Maximum seconds between reconnect attempts
+  reply_timeout = 2.0	# Seconds to wait for the replies to a poll
+  def __init__(self, hardware):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.hardware = hardware
+    self.wakeup = threading.Event()	# Set to poll immediately
+    self.doQuit = threading.Event()
+    self.sock = None
+  def stop(self):
+    self.doQuit.set()
+    self.wakeup.set()
+  def run(self):
+    backoff = self.min_backoff
+    while not self.doQuit.isSet():
+      if not self.Connect():
+        self.doQuit.wait(backoff)
+        backoff = min(backoff * 2, self.max_backoff)
+        continue
+      backoff = self.min_backoff
+      try:
+        while not self.doQuit.isSet():
+          self.Poll()
+          self.wakeup.wait(self.hardware.hamlib_poll_seconds)
+          self.wakeup.clear()
+      except (socket.error, IOError) as err:
+        if DEBUG: print("rigctld disconnected:", err)
+      self.Disconnect()
+  def Connect(self):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(self.reply_timeout)
+    try:
+      sock.connect(('localhost', self.hardware.hamlib_rigctld_port))
+    except socket.error:
+      sock.close()
+      return False      # Failure to connect
+    self.sock = sock
+    self.hardware.hamlib_connected = True
+    if DEBUG: print("rigctld connected")
+    return True         # Success
+  def Disconnect(self):
+    self.hardware.hamlib_connected = False
+    if self.sock:
+      self.sock.close()
+      self.sock = None
+    # Forget the radio state so that Quisk sends its frequency and mode after a reconnect
+    hw = self.hardware
+    hw.lock.acquire()
+    hw.radio_freq = None
+    hw.radio_mode = None
+    hw.lock.release()
+  def Poll(self):
+    # Send the set commands and the queries in one write, and read all the replies.
+    cmds = self.hardware.PendingCommands()
+    cmds.append("|f\n")		# Poll for frequency
+    cmds.append("|m\n")		# Poll for mode
+    text = ''.join(cmds)
+    if DEBUG: print('Send', text.replace('\n', ' '))
+    self.sock.sendall(text)
+    expected = len(cmds)
+    received = ''
+    deadline = time.time() + self.reply_timeout
+    while expected > 0:
+      timeout = deadline - time.time()
+      if timeout <= 0:
+        raise IOError("timeout waiting for rigctld")
+      r, w, x = select.select([self.sock], [], [], timeout)
+      if not r:
+        continue
+      data = self.sock.recv(4096)
+      if not data:
+        raise IOError("rigctld closed the connection")
+      received += data
+      while expected > 0 and '\n' in received:	# A complete response ending with newline is available
+        reply, received = received.split('\n', 1)
+        expected -= 1
+        self.hardware.ParseReply(reply.strip())
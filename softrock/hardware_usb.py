@@ -3,7 +3,7 @@
 
 from __future__ import print_function
 
-import struct, threading, time, traceback, math
+import struct, threading, time, traceback, math, bisect, collections
 from quisk_hardware_model import Hardware as BaseHardware
 import _quisk as QS
 
@@ -24,6 +24,26 @@ SI570_MAX_DCO = 5.67e9
 # stuffing it.  We want to find the highest HSDIV first, so start
 # from 11.
 SI570_HSDIV_VALUES = [11, 9, 7, 6, 5, 4]
+# Small frequency changes keep the same HSDIV and N1 and only change RFREQ.  The Si570
+# can do this without a DCO retune (and without a glitch) within 3500 ppm of the center
+# frequency.
+SI570_SMOOTH_PPM = 3500
+SI570_CACHE_SIZE = 256		# Number of register words to remember
+
+def MakeSi570Bands():
+  # Return a table of (divider, hsdiv, n1) sorted by the total divider hsdiv * n1.  Each divider
+  # covers the band of frequencies SI570_MIN_DCO / divider to SI570_MAX_DCO / divider.  The
+  # lowest divider gives the lowest DCO frequency.  For equal dividers, use the highest HSDIV.
+  bands = {}
+  for hsdiv in SI570_HSDIV_VALUES:
+    for n1 in range(2, 129, 2):
+      divider = hsdiv * n1
+      if divider not in bands:
+        bands[divider] = (divider, hsdiv, n1)
+  return [bands[d] for d in sorted(bands)]
+
+SI570_BANDS = MakeSi570Bands()
+SI570_DIVIDERS = [b[0] for b in SI570_BANDS]
 
 IN =  usb.util.build_request_type(usb.util.CTRL_IN,  usb.util.CTRL_TYPE_VENDOR, usb.util.CTRL_RECIPIENT_DEVICE)
 OUT = usb.util.build_request_type(usb.util.CTRL_OUT, usb.util.CTRL_TYPE_VENDOR, usb.util.CTRL_RECIPIENT_DEVICE)
@@ -38,8 +58,12 @@ class Hardware(BaseHardware):
     self.vfo = None
     self.ptt_button = 0
     self.is_cw = False
-    self.key_thread = None
+    self.usb_thread = None
     self.si570_i2c_address = conf.si570_i2c_address
+    self.si570_band = None		# The current (divider, hsdiv, n1) for SetFreqByDirect()
+    self.si570_center = 0		# The frequency where the band was chosen
+    self.si570_regs = None		# The last register string sent
+    self.si570_cache = collections.OrderedDict()	# Register strings by (freq, band)
   def open(self):			# Called once to open the Hardware
     # find our device
     usb_dev = usb.core.find(idVendor=self.conf.usb_vendor_id, idProduct=self.conf.usb_product_id)
@@ -66,8 +90,11 @@ class Hardware(BaseHardware):
           ver = 'unknown'
         text = 'Capture from SoftRock USB on %s, Firmware %s' % (self.conf.name_of_sound_capt , ver)
         if self.conf.name_of_mic_play and self.conf.key_poll_msec:
-          self.key_thread = KeyThread(usb_dev, self.conf.key_poll_msec / 1000.0, self.conf.key_hang_time)
-          self.key_thread.start()
+          poll_secs = self.conf.key_poll_msec / 1000.0
+        else:
+          poll_secs = 0		# Do not poll the key
+        self.usb_thread = UsbThread(self, poll_secs, self.conf.key_hang_time)
+        self.usb_thread.start()
     self.application.bottom_widgets.info_text.SetLabel(text)
     if DEBUG:
       print ('Startup freq', self.GetStartupFreq())
@@ -78,20 +105,30 @@ class Hardware(BaseHardware):
       print ('Smooth tune', sm)
     return text
   def close(self):			# Called once to close the Hardware
-    if self.key_thread:
-      self.key_thread.stop()
-      self.key_thread = None
+    if self.usb_thread:
+      self.usb_thread.stop()
+      self.usb_thread.join(1.0)
+      self.usb_thread = None
   def ChangeFrequency(self, tune, vfo, source='', band='', event=None):
-    if self.usb_dev and self.vfo != vfo:
-      if self.conf.si570_direct_control:
-        if self.SetFreqByDirect(vfo - self.transverter_offset):
-          self.vfo = vfo
-      elif self.SetFreqByValue(vfo - self.transverter_offset):
-         self.vfo = vfo
-      if DEBUG:
-        print ('Change to', vfo)
-        print ('Run freq', self.GetFreq())
+    # The frequency is sent to the USB thread and we return immediately.  If the thread
+    # is still busy, only the latest frequency is sent.
+    if self.usb_thread and self.vfo != vfo:
+      self.vfo = vfo
+      self.usb_thread.SetVFO(vfo)
+      if DEBUG: print ('Change to', vfo)
     return tune, vfo
+  def SetVFO(self, vfo):
+    # Called by the USB thread to send the VFO frequency.  Return True for success.
+    try:
+      if self.conf.si570_direct_control:
+        ok = self.SetFreqByDirect(vfo - self.transverter_offset)
+      else:
+        ok = self.SetFreqByValue(vfo - self.transverter_offset)
+    except usb.core.USBError:
+      if DEBUG: traceback.print_exc()
+      ok = False
+    if DEBUG: print ('Run freq', self.GetFreq())
+    return bool(ok)
   def ReturnFrequency(self):
     # Return the current tuning and VFO frequency.  If neither have changed,
     # you can return (None, None).  This is called at about 10 Hz by the main.
@@ -103,40 +140,35 @@ class Hardware(BaseHardware):
       self.is_cw = True
     else:
       self.is_cw = False
-    if self.key_thread:
-      self.key_thread.IsCW(self.is_cw)
+    if self.usb_thread and self.usb_thread.key_poll:
+      self.usb_thread.IsCW(self.is_cw)
     elif hasattr(self, 'OnButtonPTT'):
       self.OnButtonPTT()
   def ChangeBand(self, band):
     # band is a string: "60", "40", "WWV", etc.
     BaseHardware.ChangeBand(self, band)
   def OnSpot(self, level):
-    if self.key_thread:
-      self.key_thread.OnSpot(level)
+    if self.usb_thread:
+      self.usb_thread.OnSpot(level)
   def HeartBeat(self):	# Called at about 10 Hz by the main
-    pass
+    if self.usb_thread:
+      for vfo in self.usb_thread.GetFailures():
+        if vfo == self.vfo:	# The frequency was not set; send it again on the next change
+          self.vfo = None
   def OnButtonPTT(self, event=None):
     if event:
       if event.GetEventObject().GetValue():
         self.ptt_button = 1
       else:
         self.ptt_button = 0
-    if self.key_thread:
-      self.key_thread.OnPTT(self.ptt_button)
-    elif self.usb_dev:
-      if self.is_cw:
-        QS.set_key_down(0)
-        QS.set_transmit_mode(self.ptt_button)
-      else:
-        QS.set_key_down(self.ptt_button)
-      try:
-        self.usb_dev.ctrl_transfer(IN, 0x50, self.ptt_button, 0, 3)
-      except usb.core.USBError:
-        if DEBUG: traceback.print_exc()
-        try:
-          self.usb_dev.ctrl_transfer(IN, 0x50, self.ptt_button, 0, 3)
-        except usb.core.USBError:
-          if DEBUG: traceback.print_exc()
+    if self.usb_thread:
+      if not self.usb_thread.key_poll:
+        if self.is_cw:
+          QS.set_key_down(0)
+          QS.set_transmit_mode(self.ptt_button)
+        else:
+          QS.set_key_down(self.ptt_button)
+      self.usb_thread.OnPTT(self.ptt_button)
   def GetStartupFreq(self):	# return the startup frequency / 4
     if not self.usb_dev:
       return 0
@@ -167,55 +199,64 @@ class Hardware(BaseHardware):
   def SetFreqByDirect(self, freq):	# Thanks to Ethan Blanton, KB8OJH
     if freq == 0.0:
       return False
-    # For now, find the minimum DCO speed that will give us the
-    # desired frequency; if we're slewing in the future, we want this
-    # to additionally yield an RFREQ ~= 512.
     freq = int(freq * 4)
-    dco_new = None
-    hsdiv_new = 0
-    n1_new = 0
-    for hsdiv in SI570_HSDIV_VALUES:
-      n1 = int(math.ceil(SI570_MIN_DCO / (freq * hsdiv)))
-      if n1 < 1:
-        n1 = 1
-      else:
-        n1 = ((n1 + 1) / 2) * 2
-      dco = (freq * 1.0) * hsdiv * n1
-      # Since we're starting with max hsdiv, this can only happen if
-      # freq was larger than we can handle
-      if n1 > 128:
-        continue
-      if dco < SI570_MIN_DCO or dco > SI570_MAX_DCO:
-        # This really shouldn't happen
-        continue
-      if not dco_new or dco < dco_new:
-        dco_new = dco
-        hsdiv_new = hsdiv
-        n1_new = n1
-    if not dco_new:
-      # For some reason, we were unable to calculate a frequency.
-      # Probably because the frequency requested is outside the range
-      # of our device.
-      return False		# Failure
-    rfreq = dco_new / self.conf.si570_xtal_freq
+    band = self.si570_band
+    center = self.si570_center
+    # Keep the current HSDIV and N1 for small changes so that only RFREQ changes.
+    if band and abs(freq - center) <= center * SI570_SMOOTH_PPM * 1E-6 and \
+        SI570_MIN_DCO <= freq * band[0] <= SI570_MAX_DCO:
+      pass
+    else:
+      # Find the minimum DCO speed that will give us the desired frequency.  This is the
+      # lowest divider with a DCO at least SI570_MIN_DCO.
+      index = bisect.bisect_left(SI570_DIVIDERS, SI570_MIN_DCO / freq)
+      while index < len(SI570_BANDS) and freq * SI570_DIVIDERS[index] < SI570_MIN_DCO:
+        index += 1
+      if index >= len(SI570_BANDS) or freq * SI570_DIVIDERS[index] > SI570_MAX_DCO:
+        # The frequency requested is outside the range of our device.
+        return False		# Failure
+      band = SI570_BANDS[index]
+      center = freq
+    key = (freq, band)
+    s = self.si570_cache.pop(key, None)
+    if s is None:
+      s = self.Si570Registers(freq, band)
+      if len(self.si570_cache) >= SI570_CACHE_SIZE:
+        self.si570_cache.popitem(last=False)
+    self.si570_cache[key] = s		# Most recently used is last
+    if s != self.si570_regs or band != self.si570_band:
+      self.usb_dev.ctrl_transfer(OUT, 0x30, self.si570_i2c_address + 0x700, 0, s)
+      self.si570_regs = s
+    self.si570_band = band
+    self.si570_center = center
+    return True		# Success
+  def Si570Registers(self, freq, band):
+    # Return the register string r7-r12 for the Si570 for frequency freq (4 times the VFO).
+    divider, hsdiv, n1 = band
+    rfreq = (freq * 1.0) * divider / self.conf.si570_xtal_freq
     rfreq_int = int(rfreq)
     rfreq_frac = int(round((rfreq - rfreq_int) * 2**28))
     # It looks like the DG8SAQ protocol just passes r7-r12 straight
     # To the Si570 when given command 0x30.  Easy enough.
     # n1 is stuffed as n1 - 1, hsdiv is stuffed as hsdiv - 4.
-    hsdiv_new = hsdiv_new - 4
-    n1_new = n1_new - 1
-    s = struct.Struct('>BBL').pack((hsdiv_new << 5) + (n1_new >> 2),
-                                   ((n1_new & 0x3) << 6) + (rfreq_int >> 4),
+    hsdiv = hsdiv - 4
+    n1 = n1 - 1
+    return struct.Struct('>BBL').pack((hsdiv << 5) + (n1 >> 2),
+                                   ((n1 & 0x3) << 6) + (rfreq_int >> 4),
                                    ((rfreq_int & 0xf) << 28) + rfreq_frac)
-    self.usb_dev.ctrl_transfer(OUT, 0x30, self.si570_i2c_address + 0x700, 0, s)
-    return True		# Success
 
-class KeyThread(threading.Thread):
-  """Create a thread to monitor the key state."""
-  def __init__(self, dev, poll_secs, key_hang_time):
-    self.usb_dev = dev
+class UsbThread(threading.Thread):
+  """Create a thread for all USB transfers after startup, and to monitor the key state.
+
+  Requests from the GUI are stored and the thread is woken up.  A new frequency replaces any
+  frequency not yet sent.  The key is polled every poll_secs only in CW mode; otherwise the
+  thread sleeps until there is a request."""
+  idle_secs = 0.5	# Time between retries of a failed PTT change
+  def __init__(self, hardware, poll_secs, key_hang_time):
+    self.hardware = hardware
+    self.usb_dev = hardware.usb_dev
     self.poll_secs = poll_secs
+    self.key_poll = poll_secs > 0
     self.key_hang_time = key_hang_time
     self.ptt_button = 0
     self.spot_level = 0
@@ -223,37 +264,35 @@ class KeyThread(threading.Thread):
     self.is_cw = False
     self.key_timer = 0
     self.is_transmit = 0
+    self.new_vfo = None		# The latest frequency not yet sent
+    self.failures = []		# Frequencies that could not be set
     threading.Thread.__init__(self)
+    self.daemon = True
+    self.wakeup = threading.Condition()
     self.doQuit = threading.Event()
     self.doQuit.clear()
   def run(self):
     while not self.doQuit.isSet():
-      if self.is_cw:
-        try:		# Test key up/down state
-          ret = self.usb_dev.ctrl_transfer(IN, 0x51, 0, 0, 1)
-        except usb.core.USBError:
-          if DEBUG: traceback.print_exc()
+      self.wakeup.acquire()
+      if self.new_vfo is None and not self.doQuit.isSet():
+        if self.key_poll and self.is_cw:
+          self.wakeup.wait(self.poll_secs)
+        elif self.ptt_button != self.currently_in_tx:	# Retry a failed PTT change
+          self.wakeup.wait(self.idle_secs)
         else:
-          # bit 0x20 is the tip, bit 0x02 is the ring (ring not used)
-          if self.spot_level or ret[0] & 0x20 == 0:		# Tip: key is down
-            QS.set_key_down(1)
-            self.is_transmit = 1
-            self.key_timer = time.time()
-          else:			# key is up
-            QS.set_key_down(0)
-            if self.is_transmit and time.time() - self.key_timer > self.key_hang_time:
-              self.is_transmit = 0
-          if self.is_transmit != self.currently_in_tx:
-            try:
-              self.usb_dev.ctrl_transfer(IN, 0x50, self.is_transmit, 0, 3)
-            except usb.core.USBError:
-              if DEBUG: traceback.print_exc()
-            else:
-              self.currently_in_tx = self.is_transmit	# success
-              QS.set_transmit_mode(self.is_transmit)
-              if DEBUG: print ("Change currently_in_tx", self.currently_in_tx)
+          self.wakeup.wait()
+      vfo = self.new_vfo
+      self.new_vfo = None
+      self.wakeup.release()
+      if vfo is not None and not self.hardware.SetVFO(vfo):
+        self.wakeup.acquire()
+        self.failures.append(vfo)
+        self.wakeup.release()
+      if self.key_poll and self.is_cw:
+        self.PollKey()
       elif self.ptt_button != self.currently_in_tx:
-        QS.set_key_down(self.ptt_button)
+        if self.key_poll:
+          QS.set_key_down(self.ptt_button)
         try:
           self.usb_dev.ctrl_transfer(IN, 0x50, self.ptt_button, 0, 3)
         except usb.core.USBError:
@@ -261,13 +300,55 @@ class KeyThread(threading.Thread):
         else:
           self.currently_in_tx = self.ptt_button	# success
           if DEBUG: print ("Change currently_in_tx", self.currently_in_tx)
-      time.sleep(self.poll_secs)
+  def PollKey(self):
+    try:		# Test key up/down state
+      ret = self.usb_dev.ctrl_transfer(IN, 0x51, 0, 0, 1)
+    except usb.core.USBError:
+      if DEBUG: traceback.print_exc()
+      return
+    # bit 0x20 is the tip, bit 0x02 is the ring (ring not used)
+    if self.spot_level or ret[0] & 0x20 == 0:		# Tip: key is down
+      QS.set_key_down(1)
+      self.is_transmit = 1
+      self.key_timer = time.time()
+    else:			# key is up
+      QS.set_key_down(0)
+      if self.is_transmit and time.time() - self.key_timer > self.key_hang_time:
+        self.is_transmit = 0
+    if self.is_transmit != self.currently_in_tx:
+      try:
+        self.usb_dev.ctrl_transfer(IN, 0x50, self.is_transmit, 0, 3)
+      except usb.core.USBError:
+        if DEBUG: traceback.print_exc()
+      else:
+        self.currently_in_tx = self.is_transmit	# success
+        QS.set_transmit_mode(self.is_transmit)
+        if DEBUG: print ("Change currently_in_tx", self.currently_in_tx)
+  def Notify(self):
+    self.wakeup.acquire()
+    self.wakeup.notify()
+    self.wakeup.release()
   def stop(self):
     """Set a flag to indicate that the thread should end."""
     self.doQuit.set()
+    self.Notify()
+  def SetVFO(self, vfo):
+    self.wakeup.acquire()
+    self.new_vfo = vfo
+    self.wakeup.notify()
+    self.wakeup.release()
+  def GetFailures(self):
+    self.wakeup.acquire()
+    failures = self.failures
+    self.failures = []
+    self.wakeup.release()
+    return failures
   def OnPTT(self, ptt):
     self.ptt_button = ptt
+    self.Notify()
   def OnSpot(self, level):
     self.spot_level = level
+    self.Notify()
   def IsCW(self, is_cw):
     self.is_cw = is_cw
+    self.Notify()
@@ -2,10 +2,17 @@
  * Sound modules that do not depend on alsa or portaudio
 */
 #include <Python.h>
+#include <pythread.h>
 #include <complex.h>
 #include <math.h>
 #include <sys/time.h>
 #include <time.h>
+#ifdef MS_WINDOWS
+#include <windows.h>
+#else
+#include <pthread.h>
+#include <sched.h>
+#endif
 #include "quisk.h"
 #include "filter.h"
 
@@ -53,6 +60,17 @@ static ty_sample_read  pt_sample_read;
 
 static complex double cSamples[SAMP_BUFFER_SIZE];			// Complex buffer for samples
 
+// The capture thread reads radio samples and writes them to the capture ring.  The sound thread
+// reads the ring in quisk_read_sound().  There is one writer and one reader, so no lock is needed.
+#define CAPTURE_RING_SIZE	(1 << 18)	// Size of the capture ring in samples; must be a power of two
+static complex double * capture_ring;
+static volatile unsigned int capture_write;		// Total samples written to the ring
+static volatile unsigned int capture_read;		// Total samples read from the ring
+static volatile int capture_running;			// Is the capture thread running?
+static volatile int capture_stopped;			// Has the capture thread exited?
+static int capture_max_fill;					// Maximum ring fill in samples
+static int capture_overruns;					// Number of sample blocks lost because the ring was full
+
 void ptimer(int counts)	// used for debugging
 {	// print the number of counts per second
 	static unsigned int calls=0, total=0;
@@ -116,158 +134,379 @@ static void correct_sample (struct sound_dev * dev, complex double * cSamples, i
 	}
 }
 
-static int record_audio(complex double * cSamples, int nSamples)
-{  // Record the speaker audio to a WAV file, PCM, 16 bits, one channel
-	static FILE * fp = NULL;	// TODO: correct for big-endian byte order
-	static unsigned int samples=0, remain=0;
-	int j;
-	short samp;			// must be 2 bytes
+// Recording files are written by the record thread.  The sound thread converts the samples to the
+// file format and adds them to a queue; the record thread writes the queue to the file, and updates
+// the header sizes every few seconds and on close.  A file larger than 4 GB is changed to RF64.
+#define RECORD_QUEUE_SIZE	(1 << 24)	// Size of the record queue in bytes; must be a power of two
+#define RECORD_PATCH_SECS	2.0			// Time between header updates
+
+// Recording files may be larger than 2 GB, so use 64-bit file positions
+#ifdef MS_WINDOWS
+#define record_seek		_fseeki64
+#define record_tell		_ftelli64
+typedef __int64 record_off_t;
+#else
+#define record_seek		fseeko
+#define record_tell		ftello
+typedef off_t record_off_t;
+#endif
+
+struct record_file {
+	FILE * fp;							// The file, or NULL if closed
+	unsigned char * queue;				// Bytes waiting to be written
+	volatile unsigned int queue_write;	// Total bytes added to the queue
+	volatile unsigned int queue_read;	// Total bytes written to the file
+	volatile int closing;				// Request to close the file
+	unsigned long long data_bytes;		// Size of the data chunk
+	int block_align;					// Bytes per sample frame
+	int fact_pos;						// Position of the fact sample count, or zero
+	int data_pos;						// Position of the data chunk
+	int overruns;						// Number of blocks lost because the queue was full
+	int write_errors;					// Number of failed writes to the file
+	double patch_time;					// Time of the last header update
+} ;
+static struct record_file RecordAudio, RecordSamples;
+static struct record_file RecordChannel[QUISK_MAX_RX_CHANNELS];	// Audio from extra receive channels
+static volatile int record_thread_running;	// Request for the record thread to run
+static volatile int record_thread_stopped;	// Has the record thread exited?
+static struct record_file * RecordFiles[QUISK_MAX_RX_CHANNELS + 3];	// All the files, ending with NULL
+
+static void record_byte_order(void * data, int count, int size)
+{  // WAV files are little-endian.  On a big-endian machine, reverse the bytes of count items of size bytes.
+	static const int one = 1;
+	unsigned char * pt, t;
+	int i, j;
+
+	if (*(const char *)&one == 1)	// little-endian
+		return;
+	for (pt = (unsigned char *)data, i = 0; i < count; i++, pt += size) {
+		for (j = 0; j < size / 2; j++) {
+			t = pt[j];
+			pt[j] = pt[size - 1 - j];
+			pt[size - 1 - j] = t;
+		}
+	}
+}
+
+static void record_put(FILE * fp, const void * data, int size, record_off_t pos)
+{  // Write data at a position in the file
+	record_seek(fp, pos, SEEK_SET);
+	fwrite(data, size, 1, fp);
+}
+
+static void record_patch(struct record_file * rec)	// Called from the record thread
+{  // Write the current sizes into the file header
+	unsigned long long riff_size, frames;
+	unsigned int u;		// must be 4 bytes
+	unsigned int ds64[7];
+
+	riff_size = rec->data_pos + rec->data_bytes;		// the file size minus 8
+	frames = rec->data_bytes / rec->block_align;
+	if (riff_size > 0xFFFFFFFFULL) {	// RF64: the sizes are in the ds64 chunk that replaced JUNK
+		record_put(rec->fp, "RF64", 4, 0);
+		u = 0xFFFFFFFF;
+		record_put(rec->fp, &u, 4, 4);
+		record_put(rec->fp, "ds64", 4, 12);
+		ds64[0] = (unsigned int)riff_size;
+		ds64[1] = (unsigned int)(riff_size >> 32);
+		ds64[2] = (unsigned int)rec->data_bytes;
+		ds64[3] = (unsigned int)(rec->data_bytes >> 32);
+		ds64[4] = (unsigned int)frames;
+		ds64[5] = (unsigned int)(frames >> 32);
+		ds64[6] = 0;		// table length
+		record_byte_order(ds64, 7, 4);
+		record_put(rec->fp, ds64, 28, 20);
+		if (rec->fact_pos)
+			record_put(rec->fp, &u, 4, rec->fact_pos);
+		record_put(rec->fp, &u, 4, rec->data_pos + 4);
+	}
+	else {
+		u = (unsigned int)riff_size;
+		record_byte_order(&u, 1, 4);
+		record_put(rec->fp, &u, 4, 4);
+		if (rec->fact_pos) {
+			u = (unsigned int)frames;
+			record_byte_order(&u, 1, 4);
+			record_put(rec->fp, &u, 4, rec->fact_pos);
+		}
+		u = (unsigned int)rec->data_bytes;
+		record_byte_order(&u, 1, 4);
+		record_put(rec->fp, &u, 4, rec->data_pos + 4);
+	}
+	record_seek(rec->fp, 0, SEEK_END);
+	fflush(rec->fp);
+	rec->patch_time = QuiskTimeSec();
+}
+
+static int record_service(struct record_file * rec)	// Called from the record thread
+{  // Write queued data to the file.  Return the number of bytes written.
+	unsigned int fill, index, n, written;
+	int closing;
+
+	if ( ! rec->fp)
+		return 0;
+	closing = rec->closing;
+	quisk_barrier();		// read closing before the queue index
+	fill = rec->queue_write - rec->queue_read;
+	if (fill) {
+		index = rec->queue_read & (RECORD_QUEUE_SIZE - 1);
+		n = RECORD_QUEUE_SIZE - index;		// bytes before the end of the queue
+		if (n > fill)
+			n = fill;
+		written = fwrite(rec->queue + index, 1, n, rec->fp);
+		rec->data_bytes += written;		// only count the bytes in the file
+		if (written < n) {		// the disk is full or the file is too large
+			rec->write_errors++;
+			clearerr(rec->fp);
+			if (closing)		// do not wait for the disk; discard the rest of the queue
+				n = fill;
+			else
+				n = written;
+		}
+		quisk_barrier();
+		rec->queue_read += n;
+		if (QuiskTimeSec() - rec->patch_time > RECORD_PATCH_SECS)
+			record_patch(rec);
+		return written;
+	}
+	if (closing) {
+		record_patch(rec);
+		fclose(rec->fp);
+		rec->closing = 0;
+		quisk_barrier();
+		rec->fp = NULL;
+	}
+	return 0;
+}
+
+static void record_thread(void * arg)
+{  // Write recording files so that the sound thread does not wait for the disk
+	int i, n;
+
+	while (record_thread_running) {
+		n = 0;
+		for (i = 0; RecordFiles[i]; i++)
+			n += record_service(RecordFiles[i]);
+		if (n == 0)
+			QuiskSleepMicrosec(20000);
+	}
+	quisk_barrier();
+	record_thread_stopped = 1;
+}
+
+static void stop_record_thread(void)
+{  // Write the queued data, close all recording files, and stop the record thread
+	int i, j, open;
+
+	if ( ! record_thread_running)
+		return;
+	for (i = 0; RecordFiles[i]; i++)
+		if (RecordFiles[i]->fp)
+			RecordFiles[i]->closing = 1;
+	for (j = 0; j < 1000; j++) {		// wait up to 20 seconds for the disk
+		open = 0;
+		for (i = 0; RecordFiles[i]; i++)
+			if (RecordFiles[i]->fp)
+				open = 1;
+		if ( ! open)
+			break;
+		QuiskSleepMicrosec(20000);
+	}
+	record_thread_running = 0;
+	for (j = 0; j < 250 && ! record_thread_stopped; j++)	// wait for a disk write to finish
+		QuiskSleepMicrosec(20000);
+}
+
+PyObject * quisk_get_record_stats(PyObject * self, PyObject * args)	// Called from GUI thread
+{  // Return the number of blocks lost because a record queue was full, and the number of failed writes
+	int i, overruns, errors;
+
+	if (!PyArg_ParseTuple (args, ""))
+		return NULL;
+	overruns = errors = 0;
+	for (i = 0; RecordFiles[i]; i++) {
+		overruns += RecordFiles[i]->overruns;
+		errors += RecordFiles[i]->write_errors;
+	}
+	return Py_BuildValue("ii", overruns, errors);
+}
+
+static int record_open(struct record_file * rec, const char * name, int rate, int channels, int is_float)
+{  // Open the file and write the header.  Return 1 for success or 0 for failure.
+	FILE * fp;
+	int i;
 	unsigned int u;		// must be 4 bytes
 	unsigned short s;	// must be 2 bytes
+	unsigned char junk[28];
 
-	switch (nSamples) {
-	case -1:			// Open the file
-		fp = fopen(file_name_audio, "wb");
-		if ( ! fp)
-			return 0;
-		if (fwrite("RIFF", 1, 4, fp) != 4) {
-			fclose(fp);
-			fp = NULL;
+	if (rec->fp)		// the previous file is still being written
+		return 0;
+	if ( ! RecordFiles[0]) {
+		RecordFiles[0] = &RecordAudio;
+		RecordFiles[1] = &RecordSamples;
+		for (i = 0; i < QUISK_MAX_RX_CHANNELS; i++)
+			RecordFiles[i + 2] = RecordChannel + i;
+	}
+	if ( ! record_thread_running) {
+		record_thread_stopped = 0;
+		record_thread_running = 1;
+		if (PyThread_start_new_thread(record_thread, NULL) == -1) {
+			record_thread_running = 0;
 			return 0;
 		}
-		// pcm data, 16-bit samples, one channel
-		u = 36;
-		fwrite(&u, 4, 1, fp);
-		fwrite("WAVE", 1, 4, fp);
-		fwrite("fmt ", 1, 4, fp);
-		u = 16;
-		fwrite(&u, 4, 1, fp);
-		s = 1;		// wave_format_pcm
-		fwrite(&s, 2, 1, fp);
-		s = 1;		// number of channels
+	}
+	if ( ! rec->queue)
+		rec->queue = (unsigned char *)malloc(RECORD_QUEUE_SIZE);
+	fp = fopen(name, "wb");
+	if ( ! fp)
+		return 0;
+	if (fwrite("RIFF", 1, 4, fp) != 4) {
+		fclose(fp);
+		return 0;
+	}
+	u = 0;
+	fwrite(&u, 4, 1, fp);
+	fwrite("WAVE", 1, 4, fp);
+	fwrite("JUNK", 1, 4, fp);	// space for a ds64 chunk if the file becomes RF64
+	u = 28;
+	record_byte_order(&u, 1, 4);
+	fwrite(&u, 4, 1, fp);
+	memset(junk, 0, 28);
+	fwrite(junk, 1, 28, fp);
+	fwrite("fmt ", 1, 4, fp);
+	u = is_float ? 18 : 16;
+	record_byte_order(&u, 1, 4);
+	fwrite(&u, 4, 1, fp);
+	s = is_float ? 3 : 1;		// wave_format_ieee_float or wave_format_pcm
+	record_byte_order(&s, 1, 2);
+	fwrite(&s, 2, 1, fp);
+	s = channels;		// number of channels
+	record_byte_order(&s, 1, 2);
+	fwrite(&s, 2, 1, fp);
+	u = rate;	// sample rate
+	record_byte_order(&u, 1, 4);
+	fwrite(&u, 4, 1, fp);
+	rec->block_align = channels * (is_float ? 4 : 2);
+	u = rate * rec->block_align;
+	record_byte_order(&u, 1, 4);
+	fwrite(&u, 4, 1, fp);
+	s = rec->block_align;
+	record_byte_order(&s, 1, 2);
+	fwrite(&s, 2, 1, fp);
+	s = is_float ? 32 : 16;
+	record_byte_order(&s, 1, 2);
+	fwrite(&s, 2, 1, fp);
+	if (is_float) {
+		s = 0;
 		fwrite(&s, 2, 1, fp);
-		u = Playback.sample_rate;	// sample rate
-		fwrite(&u, 4, 1, fp);
-		u *= 2;
+		fwrite("fact", 1, 4, fp);
+		u = 4;
+		record_byte_order(&u, 1, 4);
 		fwrite(&u, 4, 1, fp);
-		s = 2; 
-		fwrite(&s, 2, 1, fp);
-		s = 16; 
-		fwrite(&s, 2, 1, fp);
-		fwrite("data", 1, 4, fp);
+		rec->fact_pos = (int)record_tell(fp);
 		u = 0;
 		fwrite(&u, 4, 1, fp);
-		samples = 0;
-		remain = 2147483000;
-		break;
+	}
+	else {
+		rec->fact_pos = 0;
+	}
+	rec->data_pos = (int)record_tell(fp);
+	fwrite("data", 1, 4, fp);
+	u = 0;
+	fwrite(&u, 4, 1, fp);
+	rec->data_bytes = 0;
+	rec->queue_write = rec->queue_read = 0;
+	rec->closing = 0;
+	rec->patch_time = QuiskTimeSec();
+	quisk_barrier();		// finish the header before the record thread sees the file
+	rec->fp = fp;
+	return 1;
+}
+
+static int record_write(struct record_file * rec, void * data, int nbytes)	// Called from the sound thread
+{  // Add bytes to the queue.  Return 1 for success or 0 if the queue is full.
+	unsigned int fill, index, n;
+
+	fill = rec->queue_write - rec->queue_read;
+	if (fill + nbytes > RECORD_QUEUE_SIZE) {	// the disk is too slow; discard the samples
+		rec->overruns++;
+		return 0;
+	}
+	index = rec->queue_write & (RECORD_QUEUE_SIZE - 1);
+	n = RECORD_QUEUE_SIZE - index;
+	if (n > (unsigned int)nbytes)
+		n = nbytes;
+	memcpy(rec->queue + index, data, n);
+	memcpy(rec->queue, (unsigned char *)data + n, nbytes - n);
+	quisk_barrier();		// write the data before the index
+	rec->queue_write += nbytes;
+	return 1;
+}
+
+static int record_audio(complex double * cSamples, int nSamples)
+{  // Record the speaker audio to a WAV file, PCM, 16 bits, one channel
+	int j;
+	static short samp[SAMP_BUFFER_SIZE];	// must be 2 bytes
+
+	switch (nSamples) {
+	case -1:			// Open the file
+		return record_open(&RecordAudio, file_name_audio, Playback.sample_rate, 1, 0);
 	case -2:		// close the file
-		if (fp)
-			fclose(fp);
-		fp = NULL;
-		remain = 0;
+		if (RecordAudio.fp)
+			RecordAudio.closing = 1;
 		break;
 	default:		// write the sound data to the file
-		u = (unsigned int)nSamples;
-		if (u >= remain)
-			return 0;
-		samples += u;
-		remain -= u;
-		fseek(fp, 40, SEEK_SET);	// seek from the beginning
-		u = 2 * samples;
-		fwrite(&u, 4, 1, fp);
-		fseek(fp, 4, SEEK_SET);		// seek from the beginning
-		u += 36;
-		fwrite(&u, 4, 1, fp);
-		fseek(fp, 0, SEEK_END);		// seek to the end
-		for (j = 0; j < nSamples; j++) {
-			samp = (short)(creal(cSamples[j]) / 65536.0);
-			fwrite(&samp, 2, 1, fp);
-		}
-		break;
+		for (j = 0; j < nSamples; j++)
+			samp[j] = (short)(creal(cSamples[j]) / 65536.0);
+		record_byte_order(samp, nSamples, 2);
+		return record_write(&RecordAudio, samp, nSamples * 2);
 	}
 	return 1;
 }
 
 static int record_samples(complex double * cSamples, int nSamples)
 {  // Record the samples to a WAV file, two float samples I/Q
-	static FILE * fp = NULL;	// TODO: correct for big-endian byte order
-	static unsigned int samples=0, remain=0;
 	int j;
-	float samp;			// must be 4 bytes
-	unsigned int u;		// must be 4 bytes
-	unsigned short s;	// must be 2 bytes
+	static float samp[SAMP_BUFFER_SIZE * 2];	// must be 4 bytes
 
 	switch (nSamples) {
 	case -1:			// Open the file
-		fp = fopen(file_name_samples, "wb");
-		if ( ! fp)
-			return 0;
-		if (fwrite("RIFF", 1, 4, fp) != 4) {
-			fclose(fp);
-			fp = NULL;
-			return 0;
-		}
-		// IEEE float data, two channels
-		u = 50;
-		fwrite(&u, 4, 1, fp);
-		fwrite("WAVE", 1, 4, fp);
-		fwrite("fmt ", 1, 4, fp);
-		u = 18;
-		fwrite(&u, 4, 1, fp);
-		s = 3;		// wave_format_ieee_float
-		fwrite(&s, 2, 1, fp);
-		s = 2;		// number of channels
-		fwrite(&s, 2, 1, fp);
-		u = quisk_sound_state.sample_rate;	// sample rate
-		fwrite(&u, 4, 1, fp);
-		u *= 8;
-		fwrite(&u, 4, 1, fp);
-		s = 8; 
-		fwrite(&s, 2, 1, fp);
-		s = 32; 
-		fwrite(&s, 2, 1, fp);
-		s = 0; 
-		fwrite(&s, 2, 1, fp);
-		fwrite("fact", 1, 4, fp);
-		u = 4;
-		fwrite(&u, 4, 1, fp);
-		u = 0;
-		fwrite(&u, 4, 1, fp);
-		fwrite("data", 1, 4, fp);
-		u = 0;
-		fwrite(&u, 4, 1, fp);
-		samples = 0;
-		remain = 536870000;
-		break;
+		return record_open(&RecordSamples, file_name_samples, quisk_sound_state.sample_rate, 2, 1);
 	case -2:	// close the file
-		if (fp)
-			fclose(fp);
-		fp = NULL;
-		remain = 0;
+		if (RecordSamples.fp)
+			RecordSamples.closing = 1;
 		break;
 	default:	// write the sound data to the file
-		u = (unsigned int)nSamples;
-		if (u >= remain)
-			return 0;
-		samples += u;
-		remain -= u;
-		fseek(fp, 54, SEEK_SET);	// seek from the beginning
-		u = 8 * samples;
-		fwrite(&u, 4, 1, fp);
-		fseek(fp, 4, SEEK_SET);		// seek from the beginning
-		u += 50 ;
-		fwrite(&u, 4, 1, fp);
-		fseek(fp, 46, SEEK_SET);	// seek from the beginning
-		u = samples * 2;
-		fwrite(&u, 4, 1, fp);
-		fseek(fp, 0, SEEK_END);		// seek to the end
 		for (j = 0; j < nSamples; j++) {
-			samp = creal(cSamples[j]) / CLIP32;
-			fwrite(&samp, 4, 1, fp);
-			samp = cimag(cSamples[j]) / CLIP32;
-			fwrite(&samp, 4, 1, fp);
+			samp[2 * j] = creal(cSamples[j]) / CLIP32;
+			samp[2 * j + 1] = cimag(cSamples[j]) / CLIP32;
 		}
+		record_byte_order(samp, nSamples * 2, 4);
+		return record_write(&RecordSamples, samp, nSamples * 8);
+	}
+	return 1;
+}
+
+int quisk_record_channel(int channel, complex double * cSamples, int nSamples, const char * name)
+{  // Record the audio of a receive channel to a WAV file, PCM, 16 bits, one channel
+	int j;
+	static short samp[SAMP_BUFFER_SIZE];	// must be 2 bytes
+	struct record_file * rec = RecordChannel + channel;
+
+	switch (nSamples) {
+	case -1:			// Open the file
+		return record_open(rec, name, quisk_sound_state.playback_rate, 1, 0);
+	case -2:		// close the file
+		if (rec->fp)
+			rec->closing = 1;
 		break;
+	default:		// write the sound data to the file
+		if (nSamples > SAMP_BUFFER_SIZE)
+			nSamples = SAMP_BUFFER_SIZE;
+		for (j = 0; j < nSamples; j++)
+			samp[j] = (short)(creal(cSamples[j]) / 65536.0);
+		record_byte_order(samp, nSamples, 2);
+		return record_write(rec, samp, nSamples * 2);
 	}
 	return 1;
 }
@@ -349,13 +588,209 @@ void play_sound_interface(
    }
 }
 
+static int read_capture(complex double * samp)	// Called from the sound thread or the capture thread
+{  // Read radio samples from the SDR-IQ, UDP or the sound card.  Return the number of samples.
+	int nSamples;
+
+	if (pt_sample_read) {			// read samples from SDR-IQ or UDP
+		nSamples = (*pt_sample_read)(samp);
+	}
+	else if (Capture.handle) {							// blocking read from soundcard
+		nSamples = read_sound_interface(&Capture, samp);
+		if (Capture.channel_Delay >= 0)	// delay the I or Q channel by one sample
+			delay_sample(&Capture, (double *)samp, nSamples);
+		if (Capture.doAmplPhase)		// amplitude and phase corrections
+			correct_sample(&Capture, samp, nSamples);
+	}
+	else {
+		nSamples = 0;
+	}
+	return nSamples;
+}
+
+static void capture_ring_write(complex double * samp, int nSamples)	// Called from the capture thread
+{
+	unsigned int fill, index, n;
+
+	fill = capture_write - capture_read;
+	if (fill + nSamples > CAPTURE_RING_SIZE) {		// no room; discard the samples
+		capture_overruns++;
+		return;
+	}
+	index = capture_write & (CAPTURE_RING_SIZE - 1);
+	n = CAPTURE_RING_SIZE - index;		// samples before the end of the ring
+	if (n > (unsigned int)nSamples)
+		n = nSamples;
+	memcpy(capture_ring + index, samp, n * sizeof(complex double));
+	memcpy(capture_ring, samp + n, (nSamples - n) * sizeof(complex double));
+	quisk_barrier();		// write the samples before the index
+	capture_write += nSamples;
+	fill += nSamples;
+	if ((int)fill > capture_max_fill)
+		capture_max_fill = fill;
+}
+
+static int capture_ring_read(complex double * samp, int max_samples)	// Called from the sound thread
+{  // Read up to max_samples from the capture ring.  Wait a short time for samples if the ring is empty.
+	unsigned int fill, index, n;
+	int usec, wait;
+
+	wait = quisk_sound_state.data_poll_usec / 4;
+	if (wait < 1000)
+		wait = 1000;
+	for (usec = 0; (fill = capture_write - capture_read) == 0; usec += wait) {
+		if (usec >= 100000 || ! capture_running)
+			return 0;
+		QuiskSleepMicrosec(wait);
+	}
+	quisk_barrier();		// read the index before the samples
+	if (fill > (unsigned int)max_samples)
+		fill = max_samples;
+	index = capture_read & (CAPTURE_RING_SIZE - 1);
+	n = CAPTURE_RING_SIZE - index;
+	if (n > fill)
+		n = fill;
+	memcpy(samp, capture_ring + index, n * sizeof(complex double));
+	memcpy(samp + n, capture_ring, (fill - n) * sizeof(complex double));
+	quisk_barrier();		// read the samples before releasing the space
+	capture_read += fill;
+	return fill;
+}
+
+static void capture_thread(void * arg)
+{  // Read radio samples and write them to the capture ring until capture_running is zero.
+	int nSamples;
+	static complex double samples[SAMP_BUFFER_SIZE];
+#ifdef MS_WINDOWS
+	SetThreadPriority(GetCurrentThread(), THREAD_PRIORITY_TIME_CRITICAL);
+#else
+	struct sched_param param;
+
+	param.sched_priority = sched_get_priority_min(SCHED_FIFO);
+	pthread_setschedparam(pthread_self(), SCHED_FIFO, &param);	// fails without permission; that is OK
+#endif
+	while (capture_running) {
+		nSamples = read_capture(samples);
+		if (nSamples > 0)
+			capture_ring_write(samples, nSamples);
+		else
+			QuiskSleepMicrosec(1000);
+	}
+	quisk_barrier();
+	capture_stopped = 1;
+}
+
+static void start_capture_thread(void)	// Called from the sound thread
+{
+	if ( ! pt_sample_read && ! Capture.handle)		// nothing to capture
+		return;
+	if ( ! QuiskGetConfigInt("capture_thread", 1))
+		return;
+	if ( ! capture_ring)
+		capture_ring = (complex double *)malloc(CAPTURE_RING_SIZE * sizeof(complex double));
+	capture_write = capture_read = 0;
+	capture_max_fill = 0;
+	capture_overruns = 0;
+	capture_stopped = 0;
+	capture_running = 1;
+	if (PyThread_start_new_thread(capture_thread, NULL) == -1)
+		capture_running = 0;		// read samples in the sound thread instead
+}
+
+static void stop_capture_thread(void)	// Called from the sound thread
+{  // Stop the capture thread and wait for it to exit.  The sound devices must not be closed
+   // while the capture thread may still be reading them.
+	int i;
+
+	if ( ! capture_running)
+		return;
+	capture_running = 0;
+	for (i = 0; ! capture_stopped; i++) {	// wait for a blocking read to finish
+		if (i == 100) {		// after two seconds, make a stuck read return
+			quisk_drop_capture_alsa(CaptureDevices);
+			quisk_drop_capture_portaudio(CaptureDevices);
+		}
+		QuiskSleepMicrosec(20000);
+	}
+}
+
+PyObject * quisk_get_capture_stats(PyObject * self, PyObject * args)	// Called from GUI thread
+{  // Return the capture thread state, the ring fill and size in samples, the maximum fill, and the overrun count
+	if (!PyArg_ParseTuple (args, ""))
+		return NULL;
+	return Py_BuildValue("iiiii", capture_running, (int)(capture_write - capture_read),
+		CAPTURE_RING_SIZE, capture_max_fill, capture_overruns);
+}
+
+// Cumulative timers and histograms for each stage of quisk_read_sound().  These are written by the
+// sound thread and read by the GUI thread.  A reset is requested by the GUI and done by the sound thread.
+enum {TIMING_READ, TIMING_RECORD, TIMING_PROCESS, TIMING_PLAY, TIMING_MIC_READ, TIMING_MIC_PROCESS,
+	TIMING_MIC_PLAY, TIMING_COUNT};
+#define TIMING_BINS		16		// Histogram bin i counts times from 2**i to 2**(i+1) microseconds
+static const char * timing_names[TIMING_COUNT] = {"Read", "Record", "Process samples", "Play",
+	"Mic read", "Mic process", "Mic playback"};
+static struct {
+	int count;
+	double total;		// total seconds
+	double max;		// maximum seconds
+	int hist[TIMING_BINS];
+} timing_stats[TIMING_COUNT];
+static double timing_mark;		// Time at the end of the previous stage
+static double timing_start;		// Time of the last reset
+static volatile int timing_reset = 1;	// Request to reset the statistics
+
+static void timing_stage(int stage)
+{  // Add the time since the last mark to the stage statistics; a stage < 0 just sets the mark
+	int bin;
+	double tm, delta;
+
+	tm = QuiskTimeHiRes();
+	if (stage >= 0) {
+		delta = tm - timing_mark;
+		timing_stats[stage].count++;
+		timing_stats[stage].total += delta;
+		if (delta > timing_stats[stage].max)
+			timing_stats[stage].max = delta;
+		if (delta < 2e-6)
+			bin = 0;
+		else
+			bin = (int)(log(delta * 1e6) / M_LN2);
+		if (bin >= TIMING_BINS)
+			bin = TIMING_BINS - 1;
+		timing_stats[stage].hist[bin]++;
+	}
+	timing_mark = tm;
+}
+
+PyObject * quisk_get_timing_stats(PyObject * self, PyObject * args)	// Called from GUI thread
+{  // Return the seconds since the last reset, and a tuple of stage statistics.  Each stage is
+   // (name, count, total seconds, maximum seconds, histogram).  Histogram bin i counts times
+   // from 2**i to 2**(i+1) microseconds; bin 0 includes shorter times.
+	int i, j, reset = 0;
+	PyObject * stages, * hist;
+
+	if (!PyArg_ParseTuple (args, "|i", &reset))
+		return NULL;
+	stages = PyTuple_New(TIMING_COUNT);
+	for (i = 0; i < TIMING_COUNT; i++) {
+		hist = PyTuple_New(TIMING_BINS);
+		for (j = 0; j < TIMING_BINS; j++)
+			PyTuple_SetItem(hist, j, PyInt_FromLong(timing_stats[i].hist[j]));
+		PyTuple_SetItem(stages, i, Py_BuildValue("siddN", timing_names[i], timing_stats[i].count,
+			timing_stats[i].total, timing_stats[i].max, hist));
+	}
+	if (reset)
+		timing_reset = 1;
+	return Py_BuildValue("dN", timing_start ? QuiskTimeHiRes() - timing_start : 0.0, stages);
+}
+
 int quisk_read_sound(void)	// Called from sound thread
 {  // called in an infinite loop by the main program
 	int i, nSamples, mic_count, mic_interp, retval, is_cw, mic_sample_rate;
-	complex double tx_mic_phase;
 	static double cwEnvelope=0;
 	static double cwCount=0;
-	static complex double tuneVector = (double)CLIP32 / CLIP16;	// Convert 16-bit to 32-bit samples
+	static struct quisk_nco txOsc;		// Oscillator to tune the transmit samples
+	double scale = (double)CLIP32 / CLIP16;	// Convert 16-bit to 32-bit samples
 	static struct quisk_cFilter filtInterp={NULL};
 #if DEBUG_MIC == 1
 	complex double tmpSamples[SAMP_BUFFER_SIZE];
@@ -365,19 +800,16 @@ int quisk_read_sound(void)	// Called from sound thread
 #if DEBUG_IO > 1
 	QuiskPrintTime("Start read_sound", 0);
 #endif
-	if (pt_sample_read) {			// read samples from SDR-IQ or UDP
-		nSamples = (*pt_sample_read)(cSamples);
-	}
-	else if (Capture.handle) {							// blocking read from soundcard
-		nSamples = read_sound_interface(&Capture, cSamples);
-		if (Capture.channel_Delay >= 0)	// delay the I or Q channel by one sample
-			delay_sample(&Capture, (double *)cSamples, nSamples);
-		if (Capture.doAmplPhase)		// amplitude and phase corrections
-			correct_sample(&Capture, cSamples, nSamples);
-	}
-	else {
-		nSamples = 0;
+	if (timing_reset) {
+		memset(timing_stats, 0, sizeof(timing_stats));
+		timing_start = QuiskTimeHiRes();
+		timing_reset = 0;
 	}
+	timing_stage(-1);
+	if (capture_running)	// samples are read by the capture thread
+		nSamples = capture_ring_read(cSamples, SAMP_BUFFER_SIZE / 2);
+	else
+		nSamples = read_capture(cSamples);
 	retval = nSamples;		// retval remains the number of samples read
 #if DEBUG_IO
 	debug_timer += nSamples;
@@ -388,6 +820,7 @@ int quisk_read_sound(void)	// Called from sound thread
 	ptimer (nSamples);
 #endif
 	quisk_sound_state.latencyCapt = nSamples;	// samples available
+	timing_stage(TIMING_READ);
 #if DEBUG_IO > 1
 	QuiskPrintTime("  read samples", 0);
 #endif
@@ -408,9 +841,11 @@ int quisk_read_sound(void)	// Called from sound thread
 	// Perhaps write samples to a loopback device for use by another program
 	if (RawSamplePlayback.handle)
 		play_sound_interface(&RawSamplePlayback, nSamples, cSamples, 0, 1.0);
+	timing_stage(TIMING_RECORD);
 #if ! DEBUG_MIC
 	nSamples = quisk_process_samples(cSamples, nSamples);
 #endif
+	timing_stage(TIMING_PROCESS);
 #if DEBUG_IO > 1
 	QuiskPrintTime("  process samples", 0);
 #endif
@@ -436,6 +871,7 @@ int quisk_read_sound(void)	// Called from sound thread
 		record_audio(NULL, -2);		 // Close file
 		is_recording_audio = 0;
 	}
+	timing_stage(TIMING_PLAY);
 
 #if DEBUG_IO > 1
 	QuiskPrintTime("  play samples", 0);
@@ -458,6 +894,7 @@ int quisk_read_sound(void)	// Called from sound thread
 		}
 	}
 	if (mic_count > 0) {
+		timing_stage(TIMING_MIC_READ);
 #if DEBUG_IO > 1
 		QuiskPrintTime("  mic-read", 0);
 #endif
@@ -471,10 +908,14 @@ int quisk_read_sound(void)	// Called from sound thread
 			tmpSamples[i] = cSamples[i] * (double)CLIP32 / CLIP16;	// convert 16-bit samples to 32 bits
 		quisk_process_samples(tmpSamples, mic_count);
 #endif
+		timing_stage(TIMING_MIC_PROCESS);
 #if DEBUG_IO > 1
 		QuiskPrintTime("  mic-proc", 0);
 #endif
 	}
+	else {
+		timing_stage(-1);
+	}
 	// Mic playback without a mic is needed for CW
 	if (MicPlayback.handle) {		// Mic playback: send mic I/Q samples to a sound card
 		if (rxMode == 0 || rxMode == 1) {	// Transmit CW
@@ -485,7 +926,7 @@ int quisk_read_sound(void)	// Called from sound thread
 			cwCount = 0;
 			cwEnvelope = 0.0;
 		}
-		tx_mic_phase = cexp(( -I * 2.0 * M_PI * quisk_tx_tune_freq) / MicPlayback.sample_rate);
+		quisk_nco_set(&txOsc, -quisk_tx_tune_freq, MicPlayback.sample_rate);
 		if (is_cw) {	// Transmit CW; use capture device for timing, not microphone
 			cwCount += (double)retval * MicPlayback.sample_rate / quisk_sound_state.sample_rate;
 			mic_count = 0;
@@ -497,10 +938,9 @@ int quisk_read_sound(void)	// Called from sound thread
 							cwEnvelope = 1.0;
 					}
 					if (quiskSpotLevel)
-						cSamples[mic_count++] = (CLIP16 - 1) * cwEnvelope * quiskSpotLevel / 1000.0 * tuneVector * quisk_sound_state.mic_out_volume;
+						cSamples[mic_count++] = (CLIP16 - 1) * cwEnvelope * quiskSpotLevel / 1000.0 * scale * quisk_nco_next(&txOsc) * quisk_sound_state.mic_out_volume;
 					else
-						cSamples[mic_count++] = (CLIP16 - 1) * cwEnvelope * tuneVector * quisk_sound_state.mic_out_volume;
-					tuneVector *= tx_mic_phase;
+						cSamples[mic_count++] = (CLIP16 - 1) * cwEnvelope * scale * quisk_nco_next(&txOsc) * quisk_sound_state.mic_out_volume;
 					cwCount -= 1;
 				}
 			}
@@ -511,8 +951,7 @@ int quisk_read_sound(void)	// Called from sound thread
 						if (cwEnvelope < 0.0)
 							cwEnvelope = 0.0;
 					}
-					cSamples[mic_count++] = (CLIP16 - 1) * cwEnvelope * tuneVector * quisk_sound_state.mic_out_volume;
-					tuneVector *= tx_mic_phase;
+					cSamples[mic_count++] = (CLIP16 - 1) * cwEnvelope * scale * quisk_nco_next(&txOsc) * quisk_sound_state.mic_out_volume;
 					cwCount -= 1;
 				}
 			}
@@ -530,10 +969,9 @@ int quisk_read_sound(void)	// Called from sound thread
 		}
 		// Tune the samples to frequency
 		if ( ! is_cw) {
-			for (i = 0; i < mic_count; i++) {
-				cSamples[i] = conj(cSamples[i]) * tuneVector * quisk_sound_state.mic_out_volume;
-				tuneVector *= tx_mic_phase;
-			}
+			for (i = 0; i < mic_count; i++)
+				cSamples[i] = conj(cSamples[i]);
+			quisk_nco_mix(&txOsc, cSamples, mic_count, scale * quisk_sound_state.mic_out_volume);
 		}
 		// delay the I or Q channel by one sample
 		if (MicPlayback.channel_Delay >= 0)
@@ -543,6 +981,7 @@ int quisk_read_sound(void)	// Called from sound thread
 			correct_sample (&MicPlayback, cSamples, mic_count);
 		// play mic samples
 		play_sound_interface(&MicPlayback, mic_count, cSamples, 0, 1.0);
+		timing_stage(TIMING_MIC_PLAY);
 #if DEBUG_MIC == 2
 		quisk_process_samples(cSamples, mic_count);
 #endif
@@ -566,6 +1005,8 @@ int quisk_get_overrange(void)	// Called from GUI thread
 
 void quisk_close_sound(void)	// Called from sound thread
 {
+	stop_capture_thread();
+	stop_record_thread();
 	quisk_close_sound_portaudio();
 	quisk_close_sound_alsa(CaptureDevices, PlaybackDevices);
 	quisk_close_sound_pulseaudio(CaptureDevices, PlaybackDevices);
@@ -753,6 +1194,7 @@ void quisk_start_sound(void)	// Called from sound thread
 		quisk_sound_state.chan_min = Capture.chan_min;
 		quisk_sound_state.chan_max = Capture.chan_max;
 	}
+	start_capture_thread();
 }
 
 PyObject * quisk_set_ampl_phase(PyObject * self, PyObject * args)	// Called from GUI thread
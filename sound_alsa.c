@@ -24,15 +24,179 @@ static unsigned char buffer3[3 * SAMP_BUFFER_SIZE];	// Buffer for 3-byte samples
 static int buffer4[SAMP_BUFFER_SIZE];				// Buffer for 4-byte samples from sound
 static int bufferz[SAMP_BUFFER_SIZE];				// Buffer for zero samples
 
+/*
+ The capture kernels convert frames of I/Q samples to cSamples and remove DC (R.G. Lyons page 553).
+ The I and Q samples of frame k are at pI[k * stride] and pQ[k * stride].  Samples are converted
+ to 32 bits with a range of +/- CLIP32.  The kernels are called with a constant stride for the
+ usual two channel layout so the compiler can specialize them.
+*/
+static inline void capture_s16(struct sound_dev * dev, const short * pI, const short * pQ,
+		int stride, int frames, complex double * cSamples)
+{
+	int k, overrange;
+	int ii, qq;
+	complex double c, dc;
+
+	dc = dev->dc_remove;
+	overrange = 0;
+	for (k = 0; k < frames; k++, pI += stride, pQ += stride) {
+		ii = *pI;
+		qq = *pQ;
+		if (ii >=  CLIP16 || ii <= -CLIP16)
+			overrange++;	// assume overrange returns max int
+		if (qq >=  CLIP16 || qq <= -CLIP16)
+			overrange++;
+		ii <<= 16;
+		qq <<= 16;
+		c = ii + I * qq + dc * 0.95;
+		cSamples[k] = c - dc;
+		dc = c;
+	}
+	dev->dc_remove = dc;
+	dev->overrange += overrange;
+}
+
+static inline void capture_s24_3le(struct sound_dev * dev, const unsigned char * pI, const unsigned char * pQ,
+		int stride, int frames, complex double * cSamples)
+{	// Here the stride is in bytes
+	int k, overrange;
+	int ii, qq;
+	complex double c, dc;
+
+	dc = dev->dc_remove;
+	overrange = 0;
+	for (k = 0; k < frames; k++, pI += stride, pQ += stride) {
+		// Place the little-endian 24-bit sample in the upper three bytes of an int
+		ii = (int)((unsigned int)pI[0] << 8 | (unsigned int)pI[1] << 16 | (unsigned int)pI[2] << 24);
+		qq = (int)((unsigned int)pQ[0] << 8 | (unsigned int)pQ[1] << 16 | (unsigned int)pQ[2] << 24);
+		if (ii >=  CLIP32 || ii <= -CLIP32)
+			overrange++;	// assume overrange returns max int
+		if (qq >=  CLIP32 || qq <= -CLIP32)
+			overrange++;
+		c = ii + I * qq + dc * 0.95;
+		cSamples[k] = c - dc;
+		dc = c;
+	}
+	dev->dc_remove = dc;
+	dev->overrange += overrange;
+}
+
+static inline void capture_s32(struct sound_dev * dev, const int * pI, const int * pQ,
+		int stride, int frames, complex double * cSamples)
+{
+	int k, overrange;
+	int ii, qq;
+	complex double c, dc;
+
+	dc = dev->dc_remove;
+	overrange = 0;
+	for (k = 0; k < frames; k++, pI += stride, pQ += stride) {
+		ii = *pI;
+		qq = *pQ;
+		if (ii >=  CLIP32 || ii <= -CLIP32)
+			overrange++;	// assume overrange returns max int
+		if (qq >=  CLIP32 || qq <= -CLIP32)
+			overrange++;
+		c = ii + I * qq + dc * 0.95;
+		cSamples[k] = c - dc;
+		dc = c;
+	}
+	dev->dc_remove = dc;
+	dev->overrange += overrange;
+}
+
+static void capture_convert(struct sound_dev * dev, const void * pI, const void * pQ,
+		int stride, int frames, complex double * cSamples)
+{	// Convert frames to cSamples.  The stride is the number of samples from one frame to the next.
+	switch (dev->sample_bytes) {
+	case 2:
+		if (stride == 2)
+			capture_s16(dev, pI, pQ, 2, frames, cSamples);
+		else
+			capture_s16(dev, pI, pQ, stride, frames, cSamples);
+		break;
+	case 3:
+		if (stride == 2)
+			capture_s24_3le(dev, pI, pQ, 2 * 3, frames, cSamples);
+		else
+			capture_s24_3le(dev, pI, pQ, stride * 3, frames, cSamples);
+		break;
+	case 4:
+		if (stride == 2)
+			capture_s32(dev, pI, pQ, 2, frames, cSamples);
+		else
+			capture_s32(dev, pI, pQ, stride, frames, cSamples);
+		break;
+	}
+}
+
+static void capture_restart(struct sound_dev * dev)
+{	// Restart capture after a read error
+	dev->dev_error++;
+#if DEBUG_IO
+	QuiskPrintTime("read_alsa: frames < 0", 0);
+#endif
+	snd_pcm_prepare (dev->handle);
+	snd_pcm_start (dev->handle);
+}
+
+static int read_alsa_mmap(struct sound_dev * dev, complex double * cSamples, snd_pcm_sframes_t avail)
+{	// Read up to avail frames directly from the mmap buffer.  Return the number of samples.
+	const snd_pcm_channel_area_t * areas, * aI, * aQ;
+	snd_pcm_uframes_t offset, frames;
+	snd_pcm_sframes_t ready, committed;
+	int nSamples;
+
+	ready = snd_pcm_avail_update (dev->handle);
+	if (ready < 0) {
+		capture_restart(dev);
+		return 0;
+	}
+	if (dev->read_frames) {		// blocking: wait for avail frames
+		while (ready < avail) {
+			if (snd_pcm_wait (dev->handle, 1000) <= 0) {
+				capture_restart(dev);
+				return 0;
+			}
+			ready = snd_pcm_avail_update (dev->handle);
+			if (ready < 0) {
+				capture_restart(dev);
+				return 0;
+			}
+		}
+	}
+	else if (avail > ready) {	// non-blocking: read available frames
+		avail = ready;
+	}
+	nSamples = 0;
+	while (avail > 0) {		// the area may wrap around, so there may be two blocks
+		frames = avail;
+		if (snd_pcm_mmap_begin (dev->handle, &areas, &offset, &frames) < 0) {
+			capture_restart(dev);
+			break;
+		}
+		aI = areas + dev->channel_I;
+		aQ = areas + dev->channel_Q;
+		capture_convert(dev,
+			(const char *)aI->addr + (aI->first + offset * aI->step) / 8,
+			(const char *)aQ->addr + (aQ->first + offset * aQ->step) / 8,
+			aI->step / (8 * dev->sample_bytes), frames, cSamples + nSamples);
+		committed = snd_pcm_mmap_commit (dev->handle, offset, frames);
+		if (committed < 0 || (snd_pcm_uframes_t)committed != frames) {
+			capture_restart(dev);
+			break;
+		}
+		nSamples += frames;
+		avail -= frames;
+	}
+	return nSamples;
+}
+
 int quisk_read_alsa(struct sound_dev * dev, complex double * cSamples)
 {	// Read sound samples from the ALSA soundcard.
 	// Samples are converted to 32 bits with a range of +/- CLIP32 and placed into cSamples.
-	int i;
 	snd_pcm_sframes_t frames, avail;
-	short si, sq;
-	int ii, qq;
-	int nSamples;
-	complex double c;
+	void * buffer;
 
 	if (!dev->handle)
 		return -1;
@@ -41,12 +205,16 @@ int quisk_read_alsa(struct sound_dev * dev, complex double * cSamples)
 	case SND_PCM_STATE_RUNNING:
 		break;
 	case SND_PCM_STATE_PREPARED:
+		if (dev->use_mmap)		// mmap capture does not start itself
+			snd_pcm_start(dev->handle);
 		break;
 	case SND_PCM_STATE_XRUN:
 #if DEBUG_IO
 		QuiskPrintTime("read_alsa: Capture overrun", 0);
 #endif
 		snd_pcm_prepare(dev->handle);
+		if (dev->use_mmap)
+			snd_pcm_start(dev->handle);
 		break;
 	default:
 #if DEBUG_IO
@@ -66,100 +234,33 @@ int quisk_read_alsa(struct sound_dev * dev, complex double * cSamples)
 	else {
 		avail = dev->read_frames;	// size of read request
 	}
-	nSamples = 0;
+	if (dev->use_mmap)
+		return read_alsa_mmap(dev, cSamples, avail);
 	switch (dev->sample_bytes) {
 	case 2:
-		frames = snd_pcm_readi (dev->handle, buffer2, avail);	// read samples
-		if (frames == -EAGAIN) {	// no samples available
-			break;
-		}
-		else if (frames <= 0) {		// error
-			dev->dev_error++;
-#if DEBUG_IO
-			QuiskPrintTime("read_alsa: frames < 0", 0);
-#endif
-			snd_pcm_prepare (dev->handle);
-			snd_pcm_start (dev->handle);
-			break;
-		}
-		for (i = 0; frames; i += dev->num_channels, nSamples++, frames--) {
-			si = buffer2[i + dev->channel_I];
-			sq = buffer2[i + dev->channel_Q];
-			if (si >=  CLIP16 || si <= -CLIP16)
-				dev->overrange++;	// assume overrange returns max int
-			if (sq >=  CLIP16 || sq <= -CLIP16)
-				dev->overrange++;
-			ii = si << 16;
-			qq = sq << 16;
-			cSamples[nSamples] = ii + I * qq;
-		}
+		buffer = buffer2;
 		break;
 	case 3:
-		frames = snd_pcm_readi (dev->handle, buffer3, avail);	// read samples
-		if (frames == -EAGAIN) {	// no samples available
-			break;
-		}
-		else if (frames <= 0) {		// error
-			dev->dev_error++;
-#if DEBUG_IO
-			QuiskPrintTime("read_alsa: frames < 0", 0);
-#endif
-			snd_pcm_prepare (dev->handle);
-			snd_pcm_start (dev->handle);
-			break;
-		}
-		for (i = 0; frames; i += dev->num_channels, nSamples++, frames--) {
-			ii = qq = 0;
-			if (!is_little_endian) {	// convert to big-endian
-				*((unsigned char *)&ii    ) = buffer3[(i + dev->channel_I) * 3 + 2];
-				*((unsigned char *)&ii + 1) = buffer3[(i + dev->channel_I) * 3 + 1];
-				*((unsigned char *)&ii + 2) = buffer3[(i + dev->channel_I) * 3    ];
-				*((unsigned char *)&qq    ) = buffer3[(i + dev->channel_Q) * 3 + 2];
-				*((unsigned char *)&qq + 1) = buffer3[(i + dev->channel_Q) * 3 + 1];
-				*((unsigned char *)&qq + 2) = buffer3[(i + dev->channel_Q) * 3    ];
-			}
-			else {		// convert to little-endian
-				memcpy((unsigned char *)&ii + 1, buffer3 + (i + dev->channel_I) * 3, 3);
-				memcpy((unsigned char *)&qq + 1, buffer3 + (i + dev->channel_Q) * 3, 3);
-			}
-			if (ii >=  CLIP32 || ii <= -CLIP32)
-				dev->overrange++;	// assume overrange returns max int
-			if (qq >=  CLIP32 || qq <= -CLIP32)
-				dev->overrange++;
-			cSamples[nSamples] = ii + I * qq;
-		}
+		buffer = buffer3;
 		break;
 	case 4:
-		frames = snd_pcm_readi (dev->handle, buffer4, avail);	// read samples
-		if (frames == -EAGAIN) {	// no samples available
-			break;
-		}
-		else if (frames <= 0) {		// error
-			dev->dev_error++;
-#if DEBUG_IO
-			QuiskPrintTime("read_alsa: frames < 0", 0);
-#endif
-			snd_pcm_prepare (dev->handle);
-			snd_pcm_start (dev->handle);
-			break;
-		}
-		for (i = 0; frames; i += dev->num_channels, nSamples++, frames--) {
-			ii = buffer4[i + dev->channel_I];
-			qq = buffer4[i + dev->channel_Q];
-			if (ii >=  CLIP32 || ii <= -CLIP32)
-				dev->overrange++;	// assume overrange returns max int
-			if (qq >=  CLIP32 || qq <= -CLIP32)
-				dev->overrange++;
-			cSamples[nSamples] = ii + I * qq;
-		}
+		buffer = buffer4;
 		break;
+	default:
+		return 0;
 	}
-	for (i = 0; i < nSamples; i++) {	// DC removal; R.G. Lyons page 553
-		c = cSamples[i] + dev->dc_remove * 0.95;
-		cSamples[i] = c - dev->dc_remove;
-		dev->dc_remove = c;
+	frames = snd_pcm_readi (dev->handle, buffer, avail);	// read samples
+	if (frames == -EAGAIN)		// no samples available
+		return 0;
+	if (frames <= 0) {		// error
+		capture_restart(dev);
+		return 0;
 	}
-	return nSamples;
+	capture_convert(dev,
+		(char *)buffer + dev->channel_I * dev->sample_bytes,
+		(char *)buffer + dev->channel_Q * dev->sample_bytes,
+		dev->num_channels, frames, cSamples);
+	return frames;
 }
 
 void quisk_play_alsa(struct sound_dev * playdev, int nSamples,
@@ -585,7 +686,13 @@ static int quisk_open_alsa_capture(struct sound_dev * dev)
 			sample_rate);
 		goto errend;
 	}
-	if (snd_pcm_hw_params_set_access (handle, hware, SND_PCM_ACCESS_RW_INTERLEAVED) < 0) {
+	// Read directly from the sound card buffer if we can, otherwise copy samples with snd_pcm_readi()
+	dev->use_mmap = 0;
+	if (QuiskGetConfigInt("alsa_capture_mmap", 1) &&
+			snd_pcm_hw_params_set_access (handle, hware, SND_PCM_ACCESS_MMAP_INTERLEAVED) == 0) {
+		dev->use_mmap = 1;
+	}
+	else if (snd_pcm_hw_params_set_access (handle, hware, SND_PCM_ACCESS_RW_INTERLEAVED) < 0) {
 		strncpy(quisk_sound_state.err_msg, "Interleaved access is not available", QUISK_SC_SIZE);
 		goto errend;
 	}
@@ -615,6 +722,7 @@ static int quisk_open_alsa_capture(struct sound_dev * dev)
 	printf("sample rate %d\n", sample_rate);
 	printf("num_channels %d, %s\n", dev->num_channels, dev->msg1);
 	printf("Capture buffer size %d\n", (int)frames);
+	printf("Capture access %s\n", dev->use_mmap ? "mmap" : "read");
 	if (frames > SAMP_BUFFER_SIZE / dev->num_channels)
 		printf("Capture buffer exceeds size of sample buffers\n");
 #endif
@@ -865,6 +973,18 @@ void quisk_close_sound_alsa(struct sound_dev ** pCapture, struct sound_dev ** pP
 	}
 }
 
+void quisk_drop_capture_alsa(struct sound_dev ** pCapture)
+{	// Stop the capture devices so that a blocking read in the capture thread returns
+	struct sound_dev * pDev;
+
+	while (*pCapture) {
+		pDev = *pCapture;
+		if (pDev->handle && pDev->driver == DEV_DRIVER_ALSA)
+			snd_pcm_drop((snd_pcm_t *)pDev->handle);
+		pCapture++;
+	}
+}
+
 void quisk_mixer_set(char * card_name, int numid, PyObject * value, char * err_msg, int err_size)
 // Set card card_name mixer control numid to value for integer, boolean, enum controls.
 // If value is a float, interpret value as a decimal fraction of min/max.
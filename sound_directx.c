@@ -271,6 +271,9 @@ void quisk_close_sound_alsa(struct sound_dev ** pCapture, struct sound_dev ** pP
 	}
 }
 
+void quisk_drop_capture_alsa(struct sound_dev ** pCapture)
+{	// DirectX reads do not block
+}
 
 int  quisk_read_alsa(struct sound_dev * dev, complex double * cSamples)
 {
@@ -593,6 +596,10 @@ void quisk_start_sound_portaudio(struct sound_dev ** pCapture, struct sound_dev
 {
 }
 
+void quisk_drop_capture_portaudio(struct sound_dev ** pCapture)
+{
+}
+
 void quisk_close_sound_portaudio(void)
 {
 }
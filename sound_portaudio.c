@@ -407,6 +407,18 @@ void quisk_close_sound_portaudio(void)
 	Pa_Terminate();
 }
 
+void quisk_drop_capture_portaudio(struct sound_dev ** pCapture)
+{	// Stop the capture streams so that a blocking read in the capture thread returns
+	struct sound_dev * pDev;
+
+	while (*pCapture) {
+		pDev = *pCapture;
+		if (pDev->handle && pDev->driver == DEV_DRIVER_PORTAUDIO)
+			Pa_AbortStream((PaStream *)pDev->handle);
+		pCapture++;
+	}
+}
+
 // Changes for MacOS support (__MACH__) thanks to Mario, DL3LSM.
 #if defined(__MACH__)
 
@@ -472,6 +484,10 @@ void quisk_close_sound_alsa(struct sound_dev ** pCapture, struct sound_dev ** pP
 {
 }
 
+void quisk_drop_capture_alsa(struct sound_dev ** pCapture)
+{
+}
+
 int  quisk_read_alsa(struct sound_dev * dev, complex double * samp)
 {
 	return 0;
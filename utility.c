@@ -4,6 +4,7 @@
 #else
 #include <stdlib.h>
 #include <sys/time.h>
+#include <time.h>
 #endif
 #include <complex.h>
 #include "quisk.h"
@@ -90,6 +91,30 @@ double QuiskTimeSec(void)
 #endif
 }
 
+double QuiskTimeHiRes(void)
+{  // return a monotonic high resolution time in seconds as a double; use for time intervals
+#ifdef MS_WINDOWS
+	static double timer_period = 0;
+	LARGE_INTEGER L;
+
+	if ( ! timer_period) {
+		if (QueryPerformanceFrequency(&L))
+			timer_period = 1.0 / L.QuadPart;
+		else
+			return QuiskTimeSec();
+	}
+	QueryPerformanceCounter(&L);
+	return (double)L.QuadPart * timer_period;
+#elif defined(CLOCK_MONOTONIC)
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (double)ts.tv_sec + ts.tv_nsec * 1e-9;
+#else
+	return QuiskTimeSec();
+#endif
+}
+
 void QuiskPrintTime(const char * str, int index)
 {  // print the time and a message and the delta time for index 0 to 9
 	double tm;